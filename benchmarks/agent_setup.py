@@ -0,0 +1,52 @@
+""" Per-request setup cost of the resume analyzer: a ResumeAnalyzerAgent that builds its chains,
+tools and langchain agent executor (previous get_agent_analyzer) against one that is injected the
+AnalyzerChains built once by ModelRegistry. A fake chat model is used, no llm is called.
+
+    python benchmarks/agent_setup.py            # 200 agents per variant
+    python benchmarks/agent_setup.py 1000
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from services.analyzer_agent import ResumeAnalyzerAgent
+from services.analyzer_chains import AnalyzerChains
+
+
+def time_setup(build, runs):
+    """ Milliseconds of each of runs calls of build()"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        build()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def build_per_request(llm):
+    # Previous behaviour: chains, tools and the agent executor built for every request
+    agent = ResumeAnalyzerAgent(llm)
+    return agent.agentexecutor
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(0.95 * (len(timings) - 1))]
+    print(f"{name:<28} mean {statistics.mean(timings):8.3f} ms   p50 {statistics.median(timings):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    llm = FakeListChatModel(responses=["{}"])
+    # First construction imports and caches the pydantic schemas, not counted
+    build_per_request(llm)
+    start = time.perf_counter()
+    chains = AnalyzerChains(llm)
+    print(f"AnalyzerChains (once, at startup): {(time.perf_counter() - start) * 1000:.3f} ms")
+    before = time_setup(lambda: build_per_request(llm), runs)
+    after = time_setup(lambda: ResumeAnalyzerAgent(llm, chains=chains), runs)
+    report("per request, built", before)
+    report("per request, injected", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.0f}x")
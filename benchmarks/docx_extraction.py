@@ -0,0 +1,84 @@
+""" Compare the streaming DOCX extractor with the python-docx path it replaced.
+
+    python benchmarks/docx_extraction.py                 # 500 generated resumes
+    python benchmarks/docx_extraction.py path/to/docx/   # every .docx in a folder
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import docx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from services.docx_extractor import extract_docx_text
+
+
+def python_docx_text(source):
+    """ Previous FileParser.parse_file path"""
+    text = ""
+    doc = docx.Document(source)
+    for para in doc.paragraphs:
+        text += para.text + "\n"
+    return text
+
+def generate_resumes(count):
+    """ Synthetic resumes with paragraphs, bullet points and a skills table"""
+    documents = []
+    for i in range(count):
+        doc = docx.Document()
+        doc.add_paragraph(f"Candidate {i}")
+        doc.add_paragraph(f"candidate{i}@example.com | (555) 010-{i % 10000:04d}")
+        doc.add_paragraph("Professional Summary")
+        doc.add_paragraph("Backend engineer building data platforms with Python and AWS. " * 4)
+        doc.add_paragraph("Experience")
+        for job in range(6):
+            doc.add_paragraph(f"Senior Engineer, Company {job}\t2015 - 2020")
+            for bullet in range(5):
+                doc.add_paragraph(f"Delivered project {bullet} using FastAPI, MongoDB and Docker.")
+        doc.add_paragraph("Skills")
+        table = doc.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell, skill in zip(row.cells, ["Python", "Kubernetes", "Terraform"]):
+                cell.text = skill
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        documents.append(buffer.getvalue())
+    return documents
+
+def load_folder(folder):
+    documents = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(".docx"):
+            with open(os.path.join(folder, name), "rb") as file:
+                documents.append(file.read())
+    return documents
+
+def measure(label, func, documents):
+    tracemalloc.start()
+    start = time.perf_counter()
+    outputs = [func(io.BytesIO(content)) for content in documents]
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} {len(documents) / elapsed:10.1f} docs/s  {elapsed * 1000 / len(documents):8.2f} ms/doc"
+          f"  peak {peak / 1024 / 1024:7.1f} MiB")
+    return outputs
+
+def check_parity(baseline, streamed):
+    """ Every python-docx paragraph is in the streamed text, in order (tables are extra lines)"""
+    mismatches = 0
+    for expected, actual in zip(baseline, streamed):
+        lines = iter(actual.split("\n"))
+        if not all(any(line == paragraph for line in lines) for paragraph in expected.split("\n")):
+            mismatches += 1
+    return mismatches
+
+
+if __name__ == "__main__":
+    documents = load_folder(sys.argv[1]) if len(sys.argv) > 1 else generate_resumes(500)
+    print(f"{len(documents)} documents")
+    baseline = measure("python-docx", python_docx_text, documents)
+    streamed = measure("streaming", extract_docx_text, documents)
+    print(f"paragraph mismatches: {check_parity(baseline, streamed)}")
@@ -0,0 +1,73 @@
+""" Import-time budget check for the API: `import main` must stay fast and must not pull in
+model libraries, those are loaded by ModelRegistry at startup.
+
+    python benchmarks/import_budget.py                 # import main
+    python benchmarks/import_budget.py services.docparser
+    IMPORT_BUDGET_MS=1500 python benchmarks/import_budget.py
+
+Exits non-zero when the budget is exceeded or a deferred module is imported.
+"""
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 3000))
+# Loaded on demand only: model weights, ML runtimes and the providers that are not configured
+DEFERRED_MODULES = ["spacy", "sentence_transformers", "torch", "transformers", "onnxruntime",
+                    "sklearn", "boto3", "langchain_aws", "openai", "langchain_openai", "tensorflow",
+                    "faiss", "langchain", "langchain_core"]
+TOP = 15
+
+
+def run_importtime(module):
+    """ (module name, self us, cumulative us, depth) of every import of `python -X importtime -c "import module"` """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(completed.stderr.splitlines()[-1] if completed.stderr else "import failed")
+        sys.exit(2)
+    records = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+def direct_imports(records, module):
+    """ Imports made directly by module: -X importtime prints children before their parent"""
+    children = []
+    for index, record in enumerate(records):
+        if record[0] == module and record[3] == 0:
+            for child in reversed(records[:index]):
+                if child[3] == 0:
+                    break
+                if child[3] == 1:
+                    children.append(child)
+    return children
+
+
+if __name__ == "__main__":
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+    records = run_importtime(module)
+    # Interpreter startup (site, encodings) is not counted
+    total_ms = sum(cumulative for name, _, cumulative, depth in records if depth == 0 and name == module) / 1000
+    print(f"import {module}: {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    print(f"slowest imports of {module}:")
+    direct = sorted(direct_imports(records, module), key=lambda record: -record[2])
+    for name, _, cumulative, _ in direct[:TOP]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    imported = {name for name, _, _, _ in records}
+    deferred = [name for name in DEFERRED_MODULES if name in imported]
+    failed = False
+    if deferred:
+        print(f"FAIL: imported at module load: {', '.join(deferred)}")
+        failed = True
+    if total_ms > IMPORT_BUDGET_MS:
+        print(f"FAIL: {total_ms:.0f} ms over the {IMPORT_BUDGET_MS:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,116 @@
+""" Latency, tokens and output parity of the combined single-call pipeline (CombinedAnalyzerChain,
+LLM_PIPELINE_MODE=combined) against the three-call pipeline (resume parse, job description parse,
+analysis). Calls the configured llm (OPENAI_* or USE_BEDROCK / BEDROCK_*), bypassing the llm cache;
+nothing is saved to MongoDB.
+
+    python benchmarks/llm_pipeline.py                          # built-in resume and job description
+    python benchmarks/llm_pipeline.py resume.txt jd.txt 5      # text files, 5 runs per pipeline
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from models.model_loader import model_registry
+from services.analyzer_chains import AnalyzerChains
+
+SAMPLE_RESUME = """Jane Doe
+jane.doe@example.com | (555) 010-2030
+Summary: Backend engineer with 7 years of experience building Python services on AWS.
+Skills: Python, FastAPI, Django, AWS, Docker, Kubernetes, MongoDB, PostgreSQL, Communication, Mentoring
+Work History
+Senior Software Engineer, Acme Corp, Jan 2021 - Present, Remote
+- Led a team of 5 engineers migrating 20 services to Kubernetes on AWS.
+- Built FastAPI services handling 3k requests per second backed by MongoDB.
+Software Engineer, Initech, Jun 2017 - Dec 2020, Austin TX
+- Developed Django REST APIs and PostgreSQL data pipelines.
+Education: B.S. Computer Science, University of Texas, 2017
+Certifications: AWS Certified Solutions Architect - Associate, Amazon, 2022
+"""
+SAMPLE_JOB = """Job ID: BE-1042
+Senior Backend Engineer - Globex
+We are hiring a senior backend engineer to design and run our Python API platform.
+Responsibilities: design REST APIs, own services in production on AWS, mentor engineers.
+Requirements: 5+ years of Python experience, FastAPI or Django, AWS, Docker and Kubernetes,
+MongoDB or PostgreSQL, strong communication skills. Bachelor's degree in Computer Science.
+Nice to have: Terraform, Kafka, experience with machine learning services.
+"""
+
+
+def read_text(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def usage(message):
+    """ (input tokens, output tokens) of an llm response, (0, 0) when the provider does not report them"""
+    metadata = getattr(message, "usage_metadata", None) or {}
+    if metadata:
+        return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+
+def load_json(text):
+    try:
+        return json.loads(text.strip().removeprefix("```json").removesuffix("```"))
+    except Exception:
+        return {}
+
+def three_call(chains, resume, job):
+    """ (seconds, input tokens, output tokens, (resume, job, analysis) dicts), the two parses run one after the other"""
+    start = time.perf_counter()
+    messages = [chains.resume_parser.chain.invoke(resume),
+                chains.jobdesc_parser.chain.invoke(job),
+                chains.analyzer.chain.invoke({"resume_data": resume, "job_description": job})]
+    seconds = time.perf_counter() - start
+    tokens = [usage(message) for message in messages]
+    return (seconds, sum(t[0] for t in tokens), sum(t[1] for t in tokens),
+            tuple(load_json(message.content) for message in messages))
+
+def combined_call(chains, resume, job):
+    start = time.perf_counter()
+    message = chains.combined.chain.invoke({"resume_data": resume, "job_description": job})
+    seconds = time.perf_counter() - start
+    input_tokens, output_tokens = usage(message)
+    response = load_json(message.content)
+    return seconds, input_tokens, output_tokens, tuple(response.get(key) or {} for key in chains.combined.PARTS)
+
+def names(value):
+    if isinstance(value, dict):
+        value = [item for items in value.values() for item in (items if isinstance(items, list) else [items])]
+    return {str(item).strip().lower() for item in (value or [])}
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+def parity(three, combined):
+    """ Agreement of the combined outputs with the three-call outputs"""
+    resume, job, analysis = three
+    c_resume, c_job, c_analysis = combined
+    score, c_score = analysis.get("overall_score"), c_analysis.get("overall_score")
+    return {"resume email": resume.get("email") == c_resume.get("email"),
+            "resume skills jaccard": round(jaccard(names(resume.get("skills")), names(c_resume.get("skills"))), 3),
+            "job title": str(job.get("job_title")).lower() == str(c_job.get("job_title")).lower(),
+            "job skills jaccard": round(jaccard(names(job.get("required_skills")), names(c_job.get("required_skills"))), 3),
+            "score difference": abs(int(score) - int(c_score)) if score is not None and c_score is not None else None,
+            "gaps jaccard": round(jaccard(names(analysis.get("gaps")), names(c_analysis.get("gaps"))), 3)}
+
+def report(name, results):
+    seconds = [result[0] for result in results]
+    print(f"{name:<11} latency mean {statistics.mean(seconds):6.2f} s  p50 {statistics.median(seconds):6.2f} s   "
+          f"tokens in {statistics.mean(r[1] for r in results):7.0f}  out {statistics.mean(r[2] for r in results):6.0f}")
+
+
+if __name__ == "__main__":
+    resume = read_text(sys.argv[1]) if len(sys.argv) > 1 else SAMPLE_RESUME
+    job = read_text(sys.argv[2]) if len(sys.argv) > 2 else SAMPLE_JOB
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    chains = AnalyzerChains(model_registry._load_llm())
+    three = [three_call(chains, resume, job) for _ in range(runs)]
+    combined = [combined_call(chains, resume, job) for _ in range(runs)]
+    report("three-call", three)
+    report("combined", combined)
+    print("parity (run by run):")
+    for three_result, combined_result in zip(three, combined):
+        print("  ", parity(three_result[3], combined_result[3]))
@@ -0,0 +1,82 @@
+""" Compare the int8 ONNX Runtime embedder with the PyTorch sentence-transformer it can replace:
+accuracy parity (cosine between the two vectors of each text, ranking agreement) and throughput.
+
+    python benchmarks/onnx_embeddings.py                  # 512 generated resume/job texts
+    python benchmarks/onnx_embeddings.py path/to/txt/     # every .txt in a folder
+    ONNX_INTRA_OP_THREADS=4 python benchmarks/onnx_embeddings.py
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from models.sentencetransformer_model import get_st_embeddings
+from models.onnx_embedding_model import export_onnx_model, get_onnx_embedder
+
+# int8 vectors of the same text must stay this close to the PyTorch ones
+MIN_COSINE = 0.98
+BATCH_SIZES = [1, 8, 32]
+
+SKILLS = ["Python", "FastAPI", "AWS", "Docker", "Kubernetes", "MongoDB", "React", "Terraform",
+          "machine learning", "spaCy", "Kafka", "PostgreSQL", "leadership", "communication"]
+SENTENCES = ["Built REST APIs serving {n} requests per second with {a} and {b}.",
+             "Led a team of {n} engineers migrating services to {a}.",
+             "Hiring a senior engineer with {a}, {b} and strong {c} skills.",
+             "Designed data pipelines on {a} processing {n} million records daily.",
+             "Responsibilities include mentoring, code review and {a} deployments."]
+
+def generate_texts(count, seed=7):
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        lines = [rng.choice(SENTENCES).format(n=rng.randint(2, 500), a=rng.choice(SKILLS),
+                                              b=rng.choice(SKILLS), c=rng.choice(SKILLS))
+                 for _ in range(rng.randint(1, 20))]
+        texts.append(" ".join(lines))
+    return texts
+
+def load_folder(folder):
+    texts = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(".txt"):
+            with open(os.path.join(folder, name), encoding="utf-8") as file:
+                texts.append(file.read())
+    return texts
+
+def measure(label, func, texts, batch_size):
+    start = time.perf_counter()
+    outputs = [func(texts[index:index + batch_size]) for index in range(0, len(texts), batch_size)]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<8} batch {batch_size:>3}  {len(texts) / elapsed:9.1f} texts/s  {elapsed * 1000 / len(texts):7.2f} ms/text")
+    return np.concatenate(outputs)
+
+def check_parity(reference, candidate):
+    """ Per-text cosine of the two embeddings, and how often the nearest neighbour
+    (by cosine over the whole corpus) of each text is the same"""
+    cosines = np.sum(reference * candidate, axis=1)
+    reference_scores = reference @ reference.T
+    candidate_scores = candidate @ candidate.T
+    np.fill_diagonal(reference_scores, -1)
+    np.fill_diagonal(candidate_scores, -1)
+    same_neighbour = np.mean(reference_scores.argmax(axis=1) == candidate_scores.argmax(axis=1))
+    return cosines, same_neighbour
+
+
+if __name__ == "__main__":
+    texts = load_folder(sys.argv[1]) if len(sys.argv) > 1 else generate_texts(512)
+    print(f"{len(texts)} texts")
+    # No-op when the model is already exported
+    export_onnx_model()
+    embedder = get_onnx_embedder()
+    for batch_size in BATCH_SIZES:
+        reference = measure("pytorch", get_st_embeddings, texts, batch_size)
+        candidate = measure("onnx", embedder.encode, texts, batch_size)
+    cosines, same_neighbour = check_parity(reference, candidate)
+    print(f"cosine pytorch vs onnx: min {cosines.min():.4f}  mean {cosines.mean():.4f}")
+    print(f"same nearest neighbour: {same_neighbour:.1%}")
+    if cosines.min() < MIN_COSINE:
+        print(f"FAIL: parity below {MIN_COSINE}")
+        sys.exit(1)
@@ -0,0 +1,111 @@
+""" Golden-corpus parity and throughput of extract_sections_from_resume_text against the
+per-line re.search implementation it replaced.
+
+    python benchmarks/section_segmenter.py              # 10,000 generated resumes
+    python benchmarks/section_segmenter.py path/to/txt/ # plus every .txt resume in a folder
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from services.extractor import extract_sections_from_resume_text
+
+
+def reference_extract_sections(text):
+    """ Previous implementation, kept verbatim as the golden reference"""
+    sections={}
+    contact_patterns ={ "name": r"^[A-Z][a-zA-Z\s]+$",
+        "email": r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+",
+        "phone": r"\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}",}
+    patterns = {
+        "summary": r"^((professional\s*)?Summary|Profile|Objective)[\b\s\:]*?",
+        "education": r"^(Education|Degree|University|College)[\s\:]*?",
+        "experience": r"^(\bWork\s*(experience|history)\b|Experience\b|Employment History\b)[\s\:]*?$",
+        "skills": r"^(Skills|Technical Skills|Core Competencies)[\s\:]*?$",
+    }
+    lines = text.split("\n")
+    curr_section= None
+    for line in lines:
+        if line.strip() == "":
+            continue
+        for section_name , pattern in patterns.items():
+            if re.search(pattern, line, re.IGNORECASE):
+                curr_section= section_name
+                if section_name not in sections:
+                    sections[curr_section] = []
+        if curr_section is None:
+            match_name = re.search(contact_patterns["name"], line)
+            match_email = re.search(contact_patterns["email"], line)
+            match_phone = re.search(contact_patterns["phone"], line)
+            if  "name" not in sections and match_name:
+                sections["name"] = match_name.group(0)
+            if "email" not in sections and match_email:
+                sections["email"] = match_email.group(0)
+            if "phone" not in sections and match_phone:
+                sections["phone"] = match_phone.group(0)
+            continue
+        else:
+            sections[curr_section].append(line.strip())
+    for section in sections:
+        if section in ["name", "email", "phone"]:
+            continue
+        sections[section] = "\n".join(sections[section])
+    return sections
+
+
+HEADERS = {
+    "summary": ["Summary", "PROFESSIONAL SUMMARY", "Profile", "Objective:", "professional  summary"],
+    "education": ["Education", "EDUCATION:", "University of Somewhere", "College Degree", "Degree"],
+    "experience": ["Experience", "WORK EXPERIENCE", "Work History:", "Employment History", "Experience with teams"],
+    "skills": ["Skills", "Technical Skills:", "CORE COMPETENCIES", "Skills and tools"],
+}
+BODY_LINES = ["Built APIs with Python, FastAPI and MongoDB", "Led a team of 5 engineers",
+              "Python, AWS, Docker, Kubernetes", "B.S. Computer Science 2012", "Objective driven engineer",
+              "Contact: 555.123.4567", "2018 - 2022  Acme Corp", "   ", "\tIndented line", "Summary of results:"]
+
+def generate_resume(rng):
+    lines = []
+    if rng.random() < 0.9:
+        lines.append(rng.choice(["Jane Doe", "JOHN SMITH", "jane doe", "Dr. A. Lee", "Maria Garcia Lopez"]))
+    contact = [f"user{rng.randint(1, 999)}@example.com", f"({rng.randint(200, 999)}) 555-{rng.randint(1000, 9999)}",
+               "linkedin.com/in/someone", "San Jose, CA"]
+    rng.shuffle(contact)
+    lines.extend(contact[:rng.randint(0, 4)])
+    sections = list(HEADERS)
+    rng.shuffle(sections)
+    for section in sections[:rng.randint(0, 4)]:
+        lines.append(rng.choice(HEADERS[section]))
+        lines.extend(rng.choice(BODY_LINES) for _ in range(rng.randint(0, 12)))
+    separator = "\r\n" if rng.random() < 0.1 else "\n"
+    return separator.join(lines)
+
+def load_folder(folder):
+    texts = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(".txt"):
+            with open(os.path.join(folder, name), encoding="utf-8") as file:
+                texts.append(file.read())
+    return texts
+
+def measure(label, func, corpus):
+    start = time.perf_counter()
+    outputs = [func(text) for text in corpus]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:7.3f} s  {len(corpus) / elapsed:10.0f} resumes/s")
+    return outputs
+
+
+if __name__ == "__main__":
+    rng = random.Random(42)
+    corpus = [generate_resume(rng) for _ in range(10000)]
+    if len(sys.argv) > 1:
+        corpus.extend(load_folder(sys.argv[1]))
+    print(f"{len(corpus)} resumes")
+    expected = measure("reference", reference_extract_sections, corpus)
+    actual = measure("compiled", extract_sections_from_resume_text, corpus)
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if list(a.items()) != list(b.items())]
+    print(f"mismatches: {len(mismatches)}")
+    sys.exit(1 if mismatches else 0)
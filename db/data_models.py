@@ -41,6 +41,12 @@ class AnalysisResponseModel(BaseModel):
     gaps: List[str]= Field(description="List of missing skills or qualifications")
     weaknesses : List[str]= Field(description="weakness of the candidate resume against job description")
     strengths: List[str] = Field(description="List of candidate strengths for this role")
+
+class CombinedResponseModel(BaseModel):
+    """ Single llm call pipeline (LLM_PIPELINE_MODE=combined): parsed resume, parsed job description and their analysis"""
+    resume: ResumeResponseModel = Field(description="Parsed resume")
+    job_description: JobResponseModel = Field(description="Parsed job description")
+    analysis: AnalysisResponseModel = Field(description="Analysis of the resume against the job description")
     
      
 # class AnalysisUserResultModel(BaseModel):
@@ -1,4 +1,3 @@
-from langchain.callbacks.base import BaseCallbackHandler
 from typing import Dict, List, Any
 import os
 from db.db_connector import get_database
@@ -24,20 +23,8 @@ class MongoDBOperationHandler:
                         print(f"Collection '{col_name}' already exists.")
                         pass
 
-                if collection.name == "resume":
-                    index_name ="resume_index"
-                    pk_constraints = [("email", 1)]
-                    self.create_new_indexes(collection, index_name, pk_constraints)
-                    
-                elif collection.name == "job":
-                    index_name ="job_index"
-                    pk_constraints = [("external_job_id", 1)]
-                    self.create_new_indexes(collection, index_name, pk_constraints) 
-
-                elif collection.name == "jobmatch_result": 
-                    index_name ="resume_job_index"
-                    pk_constraints =[("resume_id", 1), ("job_id", 1)]
-                    self.create_new_indexes(collection, index_name, pk_constraints)  
+            # Unique identifiers: email, external_job_id and (resume_id, job_id)
+            self.create_identifier_indexes()
             if self.verbose:
                 #####print(f"MongoDB Initialization completed")
                 pass
@@ -45,12 +32,13 @@ class MongoDBOperationHandler:
             print(f"Error in MongoDB initialization: {e}")
             pass
 
-    def create_new_indexes(self, collection, index_name, pk_constraints):
+    def create_new_indexes(self, collection, index_name, pk_constraints, partial_filter=None):
         try: 
             # Check if index exists
             existing_indexes = collection.index_information()
             if index_name not in existing_indexes:                    
-                collection.create_index(pk_constraints, unique=True, name=index_name)
+                options = {"partialFilterExpression": partial_filter} if partial_filter else {}
+                collection.create_index(pk_constraints, unique=True, name=index_name, **options)
                 if self.verbose:
                     print(f"Unique index created {index_name} for collection  : {collection.name}!")
                     pass
@@ -63,6 +51,39 @@ class MongoDBOperationHandler:
             print(f"Error creating index {index_name} for collection {collection.name}: {e}")
             pass
          
+    def create_identifier_indexes(self):
+        """ Unique indexes of the resume email, the job external_job_id and the (resume_id, job_id) pair of
+        jobmatch_result, partial: documents without the identifier are saved by content hash and must not
+        collide on a null or empty key. The previous non-partial indexes (resume_index, job_index,
+        resume_job_index) rejected the second such document and are dropped"""
+        for collection_name, legacy_name, index_name, fields, partial_filter in (
+                ("resume", "resume_index", "resume_email_index", ["email"],
+                 {"email": {"$type": "string", "$gt": ""}}),
+                ("job", "job_index", "job_external_id_index", ["external_job_id"],
+                 {"external_job_id": {"$type": "string", "$gt": ""}}),
+                ("jobmatch_result", "resume_job_index", "match_ids_index", ["resume_id", "job_id"],
+                 {"resume_id": {"$exists": True}, "job_id": {"$exists": True}})):
+            collection = self.db_name.get_collection(collection_name)
+            try:
+                legacy = collection.index_information().get(legacy_name)
+                if legacy is not None and "partialFilterExpression" not in legacy:
+                    collection.drop_index(legacy_name)
+                    print(f"Dropped index {legacy_name} of collection {collection_name}: replaced by {index_name}")
+            except Exception as e:
+                print(f"Error dropping index {legacy_name} for collection {collection_name}: {e}")
+            self.create_new_indexes(collection, index_name, [(field, 1) for field in fields],
+                                    partial_filter=partial_filter)
+
+    def create_content_hash_indexes(self):
+        """ Unique indexes of the normalized text hashes: resume and job content_hash, and the
+        (resume_hash, job_hash) pair of jobmatch_result. Documents saved before the hashes are left out"""
+        for collection_name, index_name, fields in (("resume", "resume_content_hash_index", ["content_hash"]),
+                                                    ("job", "job_content_hash_index", ["content_hash"]),
+                                                    ("jobmatch_result", "match_content_hash_index", ["resume_hash", "job_hash"])):
+            self.create_new_indexes(self.db_name.get_collection(collection_name), index_name,
+                                    [(field, 1) for field in fields],
+                                    partial_filter={field: {"$type": "string"} for field in fields})
+         
     def save_data_to_db(self, table_collections: List):
         """
         Save parsed and extracted database collection data to MongoDB.
@@ -1,7 +1,9 @@
+import asyncio
+import hmac
 import json
 import sys
 import os
-from typing import Dict
+from typing import Dict, Optional
 from pydantic import BaseModel
 import uvicorn  
 from bson import json_util 
@@ -15,15 +17,23 @@ from services.jobfinder_agent import JobFinderAgent
 
 # Add the project root directory to Python's module search path
 sys.path.append(os.path.abspath(os.path.dirname(__file__))) 
-from fastapi import Depends, FastAPI, File, UploadFile 
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, UploadFile 
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware 
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 # Custom imports from my projects
 from models.model_loader import model_registry
+from models.tfidf_model import tfidf_store
 from services.docparser import MatchKeywordsService
-from services.file_parser import FileParser, create_temp_file
+from services.file_parser import FileParser, read_upload
+from services.parser_executor import parser_executor
+from services.text_cache import document_text_cache
+from services.embedding_cache import embedding_cache
+from services.llm_cache import llm_cache
+from services.embedding_matrix import load_embedding_matrices
+from services.hybrid_search import ensure_search_indexes
 from services.analyzer_agent import ResumeAnalyzerAgent
 
 # Load environment variables
@@ -31,6 +41,8 @@ load_dotenv()
 
 USE_BEDROCK = os.environ.get("USE_BEDROCK", "False").lower() == "true"
 LLM_MODEL_TYPE = 'bedrock' if USE_BEDROCK else 'openai'
+# Token of the /admin/ endpoints (X-Admin-Token header), the endpoints are disabled when it is not set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
 
 origins = [
     "http://localhost:3000",  # Example frontend URL
@@ -43,13 +55,24 @@ origins = [
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Load the ML model
-    """Load all NLP models at application startup"""
-    model_registry.load_all_models()
+    """Load all NLP models at application startup, in the background: /ready reports their status"""
+    model_registry.start_background_loading()
+    # Start the text extraction worker processes
+    parser_executor.start()
+    document_text_cache.configure_store()
+    embedding_cache.configure_store()
+    llm_cache.configure_store()
+    # Corpus embedding matrices: memory-mapped, shared by the worker processes
+    load_embedding_matrices()
+    # Indexes of the search filter fields
+    ensure_search_indexes()
     #agent = ResumeAnalyzerAgent(model_registry.get_model("llm"))
     yield
     # Clean up the ML models and release the resources
     # For example, a database connection pool, or loading a shared machine learning model.
     model_registry.cleanup()
+    parser_executor.shutdown()
+    embedding_cache.flush()
 
 app = FastAPI(title="Resume Analyzer API",lifespan=lifespan) 
 app.add_middleware(
@@ -61,7 +84,7 @@ app.add_middleware(
 )
 
 async def get_file_parser():
-    return FileParser()
+    return FileParser(executor=parser_executor, cache=document_text_cache)
 
 async def get_kw_extraction_service():
     return MatchKeywordsService( nlp_tool= model_registry.get_model("nlp_tool"),
@@ -69,25 +92,43 @@ async def get_kw_extraction_service():
                                   embedding_model=model_registry.get_model("st_embeddings"))
 
 async def get_agent_analyzer():
-    return ResumeAnalyzerAgent(llm=model_registry.get_model("llm"))
+    # The chains are built once at startup, the agent only holds the state of this request
+    return ResumeAnalyzerAgent(llm=model_registry.get_model("llm"),
+                               chains=model_registry.get_model("analyzer_chains"))
 
 async def get_candidate_finder_agent():
     db = get_database()
     if db is None:
         raise ValueError("Database connection not initialized")
-    return CandidateFinderAgent(llm=model_registry.get_model("llm"), db=db)
+    return CandidateFinderAgent(llm=model_registry.get_model("llm"), db=db,
+                                embedding_model=model_registry.get_model("st_embeddings"),
+                                skill_matcher=model_registry.get_model("nlp_tool").get("skill_matcher"))
 
 async def get_job_finder_agent():
     db = get_database()
     if db is None:
         raise ValueError("Database connection not initialized")
-    return JobFinderAgent(llm=model_registry.get_model("llm"), db=db)
+    return JobFinderAgent(llm=model_registry.get_model("llm"), db=db,
+                          embedding_model=model_registry.get_model("st_embeddings"),
+                          skill_matcher=model_registry.get_model("nlp_tool").get("skill_matcher"))
+
+def parse_filters(filters):
+    """ Search filters of the form field (JSON object), None when not given"""
+    if not filters:
+        return None
+    return DataModel(filters=json.loads(filters)).filters
 
 # Following endpoints 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Resume Analyzer and Scoring API"} 
 
+@app.get("/ready")
+def ready():
+    """Readiness: per-model load status and timings, 503 until every model is loaded and warmed up"""
+    status = model_registry.get_status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
 @app.get("/provider-info/")
 async def get_provider_info():
     """Get information about the current LLM provider"""
@@ -109,13 +150,15 @@ async def analyzer(resume_file:UploadFile = File(...),
                         kwextractor: MatchKeywordsService = Depends(get_kw_extraction_service),
                         agent:ResumeAnalyzerAgent= Depends(get_agent_analyzer)):
     """Extract skills from resume and match with job description"""
+    resume_upload = None
+    jobdesc_upload = None
     try:
-        # Save uploaded file temporarily
-        resume_file_path = await create_temp_file(resume_file)
-
-        # Save uploaded file temporarily
-        jobdesc_file_path = await create_temp_file(jobdesc_file) 
+        # Read uploaded files in memory (spilled to disk only when very large)
+        resume_upload = await read_upload(resume_file)
+        jobdesc_upload = await read_upload(jobdesc_file) 
     except Exception as e:
+        if resume_upload is not None:
+            resume_upload.cleanup()
         return {"error.main.getting file path: ": str(e)}
     result = {"Status" : "Started",
                   "feedback":"None",
@@ -132,8 +175,8 @@ async def analyzer(resume_file:UploadFile = File(...),
                             "matched_results_id":1},}
     try:
         # The Resume and Job Description is now extracted
-        resume_text = fileparser.get_raw_text(resume_file_path)         
-        job_description = fileparser.get_raw_text(jobdesc_file_path)
+        resume_text, job_description = await asyncio.gather(fileparser.aget_raw_text(resume_upload),
+                                                            fileparser.aget_raw_text(jobdesc_upload))
 
         # get the keywords from resume and job description and geta similarity score
         scores = {}
@@ -153,7 +196,7 @@ async def analyzer(resume_file:UploadFile = File(...),
                   "dbsaved_ids" : {"resume_id": 1,
                             "jobdesc_id": 1,
                             "matched_results_id":1},}
-        kwscores = kwextractor.match_skills(resume_text, job_description) 
+        kwscores = await kwextractor.amatch_skills(resume_text, job_description) 
         candidate_email = ""
         try:
             sections = kwextractor.get_resume_sections()            
@@ -167,6 +210,9 @@ async def analyzer(resume_file:UploadFile = File(...),
 
         scores['similarity_score'] = kwscores.get('similarity_score', 0.0)
         scores['exact_match'] = kwscores.get('exact_match', 0.0)
+        scores['tfidf_score'] = kwscores.get('tfidf_score', 0.0)
+        scores['skill_overlap'] = kwscores.get('skill_overlap', 0)
+        scores['skill_jaccard'] = kwscores.get('skill_jaccard', 0.0)
         scores['overall_score'] = 0.0
 
         # # Perform Anaysis using an LLM Agent
@@ -219,11 +265,37 @@ async def analyzer(resume_file:UploadFile = File(...),
          
     
     finally: 
-        # Clean up temp file
-        if os.path.exists(resume_file_path):
-            os.remove(resume_file_path)
-        if os.path.exists(jobdesc_file_path):
-            os.remove(jobdesc_file_path)
+        # Clean up spilled temp files
+        resume_upload.cleanup()
+        jobdesc_upload.cleanup()
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: set ADMIN_TOKEN, "
+                                                    "or run python -m models.tfidf_model --refit")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.post("/admin/refit-tfidf/", dependencies=[Depends(require_admin_token)])
+async def refit_tfidf():
+    """Refit the TF-IDF model over the stored resumes and jobs and swap it in without a restart"""
+    try:
+        count = await asyncio.to_thread(tfidf_store.refit)
+        return {"Status": "Completed", "documents": count, "model_path": tfidf_store.path}
+    except Exception as e:
+        return {"Status": "Failed", "error": str(e)}
+
+@app.get("/metrics/embeddings/")
+async def embedding_metrics():
+    """Embedding micro-batcher metrics (batch size, wait time, queue depth) and embedding cache hits"""
+    embedding_model = model_registry.get_model("st_embeddings")
+    return {"batcher": embedding_model.get_batcher_metrics(),
+            "cache": embedding_cache.get_stats()}
+
+@app.get("/metrics/llm-cache/")
+async def llm_cache_metrics():
+    """LLM response cache hits (memory / persistent tier), misses and the llm time saved"""
+    return llm_cache.get_stats()
 
 @app.post("/get-resumes/")
 async def get_resumes(payload:DataModel = {}):
@@ -291,29 +363,37 @@ async def get_past_matches(payload:DataModel = {},):
 
 @app.post("/search-candidates-job/")
 async def get_candidates_by_job(jobdesc_file:UploadFile = File(...),
+                            filters: Optional[str] = Form(None),
                             fileparser: FileParser=Depends(get_file_parser),
                             candfind_agent: CandidateFinderAgent = Depends(get_candidate_finder_agent)):
     """Get best candidates by providing job description
-    This is RAG functionality""" 
+    This is RAG functionality
+    filters: optional JSON object, e.g. {"min_years": 5, "skills": ["python"], "certifications": ["aws"]}""" 
     result = {"Status" : "Started",
               "candidates": [],
               "errors": [],
               "job_description": "",
         }
+    jobdesc_upload = None
     try:
         try:
-            # Save uploaded file temporarily
-            jobdesc_file_path = await create_temp_file(jobdesc_file) 
+            # Read uploaded file in memory
+            jobdesc_upload = await read_upload(jobdesc_file) 
         except Exception as e:
             print(f"error.get_candidates_by_job.getting file path: {str(e)}")
             return result
               
-        job_description = fileparser.get_raw_text(jobdesc_file_path)
+        job_description = await fileparser.aget_raw_text(jobdesc_upload)
         result["job_description"]= job_description
+        try:
+            search_filters = parse_filters(filters)
+        except Exception as e:
+            result["errors"].append(f"invalid filters: {e}")
+            return result
 
         # call the agent to get the best candidates
-        candidates = await candfind_agent.find_candidates(job_description)
-        result["candidates"] = candidates
+        candidates = await candfind_agent.find_candidates(job_description, filters=search_filters)
+        result["candidates"] = candidates.get("candidates", [])
         result["Status"] = "Completed"
         result["errors"] = candidates.get("errors", [])
         
@@ -323,36 +403,44 @@ async def get_candidates_by_job(jobdesc_file:UploadFile = File(...),
         print(f"error.get_candidates_by_job : {str(e)}") 
         return result
     finally:
-        # Clean up temp file
-        if os.path.exists(jobdesc_file_path):
-            os.remove(jobdesc_file_path)
+        # Clean up spilled temp file
+        if jobdesc_upload is not None:
+            jobdesc_upload.cleanup()
      
 
 @app.post("/search-jobs-resume/")
 async def get_jobs_by_resume(resume_file:UploadFile = File(...),
+                            filters: Optional[str] = Form(None),
                             fileparser: FileParser=Depends(get_file_parser),
                             jobfind_agent: JobFinderAgent = Depends(get_job_finder_agent)):
     """Get best jobs by providing resume
-    This is RAG functionality""" 
+    This is RAG functionality
+    filters: optional JSON object, e.g. {"years": 4, "skills": ["python"], "company_name": "Acme"}""" 
     result = {"Status" : "Started",
               "jobs": [],
               "errors": [],
               "resume_text": "",
         }
+    resume_upload = None
     try:
         try:
-            # Save uploaded file temporarily
-            resume_file_path = await create_temp_file(resume_file)
+            # Read uploaded file in memory
+            resume_upload = await read_upload(resume_file)
         except Exception as e:
             print(f"error.get_jobs_by_resume.getting file path: {str(e)}")
             return result
               
-        resume_text = fileparser.get_raw_text(resume_file_path)
+        resume_text = await fileparser.aget_raw_text(resume_upload)
         result["resume_text"]= resume_text
+        try:
+            search_filters = parse_filters(filters)
+        except Exception as e:
+            result["errors"].append(f"invalid filters: {e}")
+            return result
 
         # call the agent to get the best candidates
-        jobs = await jobfind_agent.find_jobs(resume_text)
-        result["jobs"] = jobs
+        jobs = await jobfind_agent.find_jobs(resume_text, filters=search_filters)
+        result["jobs"] = jobs.get("jobs", [])
         result["Status"] = "Completed"
         result["errors"] = jobs.get("errors", [])
         
@@ -362,9 +450,9 @@ async def get_jobs_by_resume(resume_file:UploadFile = File(...),
         print(f"error.get_jobs_by_resume : {str(e)}") 
         return result
     finally:
-        # Clean up temp file
-        if os.path.exists(resume_file_path):
-            os.remove(resume_file_path)
+        # Clean up spilled temp file
+        if resume_upload is not None:
+            resume_upload.cleanup()
 
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# A batch is closed after EMBED_BATCH_WAIT_MS from its first request or once it holds EMBED_BATCH_MAX_TEXTS texts
+EMBED_BATCH_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", 5))
+EMBED_BATCH_MAX_TEXTS = int(os.environ.get("EMBED_BATCH_MAX_TEXTS", 64))
+
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ("texts", "future", "loop", "enqueued_at")
+
+    def __init__(self, texts, future, loop):
+        self.texts = texts
+        self.future = future
+        self.loop = loop
+        self.enqueued_at = time.perf_counter()
+
+
+def _resolve(future, result=None, error=None):
+    # Runs on the caller's event loop; the caller may have been cancelled meanwhile
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class EmbeddingBatcher:
+    """ Micro-batcher for concurrent embedding requests: coroutines submit their texts, a dedicated
+    worker thread collects requests for up to max_wait_ms or max_texts texts, runs embed_func once
+    on the whole batch and resolves each caller's future with its own rows.
+    embed_func: list of texts -> (len(texts) x dim) array
+    """
+    def __init__(self, embed_func, max_wait_ms=EMBED_BATCH_WAIT_MS, max_texts=EMBED_BATCH_MAX_TEXTS):
+        self.embed_func = embed_func
+        self.max_wait = max_wait_ms / 1000
+        self.max_texts = max_texts
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._texts = 0
+        self._requests = 0
+        self._max_batch_size = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_encode = 0.0
+        self._errors = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def shutdown(self, timeout=5):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self._thread = None
+
+    async def submit(self, texts:list):
+        """ Embeddings of texts, computed in a batch shared with other concurrent callers"""
+        texts = list(texts)
+        if not texts:
+            return self.embed_func(texts)
+        if self._thread is None or not self._thread.is_alive():
+            # Also restarts the worker thread in a forked process
+            self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(_Request(texts, future, loop))
+        return await future
+
+    def _collect(self, first):
+        """ first request plus whatever arrives before the deadline or the size limit"""
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_texts:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is _STOP:
+                # Finish this batch then stop
+                self._queue.put(_STOP)
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch, size
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, size = self._collect(first)
+            started = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                embeddings = np.asarray(self.embed_func(texts))
+                error = None
+            except Exception as e:
+                logging.error(f"EmbeddingBatcher: batch of {size} texts failed: {e}")
+                embeddings, error = None, e
+            finished = time.perf_counter()
+            offset = 0
+            for request in batch:
+                count = len(request.texts)
+                if error is None:
+                    rows = embeddings[offset:offset + count]
+                    request.loop.call_soon_threadsafe(_resolve, request.future, rows)
+                else:
+                    request.loop.call_soon_threadsafe(_resolve, request.future, None, error)
+                offset += count
+            self._record(batch, size, started, finished, error)
+
+    def _record(self, batch, size, started, finished, error):
+        with self._metrics_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._texts += size
+            self._max_batch_size = max(self._max_batch_size, size)
+            for request in batch:
+                wait = started - request.enqueued_at
+                self._total_wait += wait
+                self._max_wait_seen = max(self._max_wait_seen, wait)
+            self._total_encode += finished - started
+            if error is not None:
+                self._errors += 1
+
+    def get_metrics(self):
+        """ Batch size, wait time before encode and queue depth"""
+        with self._metrics_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {"batches": self._batches,
+                    "requests": self._requests,
+                    "texts": self._texts,
+                    "mean_batch_size": round(self._texts / batches, 2),
+                    "max_batch_size": self._max_batch_size,
+                    "mean_wait_ms": round(self._total_wait * 1000 / requests, 3),
+                    "max_wait_ms": round(self._max_wait_seen * 1000, 3),
+                    "mean_encode_ms": round(self._total_encode * 1000 / batches, 3),
+                    "errors": self._errors,
+                    "queue_depth": self._queue.qsize(),
+                    "max_wait_setting_ms": self.max_wait * 1000,
+                    "max_texts_setting": self.max_texts}
@@ -1,20 +1,13 @@
-from abc import ABC,abstractmethod
-import os, time
+import logging, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
 
 
 from fastapi import HTTPException
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate 
-from langchain_core.output_parsers import StrOutputParser 
-from langchain_openai import OpenAIEmbeddings
-# from langchain.vectorstores import FAISS
 # Custom imports from my project
-from models.bedrock_model import run_bedrock, get_bedrock_embedding
-from models.openai_model import run_openai, get_openai_embedding
-from models.openai_model import OpenAIProvider
-from models.bedrock_model import BedrockProvider
+# LLM providers, spaCy and the embedding backends are imported in load_all_models, only when configured
 from models.similarity_model import EmbeddingModel
-from models.spacy_model import nlp 
+from models.tfidf_model import tfidf_store
+from services.embedding_cache import embedding_cache
  
 USE_BEDROCK = os.environ.get("USE_BEDROCK", "False").lower() == "true"
  
@@ -25,8 +18,14 @@ langchain_chat_kwargs = {
     "verbose": True,
 }
 
+# Loader threads: models load concurrently (weights deserialization and network setup release the GIL)
+MODEL_LOADER_THREADS = int(os.environ.get("MODEL_LOADER_THREADS", 4))
+WARMUP_TEXT = "Senior Python developer with FastAPI, AWS and MongoDB experience"
+
 class ModelRegistry:
-    """Singleton class to store all processing models"""
+    """Singleton class to store all processing models
+    Models load concurrently in a thread pool, each one runs a warm-up inference before it is
+    marked ready. status holds the per-model state (pending, loading, warming_up, ready, failed) and timings"""
     _instance = None
     def __new__(cls):
         if cls._instance is None:
@@ -38,85 +37,218 @@ class ModelRegistry:
     def __init__(self):
         self.loaded = False 
         self.loading = False
+        # A load ran to completion, every model ready or failed: never loaded again by this process
+        # (forked server workers inherit it and keep the parent's models and failures)
+        self.finished = False
+        self.nlp_models = {}
+        self.status = {}
+        self.load_seconds = None
+        self._loader_thread = None
+        self._warm_ups = {}
+        self._done = {}   # model name -> threading.Event set when it is ready or failed
 
-    def load_all_models(self):
-        """Load all models during app startup"""
-        if self.loaded:
-            return
-        start_time = time.time() 
-        self.loading = True
-        #####print("Loading NLP models...")
-        # Global model objects
-        self.nlp_models = {} 
+    def _model_loaders(self):
+        """ model name -> (load function, warm-up function or None)"""
+        # analyzer_chains is listed after the llm it is built from: the pool starts loads in this order
+        loaders = {"llm": (self._load_llm, None),
+                   "analyzer_chains": (self._load_analyzer_chains, None),
+                   "st_embeddings": (self._load_st_embeddings, lambda model: model.warm_up(WARMUP_TEXT)),
+                   "tfidf_model": (self._load_tfidf, self._warm_up_tfidf),
+                   "nlp_tool": (self._load_nlp_tool, self._warm_up_nlp_tool)}
+        # Initialize embeddings model - OpenAIEmbeddings (needs the OpenAI provider configured)
+        if not USE_BEDROCK:
+            loaders["embeddings"] = (self._load_openai_embeddings, None)
+        return loaders
+
+    def _load_llm(self):
         # Using LangChain Openai/bedrock
         if USE_BEDROCK:
+            from models.bedrock_model import BedrockProvider
             llm_provider = BedrockProvider(
                 model_id=os.environ.get("BEDROCK_MODEL_ID", "anthropic.claude-3-5-sonnet-20240620-v1:0"),
                 region_name=os.environ.get("AWS_REGION", "us-east-1"),
                 temperature= os.environ.get("TEMP",0)
             )
         else:
+            from models.openai_model import OpenAIProvider
             llm_provider = OpenAIProvider(
                 model_name=os.environ.get("OPENAI_MODEL", "gpt-4"),
                 api_key=os.environ.get("OPENAI_API_KEY"),
                 **langchain_chat_kwargs
             )
         # Initialize LLM 
-        self.nlp_models["llm"] = llm_provider.get_llm()
+        return llm_provider.get_llm()
+
+    def _load_analyzer_chains(self):
+        # Resume / job description parser and analyzer chains (prompts, format instructions) built once,
+        # stateless and shared by every request (get_agent_analyzer)
+        from services.analyzer_chains import AnalyzerChains
+        return AnalyzerChains(self._requires("llm"))
 
+    def _requires(self, model_name):
+        """ Wait for another model of the same load, RuntimeError when it failed"""
+        self._done[model_name].wait()
+        if model_name not in self.nlp_models:
+            raise RuntimeError(f"{model_name} failed to load: {self.status[model_name]['error']}")
+        return self.nlp_models[model_name]
+
+    def _load_st_embeddings(self):
         # Initialize embeddings model - sentence_transformers
-        self.nlp_models["st_embeddings"] = EmbeddingModel(model_type=os.environ.get("EMBEDDING_MODEL", "sentence-transformers"))
-        #self.nlp_models.get("st_embeddings", EmbeddingModel(model_type="openai_embedding")).get_embedding(text)
+        # embedding_cache: known texts are never re-embedded
+        embedding_model = EmbeddingModel(model_type=os.environ.get("EMBEDDING_MODEL", "sentence-transformers"),
+                                         cache=embedding_cache)
+        embedding_model.preload()
+        return embedding_model
+
+    def _load_openai_embeddings(self):
         #OPEN_API_KEY - loads from environment variable
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings()
 
+    def _load_tfidf(self):
+        # Initialize TF-IDF model: corpus-fitted vectorizer loaded once, requests only transform
+        tfidf_store.load()
+        return EmbeddingModel(model_type="TfidfVectorizer")
 
-        # Initialize embeddings model - OpenAIEmbeddings
-        self.nlp_models["embeddings"] = OpenAIEmbeddings()
-        
-        # Initialize TF-IDF model
-        self.nlp_models["tfidf_model"] = EmbeddingModel(model_type="TfidfVectorizer")
+    def _warm_up_tfidf(self, model):
+        # Not fitted yet is not an error: the tfidf_score is skipped until /admin/refit-tfidf/
+        if tfidf_store.loaded:
+            model.get_embedding([WARMUP_TEXT])
 
+    def _load_nlp_tool(self):
         # Initialize nlp_tool : spacy / ner_tool: transformer.pipeline
-        if os.environ.get('NLP_TOOL').lower() =='spacy':
-            self.nlp_models["nlp_tool"] = {'name': 'spacy',
-                                    'tool': nlp} 
-            # self.nlp_models["nlp_tool"] = {'name': 'ner_tool',
-            #                           'tool': ner_pipeline}
+        # skill_matcher: skills taxonomy compiled once into a PhraseMatcher
+        from models.spacy_model import load_spacy_model
+        from services.skill_matcher import SkillMatcher
+        nlp = load_spacy_model()
+        if os.environ.get('NLP_TOOL', 'spacy').lower() =='spacy':
+            return {'name': 'spacy',
+                    'tool': nlp,
+                    'skill_matcher': SkillMatcher(nlp)} 
+            # return {'name': 'ner_tool',
+            #         'tool': ner_pipeline}
         else:
-            self.nlp_models["nlp_tool"] = {'name': 'spacy',
-                                    'tool': nlp} 
-        
+            return {'name': 'spacy',
+                    'tool': nlp,
+                    'skill_matcher': SkillMatcher(nlp)} 
+
+    def _warm_up_nlp_tool(self, nlp_tool):
+        for doc in nlp_tool['tool'].pipe([WARMUP_TEXT]):
+            nlp_tool['skill_matcher'].find_skill_ids(doc)
+
+    def _load_one(self, model_name, load_func, warm_up_func):
+        status = self.status[model_name]
+        try:
+            status["status"] = "loading"
+            start_time = time.perf_counter()
+            model = load_func()
+            status["load_seconds"] = round(time.perf_counter() - start_time, 3)
+            if warm_up_func is not None:
+                self._warm_up_one(model_name, model, warm_up_func)
+            self.nlp_models[model_name] = model
+            status["status"] = "ready"
+        except Exception as e:
+            status["status"] = "failed"
+            status["error"] = str(e)
+            logging.error(f"ModelRegistry: {model_name} failed to load: {e}")
+        finally:
+            self._done[model_name].set()
 
-        # Load any other heavy ML/NLP models here
-        llm=self.nlp_models["llm"] 
+    def _warm_up_one(self, model_name, model, warm_up_func):
+        status = self.status[model_name]
+        status["status"] = "warming_up"
+        start_time = time.perf_counter()
+        warm_up_func(model)
+        status["warmup_seconds"] = round(time.perf_counter() - start_time, 3)
 
-        self.loaded = True
+    def load_all_models(self, warm_up=True):
+        """Load all models concurrently and wait for them, returns when every model is ready or failed
+        warm_up=False: load the weights only, warm_up_models() runs the first inferences later
+        (server.py loads in the parent and warms up in each forked worker)"""
+        if self.finished:
+            return
+        start_time = time.perf_counter()
+        self.loading = True
+        loaders = self._model_loaders()
+        self._warm_ups = {model_name: warm_up_func for model_name, (_, warm_up_func) in loaders.items()}
+        self.status = {model_name: {"status": "pending", "load_seconds": None, "warmup_seconds": None, "error": None}
+                       for model_name in loaders}
+        self._done = {model_name: threading.Event() for model_name in loaders}
+        with ThreadPoolExecutor(max_workers=MODEL_LOADER_THREADS, thread_name_prefix="model-loader") as pool:
+            for model_name, (load_func, warm_up_func) in loaders.items():
+                pool.submit(self._load_one, model_name, load_func, warm_up_func if warm_up else None)
+        self.load_seconds = round(time.perf_counter() - start_time, 3)
+        self.loaded = all(status["status"] == "ready" for status in self.status.values())
+        self.finished = True
         self.loading = False
-        #####print(f"All models loaded in {time.time() - start_time:.2f} seconds")
+        logging.info(f"Models loaded in {self.load_seconds:.2f} seconds: {self.status}")
+
+    def warm_up_models(self):
+        """Run the warm-up inference of every loaded model (after load_all_models(warm_up=False))"""
+        for model_name, warm_up_func in self._warm_ups.items():
+            if warm_up_func is None or model_name not in self.nlp_models:
+                continue
+            try:
+                self._warm_up_one(model_name, self.nlp_models[model_name], warm_up_func)
+                self.status[model_name]["status"] = "ready"
+            except Exception as e:
+                self.status[model_name]["status"] = "failed"
+                self.status[model_name]["error"] = str(e)
+                logging.error(f"ModelRegistry: {model_name} warm-up failed: {e}")
+        self.loaded = all(status["status"] == "ready" for status in self.status.values())
+
+    def start_background_loading(self):
+        """Load the models in a background thread so the app answers /ready while they load"""
+        if self.finished or self.loading:
+            return
+        self.loading = True
+        self._loader_thread = threading.Thread(target=self.load_all_models, name="model-registry", daemon=True)
+        self._loader_thread.start()
+
+    def get_status(self):
+        """Per-model status and timings, ready when every model is ready"""
+        return {"ready": self.loaded,
+                "loading": self.loading,
+                "load_seconds": self.load_seconds,
+                "models": {model_name: dict(status) for model_name, status in self.status.items()}}
+
+    def _check_ready(self, model_name):
+        status = self.status.get(model_name)
+        if status is None:
+            if self.loading or not self.status:
+                raise HTTPException(status_code=503, detail="Models not loaded yet. wait for models to load")
+            raise HTTPException(status_code=500, detail=f"Model {model_name} is not configured")
+        if status["status"] == "failed":
+            raise HTTPException(status_code=500, detail=f"Model {model_name} failed to load: {status['error']}")
+        if status["status"] != "ready":
+            raise HTTPException(status_code=503, detail=f"Model {model_name} not loaded yet ({status['status']}). wait for models to load")
 
     def get_model(self, model_name):
-        """Get a specific model by name"""
-        if not self.loaded:
-            raise RuntimeError("Models not loaded yet")
+        """Get a specific model by name, 503 while it is loading, 500 when it failed to load"""
+        self._check_ready(model_name)
         return self.nlp_models.get(model_name)
     
     def get_models(self):
         """Get a dictionary model"""
-        if self.loading:
+        if self.loading or not self.status:
             raise HTTPException(status_code=503, detail="Models not loaded yet. wait for models to load")
-        else:
-            if not self.loaded:
-                raise HTTPException(status_code=500, detail="Models failed to load")
+        for model_name in self.status:
+            self._check_ready(model_name)
         return self.nlp_models
 
     def cleanup(self):
+        # Stop the embedding micro-batcher worker thread
+        if "st_embeddings" in self.nlp_models:
+            self.nlp_models["st_embeddings"].close()
         self.nlp_models.clear()
 
 class ModelLoader:
     def __init__(self, model_type: str):
         if model_type == "bedrock": 
+            from models.bedrock_model import run_bedrock
             self.model_func = run_bedrock
         elif model_type == "openai": 
+            from models.openai_model import run_openai
             self.model_func = run_openai
         else:
             raise ValueError("Unsupported model type. Choose 'bedrock' or 'openai'.")
@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+
+import numpy as np
+
+from models.sentencetransformer_model import ST_MODEL_NAME
+from utils.file_lock import lock_file
+
+# Exported and int8-quantized all-MiniLM-L6-v2, created by `python -m models.onnx_embedding_model --export`
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join("data", "onnx", ST_MODEL_NAME))
+ONNX_MODEL_FILE = "model.int8.onnx"
+# 0: let ONNX Runtime pick (one thread per physical core)
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", 0))
+ONNX_BATCH_SIZE = int(os.environ.get("ONNX_BATCH_SIZE", 32))
+# all-MiniLM-L6-v2 max_seq_length, longer texts are truncated like SentenceTransformer.encode
+ONNX_MAX_LENGTH = int(os.environ.get("ONNX_MAX_LENGTH", 256))
+ST_HF_MODEL_ID = f"sentence-transformers/{ST_MODEL_NAME}"
+# Cache/version name: int8 vectors differ slightly from the PyTorch ones
+ONNX_EMBEDDING_MODEL_NAME = f"{ST_MODEL_NAME}-onnx-int8"
+
+
+def export_onnx_model(output_dir=ONNX_MODEL_DIR, model_id=ST_HF_MODEL_ID):
+    """ Export the transformer of the sentence-transformer model to ONNX, then quantize the
+    weights to int8 (dynamic quantization: activations stay float). Returns the int8 model path.
+    Concurrent exports to the same directory are serialized by a file lock, the int8 model is written
+    last through a rename so a reader never sees a partial model"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with open(os.path.join(output_dir, ".export.lock"), "w") as file:
+        lock_file(file)
+        # Another process finished the export while we waited for the lock
+        if os.path.exists(int8_path):
+            return int8_path
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        tokenizer.save_pretrained(output_dir)
+        model = _LastHiddenState(AutoModel.from_pretrained(model_id).eval())
+        sample = tokenizer(["Python developer with AWS experience"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        fp32_path = os.path.join(output_dir, "model.onnx")
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(sample[name] for name in input_names), fp32_path,
+                              input_names=input_names, output_names=["last_hidden_state"],
+                              dynamic_axes={name: {0: "batch", 1: "sequence"}
+                                            for name in input_names + ["last_hidden_state"]},
+                              opset_version=14)
+        temp_path = int8_path + f".{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, int8_path)
+    return int8_path
+
+
+class OnnxEmbedder:
+    """ all-MiniLM-L6-v2 through ONNX Runtime on CPU: int8 transformer, mean pooling over the
+    attention mask and L2 normalization, the same pipeline as SentenceTransformer.encode"""
+    def __init__(self, model_dir=ONNX_MODEL_DIR, intra_op_threads=ONNX_INTRA_OP_THREADS,
+                 batch_size=ONNX_BATCH_SIZE, max_length=ONNX_MAX_LENGTH):
+        # Imported here: onnxruntime is only needed when this backend is configured
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        model_path = os.path.join(model_dir, ONNX_MODEL_FILE)
+        # Exporting needs torch and takes minutes: never done by the serving workers
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"OnnxEmbedder: no model at {model_path}, export it first with "
+                                    f"`python -m models.onnx_embedding_model --export` (ONNX_MODEL_DIR={model_dir})")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = [session_input.name for session_input in self.session.get_inputs()]
+        # last_hidden_state is (batch, sequence, hidden): the hidden size is a fixed axis
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def encode(self, texts:list):
+        """ Normalized float32 embeddings (len(texts) x dimension)"""
+        embeddings = [None] * len(texts)
+        # Batches of similar length texts need less padding
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        for start in range(0, len(order), self.batch_size):
+            batch_indexes = order[start:start + self.batch_size]
+            batch = self._encode_batch([texts[index] for index in batch_indexes])
+            for index, embedding in zip(batch_indexes, batch):
+                embeddings[index] = embedding
+        if not embeddings:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.stack(embeddings)
+
+    def _encode_batch(self, texts:list):
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                 return_tensors="np")
+        feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        hidden_state = self.session.run(None, feed)[0]
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_onnx_embedder():
+    """ Shared OnnxEmbedder, the session is created on first use"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = OnnxEmbedder()
+    return _embedder
+
+def get_onnx_embedding(text):
+    return get_onnx_embedder().encode([text])[0]
+
+def get_onnx_embeddings(texts:list):
+    """ Normalized float32 numpy embeddings (len(texts) x dim) from the int8 ONNX model"""
+    return get_onnx_embedder().encode(list(texts))
+
+
+if __name__ == "__main__":
+    # python -m models.onnx_embedding_model --export
+    if "--export" in sys.argv:
+        print(f"Quantized ONNX model written to {export_onnx_model()}")
+    else:
+        print("usage: python -m models.onnx_embedding_model --export")
@@ -29,4 +29,13 @@ def get_openai_embedding(text):
         input=text,
         model="text-embedding-ada-002"  # OpenAI's embedding model
     )
-    return response.data[0].embedding 
+    return response.data[0].embedding
+
+def get_openai_embeddings(texts:list):
+    """ Embeddings of a list of texts in one request"""
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    response = openai.embeddings.create(
+        input=texts,
+        model="text-embedding-ada-002"  # OpenAI's embedding model
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
@@ -1,8 +1,26 @@
-from sentence_transformers import SentenceTransformer
+import threading
+import numpy as np
 
-# Load pretrained BERT model for embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
+ST_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_st_model():
+    """ Pretrained BERT model for embeddings, loaded on first use instead of at import time"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(ST_MODEL_NAME)
+    return _model
 
 def get_st_embedding(text):    
-    embedding = model.encode(text, convert_to_tensor=True)
-    return embedding
\ No newline at end of file
+    embedding = get_st_model().encode(text, convert_to_tensor=True)
+    return embedding
+
+def get_st_embeddings(texts:list):
+    """ Normalized float32 numpy embeddings (len(texts) x dim) from a single batched encode call"""
+    embeddings = get_st_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    return embeddings.astype(np.float32, copy=False)
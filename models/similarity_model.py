@@ -1,43 +1,111 @@
-from models.bedrock_model import  get_bedrock_embedding
-from models.openai_model import  get_openai_embedding
-from models.sentencetransformer_model import get_st_embedding
-from models.tfidf_model import get_tfidfvectors
+from models.embedding_batcher import EmbeddingBatcher
 
 import numpy as np
 
 def cosine_similarity(vec1, vec2):
     return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
+def normalize_rows(matrix):
+    """ float32 rows scaled to unit length, so a dot product is the cosine similarity"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+def similarity_matrix(queries, documents):
+    """ Cosine similarity kernel for normalized embeddings: (n_queries x n_documents)"""
+    return np.asarray(queries, dtype=np.float32) @ np.asarray(documents, dtype=np.float32).T
+
 
 class EmbeddingModel:
-    def __init__(self, model_type="bedrock"):
+    def __init__(self, model_type="bedrock", cache=None):
+        # Batch function returning normalized float32 rows, when the backend has one
+        self.batch_func = None
+        # model_name versions the cached vectors: a different model never reads them
+        self.model_name = model_type
+        # Backends are imported only when configured (boto3, openai, torch are slow to import)
         if model_type == "bedrock-embedding":
-            self.embed_func = get_bedrock_embedding 
+            from models.bedrock_model import get_bedrock_embedding
+            self.embed_func = get_bedrock_embedding
+            self.model_name = "amazon.titan-embed-text-v1"
         elif model_type == "openai_embedding":
+            from models.openai_model import get_openai_embedding, get_openai_embeddings
+            self.model_name = "text-embedding-ada-002"
             self.embed_func = get_openai_embedding
+            self.batch_func = lambda texts: normalize_rows(get_openai_embeddings(texts))
         elif model_type == "TfidfVectorizer":
+            from models.tfidf_model import get_tfidfvectors
             # Better for keyword match : same words
             self.embed_func = get_tfidfvectors
-        elif model_type == "sentence_transformer":
+        elif model_type in ("sentence_transformer", "sentence-transformers"):
+            from models.sentencetransformer_model import get_st_embedding, get_st_embeddings, ST_MODEL_NAME
             # better for semantic matching
             self.embed_func = get_st_embedding
+            self.batch_func = get_st_embeddings
+            self.model_name = ST_MODEL_NAME
+        elif model_type == "onnx_sentence_transformer":
+            from models.onnx_embedding_model import get_onnx_embedding, get_onnx_embeddings, ONNX_EMBEDDING_MODEL_NAME
+            # same model, int8-quantized and run by ONNX Runtime: faster on CPU
+            self.embed_func = get_onnx_embedding
+            self.batch_func = get_onnx_embeddings
+            self.model_name = ONNX_EMBEDDING_MODEL_NAME
         else:
             raise ValueError(f"Invalid model type: Choose 'bedrock' or 'openai'. given {model_type}")
+        self.model_type = model_type
+        # services.embedding_cache.EmbeddingCache, None: always embed
+        self.cache = cache
+        # Concurrent aget_embeddings calls share one encode on the batcher's worker thread
+        self.batcher = EmbeddingBatcher(self.get_embeddings)
 
     def get_embedding(self, input):
         return self.embed_func(input)
-    
-     
+
+    def get_embeddings(self, texts:list):
+        """ Normalized float32 numpy embeddings (len(texts) x dim) of a list of texts, one batched call"""
+        if self.model_type == "TfidfVectorizer":
+            raise ValueError("EmbeddingModel.get_embeddings: use get_embedding for sparse TF-IDF vectors")
+        if self.cache is not None:
+            return self.cache.get_embeddings(self.model_name, texts, self._embed_batch)
+        return self._embed_batch(list(texts))
+
+    async def aget_embeddings(self, texts:list):
+        """ get_embeddings for coroutines: batched with the texts of other concurrent requests"""
+        return await self.batcher.submit(texts)
+
+    def get_batcher_metrics(self):
+        return self.batcher.get_metrics()
+
+    def close(self):
+        self.batcher.shutdown()
+
+    def preload(self):
+        """ Load the weights without running an inference. The ONNX Runtime session is created on
+        first inference instead: its thread pool must start in the process that serves requests"""
+        if self.model_type in ("sentence_transformer", "sentence-transformers"):
+            from models.sentencetransformer_model import get_st_model
+            get_st_model()
+
+    def warm_up(self, text="warm up"):
+        """ First inference outside a request: loads the weights and starts the batcher thread.
+        Remote APIs (bedrock, openai) are not called"""
+        if self.model_type in ("sentence_transformer", "sentence-transformers", "onnx_sentence_transformer"):
+            self._embed_batch([text])
+        self.batcher.start()
+
+    def _embed_batch(self, texts:list):
+        if self.batch_func is not None:
+            return self.batch_func(texts)
+        return normalize_rows([np.asarray(self.embed_func(text), dtype=np.float32) for text in texts])
+
+
 
 
 if __name__ == "__main__":
-    embedding_model = EmbeddingModel(model_type="sentence_transformer")  # Change to "openai_embedding" to switch 
+    embedding_model = EmbeddingModel(model_type="sentence_transformer")  # Change to "openai_embedding" to switch
     resume_text = "Python, FastAPI, AWS experience"
     job_text = "Hiring for an AWS developer with Python expertise"
 
-    resume_embedding = embedding_model.get_embedding(resume_text)
-    job_embedding = embedding_model.get_embedding(job_text)
+    resume_embedding, job_embedding = embedding_model.get_embeddings([resume_text, job_text])
 
-    similarity_score = cosine_similarity(resume_embedding, job_embedding)
+    similarity_score = float(similarity_matrix([resume_embedding], [job_embedding])[0][0])
     #####print(f"Similarity Score: {similarity_score}")
- 
\ No newline at end of file
+
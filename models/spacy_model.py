@@ -1,4 +1,18 @@
+import os, threading
+# Only the tagger/attribute_ruler/lemmatizer (token.lemma_) and ner (doc.ents) outputs are read,
+# the dependency parser is never used
+SPACY_DISABLED_COMPONENTS = ["parser"]
+SPACY_MODEL_NAME = os.environ.get("SPACY_MODEL", "en_core_web_lg")
 
-import spacy
-# Initializing models
-nlp = spacy.load("en_core_web_lg") # load spacy model
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def load_spacy_model():
+    """ spaCy pipeline, loaded once on first call (by ModelRegistry at startup), not at import time"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load(SPACY_MODEL_NAME, disable=SPACY_DISABLED_COMPONENTS) # load spacy model
+    return _nlp
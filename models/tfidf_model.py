@@ -1,10 +1,128 @@
-import os, sys, re
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import os, sys, logging, tempfile, threading, time
+import joblib
 
-vectorizer = TfidfVectorizer()
+# Vectorizer fitted offline over the stored resume and job collections
+TFIDF_MODEL_PATH = os.environ.get("TFIDF_MODEL_PATH", os.path.join("data", "tfidf_model.joblib"))
+TFIDF_MAX_FEATURES = int(os.environ.get("TFIDF_MAX_FEATURES", 50000))
+# How often a worker checks whether another process wrote a new model file
+TFIDF_RELOAD_SECONDS = float(os.environ.get("TFIDF_RELOAD_SECONDS", 30))
+# collection name -> text field holding the raw document
+TFIDF_CORPUS_FIELDS = {"resume": "raw_resume", "job": "raw_jobdesc"}
+
+
+def load_corpus(db, fields=TFIDF_CORPUS_FIELDS):
+    """ Raw texts of every stored resume and job description"""
+    corpus = []
+    for collection_name, field in fields.items():
+        for doc in db.get_collection(collection_name).find({field: {"$type": "string"}}, {field: 1, "_id": 0}):
+            corpus.append(doc[field])
+    return corpus
+
+
+class TfidfModelStore:
+    """ Holds the corpus-fitted TfidfVectorizer. Requests only call transform, the vocabulary and
+    IDF weights come from the whole corpus instead of being refitted on [resume, jd] per request.
+    refit() builds a new model, writes it atomically and swaps it in without a restart;
+    other worker processes pick up the new file on their next reload check.
+    """
+    def __init__(self, path=TFIDF_MODEL_PATH):
+        self.path = path
+        self.vectorizer = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._refit_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.vectorizer is not None
+
+    def load(self):
+        """ Load the serialized model, returns False when it has not been fitted yet"""
+        if not os.path.exists(self.path):
+            logging.warning(f"TfidfModelStore.load: no model at {self.path}, run: python -m models.tfidf_model --refit")
+            return False
+        mtime = os.path.getmtime(self.path)
+        # Single reference assignment: concurrent transform calls see the old or the new model
+        self.vectorizer = joblib.load(self.path)
+        self._mtime = mtime
+        self._last_check = time.monotonic()
+        return True
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < TFIDF_RELOAD_SECONDS:
+            return
+        self._last_check = now
+        try:
+            if os.path.exists(self.path) and os.path.getmtime(self.path) != self._mtime:
+                self.load()
+        except Exception as e:
+            logging.error(f"TfidfModelStore reload: {e}")
+
+    def transform(self, docs:list):
+        """ Sparse L2-normalized TF-IDF rows of docs, never refits"""
+        self._reload_if_changed()
+        vectorizer = self.vectorizer
+        if vectorizer is None:
+            raise RuntimeError("TF-IDF model is not fitted. Run: python -m models.tfidf_model --refit")
+        return vectorizer.transform(docs)
+
+    def fit(self, corpus:list):
+        if not corpus:
+            raise ValueError("TfidfModelStore.fit: empty corpus")
+        # Imported here: serving only unpickles a fitted vectorizer
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        vectorizer = TfidfVectorizer(sublinear_tf=True, stop_words="english", max_features=TFIDF_MAX_FEATURES)
+        vectorizer.fit(corpus)
+        return vectorizer
+
+    def save(self, vectorizer):
+        """ Write to a temp file in the same directory then rename over the model file (atomic)"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump(vectorizer, temp_path)
+            os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def refit(self, db=None, corpus=None):
+        """ Fit over the stored resumes and jobs (or the given corpus), persist and swap in.
+        returns number of documents in the corpus"""
+        with self._refit_lock:
+            if corpus is None:
+                if db is None:
+                    from db.db_connector import get_database
+                    db = get_database()
+                corpus = load_corpus(db)
+            vectorizer = self.fit(corpus)
+            self.save(vectorizer)
+            self.vectorizer = vectorizer
+            self._mtime = os.path.getmtime(self.path)
+            return len(corpus)
+
+# Create a global instance
+tfidf_store = TfidfModelStore()
 
 def get_tfidfvectors(docs:list):
-    vectors = vectorizer.fit_transform(docs)
+    vectors = tfidf_store.transform(docs)
     return vectors
-    
\ No newline at end of file
+
+def tfidf_cosine_scores(query_vectors, doc_vectors):
+    """ Cosine similarity of every query row against every doc row (rows are L2-normalized),
+    works in bulk on sparse matrices: returns a dense (n_queries x n_docs) array"""
+    return (query_vectors @ doc_vectors.T).toarray()
+
+
+if __name__ == "__main__":
+    # python -m models.tfidf_model --refit
+    from dotenv import load_dotenv
+    load_dotenv()
+    if "--refit" in sys.argv:
+        count = tfidf_store.refit()
+        print(f"TF-IDF model fitted on {count} documents: {tfidf_store.path}")
+    else:
+        print("usage: python -m models.tfidf_model --refit")
@@ -0,0 +1,184 @@
+""" Production server: pre-fork supervisor running SERVER_WORKERS uvicorn workers on one shared socket.
+
+The parent loads the model weights once (ModelRegistry.load_all_models), freezes the GC and forks the
+workers, so the weights are shared copy-on-write instead of loaded once per worker. Everything that
+owns threads or connections is created after the fork, in the worker: the Mongo client, torch/ONNX
+thread pools (warm-up inference), the embedding batcher thread and the parser process pool.
+The parent respawns workers that exit, with a growing delay while they keep crashing at start-up, and
+restarts the ones above WORKER_MEMORY_BUDGET_MB (PSS).
+
+    python server.py
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from dotenv import load_dotenv
+load_dotenv()
+
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", 8000))
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Torch intra-op threads per worker: workers x threads should not exceed the cores
+WORKER_TORCH_THREADS = int(os.environ.get("WORKER_TORCH_THREADS", max(1, (os.cpu_count() or 1) // SERVER_WORKERS)))
+# Proportional set size (shared pages split between the processes sharing them), 0: no limit
+WORKER_MEMORY_BUDGET_MB = int(os.environ.get("WORKER_MEMORY_BUDGET_MB", 0))
+WORKER_MEMORY_CHECK_SECONDS = float(os.environ.get("WORKER_MEMORY_CHECK_SECONDS", 30))
+WORKER_SHUTDOWN_TIMEOUT = float(os.environ.get("WORKER_SHUTDOWN_TIMEOUT", 30))
+# A worker exiting within WORKER_MIN_UPTIME seconds of its start is respawned after a delay doubling
+# from 0.5s up to WORKER_RESPAWN_BACKOFF_MAX seconds, reset once a worker stays up
+WORKER_MIN_UPTIME = float(os.environ.get("WORKER_MIN_UPTIME", 10))
+WORKER_RESPAWN_BACKOFF_MAX = float(os.environ.get("WORKER_RESPAWN_BACKOFF_MAX", 30))
+
+
+def worker_memory_mb(pid):
+    """ PSS of a process in MiB from /proc/<pid>/smaps_rollup, RSS when PSS is not available"""
+    for path, field in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+        try:
+            with open(path, "r") as file:
+                for line in file:
+                    if line.startswith(field):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return None
+
+def create_socket(host=SERVER_HOST, port=SERVER_PORT):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """ Supervisor of the forked uvicorn workers"""
+    def __init__(self, app, sock, workers=SERVER_WORKERS):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.children = {}
+        self.stopping = False
+        # Monotonic times of the pending respawns
+        self.respawns = []
+        self.crashes = 0
+        self._last_memory_check = time.monotonic()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: default signal handling, uvicorn installs its own
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                self.run_worker()
+            except Exception as e:
+                logging.error(f"worker {os.getpid()}: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+        logging.info(f"started worker {pid}")
+        return pid
+
+    def run_worker(self):
+        import uvicorn
+        from db.db_connector import get_database
+        from models.model_loader import model_registry
+        # Connections and thread pools are not fork safe: create them in this process
+        get_database.cache_clear()
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(WORKER_TORCH_THREADS)
+        model_registry.warm_up_models()
+        config = uvicorn.Config(self.app, lifespan="on", log_level=os.environ.get("LOG_LEVEL", "info"))
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def reap(self):
+        """ Collect exited workers, schedule their respawn unless stopping"""
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            now = time.monotonic()
+            started = self.children.pop(pid, now)
+            if self.stopping:
+                continue
+            self.crashes = self.crashes + 1 if now - started < WORKER_MIN_UPTIME else 0
+            delay = min(WORKER_RESPAWN_BACKOFF_MAX, 0.5 * 2 ** (self.crashes - 1)) if self.crashes else 0
+            logging.warning(f"worker {pid} exited ({status}), respawning in {delay:.1f}s")
+            self.respawns.append(now + delay)
+
+    def respawn(self):
+        """ Start the workers whose respawn delay has elapsed"""
+        now = time.monotonic()
+        due = [respawn_at for respawn_at in self.respawns if respawn_at <= now]
+        self.respawns = [respawn_at for respawn_at in self.respawns if respawn_at > now]
+        for _ in due:
+            self.spawn()
+
+    def check_memory(self):
+        if WORKER_MEMORY_BUDGET_MB <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_memory_check < WORKER_MEMORY_CHECK_SECONDS:
+            return
+        self._last_memory_check = now
+        for pid in list(self.children):
+            memory = worker_memory_mb(pid)
+            if memory is not None and memory > WORKER_MEMORY_BUDGET_MB:
+                # Graceful: uvicorn finishes in-flight requests, reap() starts the replacement
+                logging.warning(f"worker {pid} uses {memory:.0f} MiB > {WORKER_MEMORY_BUDGET_MB} MiB, restarting")
+                os.kill(pid, signal.SIGTERM)
+
+    def shutdown(self):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            os.kill(pid, signal.SIGKILL)
+        self.sock.close()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        while not self.stopping:
+            self.reap()
+            self.respawn()
+            self.check_memory()
+            time.sleep(0.5)
+        self.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(message)s")
+    from main import app
+    from models.model_loader import model_registry
+
+    # Weights are loaded once here and shared copy-on-write by the workers
+    model_registry.load_all_models(warm_up=False)
+    logging.info(f"models loaded in {model_registry.load_seconds}s: {model_registry.get_status()['models']}")
+    # Objects that survive from here on are never collected: the GC does not write to their pages
+    gc.collect()
+    gc.freeze()
+    PreforkServer(app, create_socket()).run()
@@ -1,29 +1,62 @@
 
-from langchain.agents import  initialize_agent, Tool, AgentType
+import asyncio
+import os
 from db.db_connector import get_database
 from db.dboperations import MongoDBOperationHandler
-from services.analyzer_tools import ExtractResumeTool, ExtractJobDescTool, AnalyzeResumeJobTool  
+from services.analyzer_chains import AnalysisContext, AnalyzerChains
+from services.embedding_cache import text_hash
+
+# three_call: resume parse, job description parse and analysis are three llm calls
+# combined: one llm call for the three when none of them is stored (CombinedAnalyzerChain)
+LLM_PIPELINE_MODE = os.environ.get("LLM_PIPELINE_MODE", "three_call").lower()
 
 class ResumeAnalyzerAgent:
-    def __init__(self, llm, verbose=False):
+    """ One agent per request (self.err is the error list of the request).
+    chains: the AnalyzerChains shared by the requests (ModelRegistry "analyzer_chains"), the chains
+    are stateless and the state of a request is an AnalysisContext. The tools and the langchain agent
+    executor are only used by the sync paths and are built on first use"""
+    def __init__(self, llm, verbose=False, chains=None, pipeline_mode=LLM_PIPELINE_MODE):
         self.llm = llm
         self.err = [] # record any errors that are not critical 
-        
-        try:
-            parser =  ExtractResumeTool(llm)
-        except Exception as e:
-            parser = None 
-            #####print(e)
-        self.parse_resume_tool =  ExtractResumeTool(llm)
-        self.parse_jobdesc_tool = ExtractJobDescTool(llm)
-        self.analyze_resume_tool = AnalyzeResumeJobTool(llm)
+        self.chains = chains if chains is not None else AnalyzerChains(llm)
         self.verbose = verbose
-        self.agentexecutor = initialize_agent( 
-            tools=[self.parse_resume_tool, self.parse_jobdesc_tool, self.analyze_resume_tool],
-            llm=self.llm,
-            agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-            verbose=True
-        ) 
+        self.pipeline_mode = pipeline_mode
+        self._tools = None
+        self._agentexecutor = None
+
+    @property
+    def tools(self):
+        if self._tools is None:
+            # langchain tools: imported on first use of the sync paths
+            from services.analyzer_tools import ExtractResumeTool, ExtractJobDescTool, AnalyzeResumeJobTool
+            self._tools = [ExtractResumeTool(self.llm, chain=self.chains.resume_parser),
+                           ExtractJobDescTool(self.llm, chain=self.chains.jobdesc_parser),
+                           AnalyzeResumeJobTool(self.llm, chain=self.chains.analyzer)]
+        return self._tools
+
+    @property
+    def parse_resume_tool(self):
+        return self.tools[0]
+
+    @property
+    def parse_jobdesc_tool(self):
+        return self.tools[1]
+
+    @property
+    def analyze_resume_tool(self):
+        return self.tools[2]
+
+    @property
+    def agentexecutor(self):
+        if self._agentexecutor is None:
+            from langchain.agents import initialize_agent, AgentType
+            self._agentexecutor = initialize_agent( 
+                tools=self.tools,
+                llm=self.llm,
+                agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
+                verbose=True
+            ) 
+        return self._agentexecutor
     
     def analyzer(self, resume_data, job_description):
         """ Main entry point for resume analysis. 
@@ -58,93 +91,54 @@ class ResumeAnalyzerAgent:
 
     async def analyze_resume(self, resume_data, job_description, resume_email=None, job_external_id=None):
         """ Main entry point for resume analysis. 
-        Analyze the resume data against the job description using the llm"""
+        Analyze the resume data against the job description using the llm.
+        The resume and the job description are looked up / parsed concurrently, the analysis starts when
+        both are done; a failed side is reported in error and the rest of the result is still returned.
+        Documents are identified by the hash of their normalized text (content_hash): a resume, job
+        description or analysis already in the database is returned without calling the llm.
+        pipeline_mode combined: a new resume / job description pair is parsed and analyzed by one llm call"""
         try:
-            resume_response ={}
-            jobdesc_response = {}
             final_response ={}
             db = get_database()
-            ret_resume_id = None
-            ret_job_id = None
-            # Prior to running the analysis, check if the resume and job description are already done 
-            resume_exists = False
-            job_exists = False
-            match_exists = False 
-            if resume_email is not None  :
-                filter = {"email": resume_email}
-                collection_name = "resume"
-                resume_exists, resume_record = self.check_records(db, collection_name, filter, {})      
-                if resume_exists:
-                    ret_resume_id = resume_record.get("_id")
-                    resume_data['resume_id'] = ret_resume_id
-                    resume_response ={"response":  resume_record.get("resume_response",None),
-                                        "data" : resume_record} 
-                     
-                    if self.verbose:
-                        #####print(f"resume_response: Resume parsing response: {resume_response}")
-                        pass
-                    else:
-                        self.err.append(f"Resume ({resume_email}):  resume not found in database")    
-                else:
-                    self.err.append(f"Resume ({resume_email}):  resume not found in database")
-            if job_external_id is not None:
-                filter = {"external_job_id": job_external_id}
-                collection_name = "job"
-                job_exists, job_record = self.check_records(db, collection_name, filter, {})
-                if job_exists:
-                    ret_job_id = job_record.get("_id")
-                    job_record['job_id'] = ret_job_id
-                    jobdesc_response = {"response":  job_record.get("job_response",None),
-                                        "data" : job_record}   
-                    if self.verbose:
-                        #####print(f"jobdesc_response: job description parsing response: {jobdesc_response}")
-                        pass
-                    else:
-                        self.err.append(f"Job Description ({job_external_id}):  Job description not found in database")    
-                else:
-                    self.err.append(f"Job Description ({job_external_id}):  Job description not found in database")
-            # Step 1: Parse the resume 
-            if not resume_exists and ret_resume_id is None:
-                try:
-                    resume_response = await self.parse_resume_tool.arun({"resume_data": resume_data})
-                    if self.verbose :
-                        #####print(f"resume_response: Resume parsing response: {resume_response}")
-                        pass
-                    if "error" in resume_response:
-                        raise Exception(f"analyze_resume: Error while parsing resume :- {resume_response['error']}")
-                except Exception as e:
-                    #####print(f"ResumeAnalyzerAgent.resume_response.main: {e}")
-                    self.err.append(f"ResumeAnalyzerAgent.resume_response.main: {e}")
-            # Step 2: Parse the job description 
-
-            if not job_exists and ret_job_id is None:                
-                try:
-                    jobdesc_response = await self.parse_jobdesc_tool.arun({"job_description": job_description})
-                    if "error" in resume_response:
-                        raise Exception(f"analyze_resume: Error while parsing resume :- {jobdesc_response['error']}")
-                    if self.verbose :
-                        #####print(f"jobdesc_response: job description parsing response: {jobdesc_response}")
-                        pass
-                except Exception as e:
-                    #####print(f"ResumeAnalyzerAgent.jobdesc_response.main: {e}")
-                    pass
-                    self.err.append(f"ResumeAnalyzerAgent.jobdesc_response.main: {e}")
-            # Step 3: Parse the job description 
+            resume_hash = text_hash(resume_data)
+            job_hash = text_hash(job_description)
+            # State of this request in the shared chains
+            context = AnalysisContext()
+            combined = None
+            if self.pipeline_mode == "combined":
+                combined = await self.aget_combined(db, resume_data, job_description, resume_email, job_external_id,
+                                                    resume_hash, job_hash, context)
+            if combined is not None:
+                # Steps 1 to 3 done by one llm call, the ids are read from the saved data below
+                resume_response, jobdesc_response = combined["resume"], combined["job"]
+                ret_resume_id, ret_job_id, match_exists, record = None, None, False, None
+            else:
+                # Prior to running the analysis, check if the resume and job description are already done 
+                # Step 1 and 2: resume and job description, each one a database check then the llm parse,
+                # with the lookup of a stored analysis of the same pair of documents
+                (resume_response, ret_resume_id), (jobdesc_response, ret_job_id), (match_exists, record) = await asyncio.gather(
+                    self.aget_resume(db, resume_data, resume_email, resume_hash, context),
+                    self.aget_jobdesc(db, job_description, job_external_id, job_hash, context),
+                    asyncio.to_thread(self.check_records, db, "jobmatch_result",
+                                      {"resume_hash": resume_hash, "job_hash": job_hash}, {}))
+            # Step 3: match check, then the analysis
             #####print(f"ret_resume_id: {ret_resume_id} ret_job_id: {ret_job_id}")
             #####print("Starting match check")
             try:
-                if ret_resume_id is None  and "resume_id" in resume_response.get("data",{}):
+                if ret_resume_id is None  and "resume_id" in (resume_response.get("data") or {}):
                     ret_resume_id = resume_response.get("data").get("resume_id")
-                if ret_job_id is None and "job_id" in jobdesc_response.get("data",{}):
+                if ret_job_id is None and "job_id" in (jobdesc_response.get("data") or {}):
                     ret_job_id = jobdesc_response.get("data").get("job_id")
 
                 if ret_resume_id is None or ret_job_id is None:
                     print(f"Resume ({ret_resume_id})/ Job Description  ({ret_job_id}): Database save error")
                     #####print(f"Resume ({ret_resume_id})/ Job Description  ({ret_job_id}): Database save error")
                 try: 
-                    filter = {"job_id": ret_job_id, "resume_id": ret_resume_id}
-                    collection_name = "jobmatch_result"
-                    match_exists, record = self.check_records(db, collection_name, filter, {})
+                    if combined is None and not match_exists and ret_resume_id is not None and ret_job_id is not None:
+                        # Analyses saved before content hashes: by document ids
+                        filter = {"job_id": ret_job_id, "resume_id": ret_resume_id}
+                        collection_name = "jobmatch_result"
+                        match_exists, record = await asyncio.to_thread(self.check_records, db, collection_name, filter, {})
                     if match_exists and record is not None:
                         record['match_id'] = record.get("_id")
 
@@ -152,16 +146,14 @@ class ResumeAnalyzerAgent:
                                           "data" : record.get("data",{})}
                         if self.verbose:
                             print(f"match_exists: {match_exists} record: {record}")
-                        else:
-                            self.err.append(f"Match ({ret_resume_id})/ Job Description  ({ret_job_id}): Match not found in database")
                     if match_exists :
                         try:                            
                             final_result = {"response" : {"analysis_response": record.get("match_response",""),
                                                   "resume_response_data" :resume_response.get("data"),
                                                   "jobdesc_response_data" :jobdesc_response.get("data"),
                                                   "analysis_response_data" :record,
-                                                  "llm_parsed_resume" : resume_response.get("response",resume_response.get("data").get("resume_response","")),
-                                                  "llm_parsed_jd" : jobdesc_response.get("response", jobdesc_response.get("data").get("job_response",""))},
+                                                  "llm_parsed_resume" : resume_response.get("response",(resume_response.get("data") or {}).get("resume_response","")),
+                                                  "llm_parsed_jd" : jobdesc_response.get("response", (jobdesc_response.get("data") or {}).get("job_response",""))},
                                     "result": {"overall_score" : record.get("overall_score"),
                                                "feedback" : record.get("feedback"),
                                                "suggestions" : record.get("suggestions"),
@@ -182,10 +174,11 @@ class ResumeAnalyzerAgent:
                 print(f"ret_resume_id: {ret_resume_id} | ret_job_id: {ret_job_id}")
                 # going to run analysis if match does not exist
                 print(f"Running analysis")
-                final_response = await self.analyze_resume_tool.arun({"resume_data": resume_data,
-                                                                    "job_description": job_description,
-                                                                    "resume_id": ret_resume_id,
-                                                                    "job_id" : ret_job_id })
+                if combined is not None:
+                    final_response = combined["analysis"]
+                else:
+                    final_response = await self.chains.analyzer.arun(resume_data, job_description,
+                                                                     ret_resume_id, ret_job_id, context)
                 
                 print("completing analysis")
                 if "data" in final_response :
@@ -196,8 +189,8 @@ class ResumeAnalyzerAgent:
                                                   "resume_response_data" :resume_response.get("data",{}),
                                                   "jobdesc_response_data" :jobdesc_response.get("data",{}),
                                                   "analysis_response_data" :final_response.get("data",{}),
-                                                  "llm_parsed_resume" : resume_response.get("response",resume_response.get("data").get("resume_response","No resume response from LLM")),
-                                                  "llm_parsed_jd" : jobdesc_response.get("response", jobdesc_response.get("data").get("job_response","No jobdesc response from LLM"))},
+                                                  "llm_parsed_resume" : resume_response.get("response",(resume_response.get("data") or {}).get("resume_response","No resume response from LLM")),
+                                                  "llm_parsed_jd" : jobdesc_response.get("response", (jobdesc_response.get("data") or {}).get("job_response","No jobdesc response from LLM"))},
                                     "result": {"overall_score" : final_response.get("data",{}).get("overall_score"),
                                                "feedback" : final_response.get("data",{}).get("feedback"),
                                                "suggestions" : final_response.get("data",{}).get("suggestions"),
@@ -226,6 +219,71 @@ class ResumeAnalyzerAgent:
             return {"result": None,
                     "error": self.err}
 
+    async def aget_combined(self, db, resume_data, job_description, resume_email=None, job_external_id=None,
+                            resume_hash=None, job_hash=None, context=None):
+        """ Combined pipeline: {"resume", "job", "analysis"} of one CombinedAnalyzerChain call when neither
+        the resume, the job description nor their analysis is stored. None when one of them is stored or the
+        call failed (recorded in self.err), the three-call pipeline is run instead"""
+        resume_filter = {"$or": [{"content_hash": resume_hash}] + ([{"email": resume_email}] if resume_email else [])}
+        job_filter = {"$or": [{"content_hash": job_hash}] + ([{"external_job_id": job_external_id}] if job_external_id else [])}
+        try:
+            stored = await asyncio.gather(
+                asyncio.to_thread(self.check_records, db, "resume", resume_filter, {"_id": 1}),
+                asyncio.to_thread(self.check_records, db, "job", job_filter, {"_id": 1}),
+                asyncio.to_thread(self.check_records, db, "jobmatch_result",
+                                  {"resume_hash": resume_hash, "job_hash": job_hash}, {"_id": 1}))
+            if any(exists for exists, _ in stored):
+                return None
+            return await self.chains.combined.arun(resume_data, job_description, context)
+        except Exception as e:
+            self.err.append(f"ResumeAnalyzerAgent.aget_combined: {e}")
+            return None
+
+    async def aget_resume(self, db, resume_data, resume_email=None, resume_hash=None, context=None):
+        """ (resume_response, resume_id): the stored resume with the same content hash, else the one of
+        resume_email, else the llm parse (saved by the chain). On error it is recorded in self.err and ({}, None) is returned"""
+        try:
+            # The exact text first: a resume of the same email may be another version
+            for filter in ([{"content_hash": resume_hash}] if resume_hash is not None else []) + \
+                          ([{"email": resume_email}] if resume_email is not None else []):
+                resume_exists, resume_record = await asyncio.to_thread(self.check_records, db, "resume", filter, {})
+                if resume_exists:
+                    ret_resume_id = resume_record.get("_id")
+                    resume_record['resume_id'] = ret_resume_id
+                    return {"response": resume_record.get("resume_response", None),
+                            "data": resume_record}, ret_resume_id
+            if resume_email is not None:
+                self.err.append(f"Resume ({resume_email}):  resume not found in database")
+            resume_response = await self.chains.resume_parser.arun(resume_data, context)
+            if "error" in resume_response:
+                raise Exception(f"analyze_resume: Error while parsing resume :- {resume_response['error']}")
+            return resume_response, None
+        except Exception as e:
+            self.err.append(f"ResumeAnalyzerAgent.resume_response.main: {e}")
+            return {}, None
+
+    async def aget_jobdesc(self, db, job_description, job_external_id=None, job_hash=None, context=None):
+        """ (jobdesc_response, job_id): the stored job with the same content hash, else the one of
+        job_external_id, else the llm parse (saved by the chain). On error it is recorded in self.err and ({}, None) is returned"""
+        try:
+            for filter in ([{"content_hash": job_hash}] if job_hash is not None else []) + \
+                          ([{"external_job_id": job_external_id}] if job_external_id is not None else []):
+                job_exists, job_record = await asyncio.to_thread(self.check_records, db, "job", filter, {})
+                if job_exists:
+                    ret_job_id = job_record.get("_id")
+                    job_record['job_id'] = ret_job_id
+                    return {"response": job_record.get("job_response", None),
+                            "data": job_record}, ret_job_id
+            if job_external_id is not None:
+                self.err.append(f"Job Description ({job_external_id}):  Job description not found in database")
+            jobdesc_response = await self.chains.jobdesc_parser.arun(job_description, context)
+            if "error" in jobdesc_response:
+                raise Exception(f"analyze_resume: Error while parsing job description :- {jobdesc_response['error']}")
+            return jobdesc_response, None
+        except Exception as e:
+            self.err.append(f"ResumeAnalyzerAgent.jobdesc_response.main: {e}")
+            return {}, None
+
     # sync_analyze_resume is a sync version of the async analyze_resume method.
     # It is used for testing purposes to run the analysis in a synchronous manner.
     # This is useful when you want to test the functionality without using async/await.
@@ -325,8 +383,8 @@ class ResumeAnalyzerAgent:
                                                 "resume_response_data" :resume_response.get("data",{}),
                                                 "jobdesc_response_data" :jobdesc_response.get("data",{}),
                                                 "analysis_response_data" :record,
-                                                "llm_parsed_resume" : resume_response.get("response",resume_response.get("data").get("resume_response","")),
-                                                "llm_parsed_jd" : jobdesc_response.get("response", jobdesc_response.get("data").get("job_response",""))},
+                                                "llm_parsed_resume" : resume_response.get("response",(resume_response.get("data") or {}).get("resume_response","")),
+                                                "llm_parsed_jd" : jobdesc_response.get("response", (jobdesc_response.get("data") or {}).get("job_response",""))},
                                             "result":{"overall_score" : record.get("overall_score",""),
                                                 "feedback" : record.get("feedback",""),
                                                 "suggestions" : record.get("suggestions",""),
@@ -476,7 +534,8 @@ class ResumeAnalyzerAgent:
 
 
     def check_records(self, db,collection_name, filter, projection:dict={}):  
-                            
+        match_exists = False
+        record = None
         if db is not None:
             objdbservice = MongoDBOperationHandler(db)
             record = objdbservice.get_record(collection_name, filter, projection )
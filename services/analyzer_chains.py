@@ -1,18 +1,40 @@
+import asyncio
 import json
 import logging
-from db.data_models import  JobResponseModel, ResumeResponseModel, AnalysisResponseModel
-from langchain.output_parsers import PydanticOutputParser
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain.schema import AIMessage
+from db.data_models import  JobResponseModel, ResumeResponseModel, AnalysisResponseModel, CombinedResponseModel
 
 from db.db_connector import get_database
 from db.dboperations import MongoDBOperationHandler
-from utils.constants import JOBDESC_PARSER,ANALYZER_SYSTEM_PROMPT, RESUME_EXTRACT_PROMPT
+from services.embedding_cache import text_hash
+from services.embedding_matrix import request_rebuild as request_matrix_rebuild
+from services.hybrid_search import JOB_COLLECTION, job_search_fields, request_keyword_rebuild, resume_search_fields
+from services.llm_cache import llm_cache
+from services.vector_index import upsert_resume
+from utils.constants import JOBDESC_PARSER,ANALYZER_SYSTEM_PROMPT, RESUME_EXTRACT_PROMPT, COMBINED_ANALYZER_PROMPT
+# langchain is imported by the chain constructors and runs (chains are built by ModelRegistry), not at `import main`
  
+class AnalysisContext:
+    """ Request-scoped state of the chains: the input texts, the llm json, the content hashes and the
+    ids of the saved documents. The chains only hold the llm, prompt and parser, one instance of each
+    chain serves every request; a request creates its context (or the chain creates one per call)"""
+    def __init__(self, resume_id=None, job_id=None):
+        self.raw_resume = None
+        self.resume_json = None
+        self.resume_id = resume_id
+        self.raw_jobdesc = None
+        self.jobdesc_json = None
+        self.job_id = job_id
+        self.resume_hash = None
+        self.job_hash = None
+        self.match_json = None
+        self.match_id = None
+
 class ResumeParserChain:
     """ Chain for parsing resume""" 
     def __init__(self, llm ):  
+        self.llm = llm
+        from langchain.output_parsers import PydanticOutputParser
+        from langchain.prompts import PromptTemplate
         self.parser = PydanticOutputParser(pydantic_object=ResumeResponseModel)
         # Implementation of document parsing chain 
         prompt =  PromptTemplate(
@@ -23,7 +45,7 @@ class ResumeParserChain:
         self.prompt = prompt         
         self.chain =  (prompt | llm )
 
-    def run(self, resume_data):
+    def run(self, resume_data, context=None):
         """ Returns a dictionary with following
         response : Original response from LLM
         data: dictionary of databse saved items along with db.collection("yourcollection_name")._Id
@@ -31,8 +53,10 @@ class ResumeParserChain:
         """
         try:
             # Run the matching analysis 
-            self.raw_resume = resume_data  
-            response = self.chain.invoke(resume_data)  
+            context = context if context is not None else AnalysisContext()
+            context.raw_resume = resume_data  
+            response = llm_cache.invoke(self.chain, self.prompt, self.llm, resume_data, self.parser.parse)  
+            from langchain.schema import AIMessage
             if isinstance(response, AIMessage):
                 #####print("This is an AIMessage!")
                 #####print("Resume Content:", response.content)
@@ -42,20 +66,22 @@ class ResumeParserChain:
                 response.strip("\n")
             if isinstance(response, str):
                 response = response.strip() 
-            return self.next_steps(response)
+            return self.next_steps(response, context)
         except Exception as e:
             logging.error(f"ResumeParserChain Error: {e}")
             raise
 
-    async def arun(self, resume_data):
+    async def arun(self, resume_data, context=None):
         """ Returns a dictionary with following
         response : Original response from LLM
         data: dictionary of databse saved items along with db.collection("yourcollection_name")._Id        
         """
         try:
             # Run the matching analysis 
-            self.raw_resume = resume_data   
-            response = await self.chain.ainvoke(resume_data)  
+            context = context if context is not None else AnalysisContext()
+            context.raw_resume = resume_data   
+            response = await llm_cache.ainvoke(self.chain, self.prompt, self.llm, resume_data, self.parser.parse)  
+            from langchain.schema import AIMessage
             if isinstance(response, AIMessage):
                 #####print("ResumeParserChain.This is an AIMessage!")
                 #####print("Content:", response.content)
@@ -65,16 +91,17 @@ class ResumeParserChain:
                 response.strip("\n")
             if isinstance(response, str):
                 response = response.strip()  
-            return self.next_steps(response) 
+            # Saving (MongoDB, indexes) is blocking: off the event loop
+            return await asyncio.to_thread(self.next_steps, response, context)
         except Exception as e:
             logging.error(f"ResumeParserChain.Error: {e}")
             raise 
     
-    def next_steps(self, response):
+    def next_steps(self, response, context):
         response = response.strip()
-        self.resume_json = response
+        context.resume_json = response
         ret_data = None
-        self.resume_id = None
+        context.resume_id = None
         response_dict = None
         ret_results =   {"response": response,
                             "data" : ret_data} 
@@ -91,16 +118,16 @@ class ResumeParserChain:
 
         try:
             response_dict['resume_response']=response
-            ret_data = self.save_resume_resonse(response_dict) 
-            self.resume_json = response 
-            if self.resume_id is None :
-                self.resume_id = ret_data.get("resume_id")             
+            ret_data = self.save_resume_resonse(response_dict, context) 
+            context.resume_json = response 
+            if context.resume_id is None :
+                context.resume_id = ret_data.get("resume_id")             
             return {"response": response,
                     "data" : ret_data}
         except Exception   as e:
             logging.error(f"resume: next_steps:Error during saving resume(1) data {e}")
         try:
-            ret_data =self.save_resume_resonse(response)
+            ret_data =self.save_resume_resonse(response, context)
             return {"response": response,
                 "data" : ret_data}
         except Exception as e:
@@ -108,15 +135,22 @@ class ResumeParserChain:
         return {"response": response,
                 "data": ret_data}
 
-    def save_resume_resonse(self, data):
+    def save_resume_resonse(self, data, context):
         """
         Saves parsed resume data to multiple MongoDB collections.
         """
         try: 
-            data['raw_resume'] = self.raw_resume
-            data['resume_json'] = self.resume_json
+            data['raw_resume'] = context.raw_resume
+            data['resume_json'] = context.resume_json
+            # Indexed filter fields of /search-candidates-job/
+            data.update(resume_search_fields(data))
+            # Hash of the normalized text: the same resume uploaded again is found without parsing it
+            data['content_hash'] = text_hash(context.raw_resume)
+            # No null / empty email key: the resume is identified by its content hash
+            if not data.get("email"):
+                data.pop("email", None)
             resume_data = {"collection_name": "resume",
-                           "upsert_identifiers" : { "email" : data.get("email")}, 
+                           "upsert_identifiers" : { "email" : data.get("email")} if data.get("email") else {"content_hash": data['content_hash']}, 
                             "data": data }
             
             data_collection = [resume_data ]
@@ -125,9 +159,13 @@ class ResumeParserChain:
                 objdbservice = MongoDBOperationHandler(db)
                 results = objdbservice.save_data_to_db(data_collection if type(data_collection) == list else [data_collection])
                 if results is not None and len(results)> 0:
-                    self.resume_id = results[0].get("Id")
+                    context.resume_id = results[0].get("Id")
+                    # New or updated resume: refresh the corpus embedding matrix and the candidate index
+                    request_matrix_rebuild("resume")
+                    request_keyword_rebuild("resume")
+                    upsert_resume(context.resume_id, context.raw_resume)
 
-                data['resume_id'] = self.resume_id
+                data['resume_id'] = context.resume_id
         except Exception as e:
             logging.error(f"ResumeParserChain.save_resume_resonse: {e}")
         return data
@@ -137,6 +175,8 @@ class JobDescParserChain:
 
     def __init__(self, llm):
         self.llm =llm
+        from langchain.output_parsers import PydanticOutputParser
+        from langchain.prompts import PromptTemplate
         self.parser = PydanticOutputParser(pydantic_object=JobResponseModel)
         # Implementation of document parsing chain 
         prompt =  PromptTemplate(
@@ -147,11 +187,13 @@ class JobDescParserChain:
         self.prompt = prompt         
         self.chain =  (prompt | self.llm )
 
-    def run(self, job_description):
+    def run(self, job_description, context=None):
         # Run the matching analysis     
         try:
-            self.raw_jobdesc = job_description   
-            response = self.chain.invoke(job_description) 
+            context = context if context is not None else AnalysisContext()
+            context.raw_jobdesc = job_description   
+            response = llm_cache.invoke(self.chain, self.prompt, self.llm, job_description, self.parser.parse) 
+            from langchain.schema import AIMessage
             if isinstance(response, AIMessage):
                 #####print("This is an AIMessage!")
                 #####print("JobDescParserChain Content:", response.content)
@@ -161,16 +203,18 @@ class JobDescParserChain:
                 response.strip("\n")
             if isinstance(response, str):
                 response = response.strip()  
-            return self.next_steps(response)
+            return self.next_steps(response, context)
         except Exception as e:
             logging.error(f"Error: {e}")
             raise
 
-    async def arun(self, job_description):
+    async def arun(self, job_description, context=None):
         # Run the matching analysis     
         try:
-            self.raw_jobdesc = job_description   
-            response = await self.chain.ainvoke(job_description)
+            context = context if context is not None else AnalysisContext()
+            context.raw_jobdesc = job_description   
+            response = await llm_cache.ainvoke(self.chain, self.prompt, self.llm, job_description, self.parser.parse)
+            from langchain.schema import AIMessage
             if isinstance(response, AIMessage):
                 # #####print("JobDescParserChainThis is an AIMessage!")
                 #####print("JobDescParserChain Content:", response.content)
@@ -180,15 +224,15 @@ class JobDescParserChain:
                 response.strip("\n")
             if isinstance(response, str):
                 response = response.strip() 
-            return self.next_steps(response)  
+            return await asyncio.to_thread(self.next_steps, response, context)
         except Exception as e:
             logging.error(f"Error: {e}")
             raise 
 
-    def next_steps(self, response): 
-        self.jobdesc_json = response
+    def next_steps(self, response, context): 
+        context.jobdesc_json = response
         ret_data = None
-        self.job_id =   None 
+        context.job_id =   None 
         ret_results =   {"response": response,
                             "data" : ret_data}
         try:
@@ -203,16 +247,16 @@ class JobDescParserChain:
             logging.error(f"jd: next_steps: Error while parsing output: {e}")
         try:
             response_dict['job_response']=response
-            ret_data = self.save_jobdesc_resonse(response_dict ) 
-            if self.job_id is None :
-                self.job_id = ret_data.get("job_id")
+            ret_data = self.save_jobdesc_resonse(response_dict, context) 
+            if context.job_id is None :
+                context.job_id = ret_data.get("job_id")
             ret_results = {"response": response,
                     "data" : ret_data}
             return ret_results 
         except Exception   as e:
             logging.error(f"job desc next_steps:Error during saving job desc(1) data {e}")
         try:
-            ret_data =self.save_jobdesc_resonse(response)
+            ret_data =self.save_jobdesc_resonse(response, context)
             return {"response": response,
                 "data" : ret_data}
         except Exception as e:
@@ -220,14 +264,19 @@ class JobDescParserChain:
         return {"response": response,
                 "data": ret_data}
     
-    def save_jobdesc_resonse(self, data):
+    def save_jobdesc_resonse(self, data, context):
         try:
             # job_data response
-            data['raw_jobdesc'] = self.raw_jobdesc
-            data['jobdesc_json'] = self.jobdesc_json
-            job_datainfo = {"collection_name": "job",
+            data['raw_jobdesc'] = context.raw_jobdesc
+            data['jobdesc_json'] = context.jobdesc_json
+            # Indexed filter fields of /search-jobs-resume/
+            data.update(job_search_fields(data))
+            data['content_hash'] = text_hash(context.raw_jobdesc)
+            if not data.get("external_job_id"):
+                data.pop("external_job_id", None)
+            job_datainfo = {"collection_name": JOB_COLLECTION,
                             "upsert_identifiers" : { "external_job_id" : data.get("external_job_id")}, 
-                            "primary_key" : "external_job_id",
+                            "primary_key" : "external_job_id" if data.get("external_job_id") else "content_hash",
                             "data": data
                             } 
             data_collection = [job_datainfo] 
@@ -236,8 +285,10 @@ class JobDescParserChain:
               objdbservice = MongoDBOperationHandler(db)
               dbresults  = objdbservice.save_data_to_db(data_collection if type(data_collection) == list else [data_collection])
               if dbresults is not None and len(dbresults)> 0:
-                self.job_id = dbresults[0].get("Id")
-              data['job_id'] = self.job_id
+                context.job_id = dbresults[0].get("Id")
+                request_matrix_rebuild(JOB_COLLECTION)
+                request_keyword_rebuild(JOB_COLLECTION)
+              data['job_id'] = context.job_id
         except Exception as e:
             logging.error(f"save_jobdesc_resonse: {e}")
         return data 
@@ -246,6 +297,8 @@ class AnalyzerChain:
     """ Chain that Matches the resume and jobdescriptions and outputs results"""
     def __init__(self, llm ):
         self.llm = llm   
+        from langchain.output_parsers import PydanticOutputParser
+        from langchain.prompts import PromptTemplate
         self.parser = PydanticOutputParser(pydantic_object=AnalysisResponseModel)
         # Implementation of document parsing chain 
         prompt =  PromptTemplate(
@@ -256,20 +309,26 @@ class AnalyzerChain:
         self.prompt = prompt         
         self.chain =  (prompt | llm )
 
-    def run(self, resume_data, job_description, resume_id=None, job_id=None):        
+    def run(self, resume_data, job_description, resume_id=None, job_id=None, context=None):        
         # Run the matching analysis  
         ret_results = {"response": None,
                             "data" : None}
         try:     
+            context = context if context is not None else AnalysisContext()
             try:
-                self.resume_id = resume_id     
-                self.job_id = job_id  
+                context.resume_id = resume_id     
+                context.job_id = job_id  
+                context.resume_hash = text_hash(resume_data)
+                context.job_hash = text_hash(job_description)
             except Exception as e:
                 #####print(f"Error resume_id({resume_id})/jobid({job_id}) : {e}")  
                 logging.error(f"Error resume_id({resume_id})/jobid({job_id}) : {e}")  
 
-            response = self.chain.invoke(input= {"resume_data": resume_data, "job_description": job_description})
+            response = llm_cache.invoke(self.chain, self.prompt, self.llm,
+                                        {"resume_data": resume_data, "job_description": job_description},
+                                        self.parser.parse)
             #AIMessage
+            from langchain.schema import AIMessage
             if isinstance(response, AIMessage):
                 # #####print("This is an AIMessage!")
                 #####print("Content:", response.content)
@@ -278,25 +337,31 @@ class AnalyzerChain:
                 #####print(f"Response is not an AIMessage. Content: \n {response}")
                 response.strip("\n")
             response = response.strip()   
-            return self.next_steps(response)
+            return self.next_steps(response, context)
         except Exception as e: 
             logging.error(f"Error: {e}")
             raise 
     
-    async def arun(self, resume_data, job_description, resume_id, job_id):        
+    async def arun(self, resume_data, job_description, resume_id=None, job_id=None, context=None):        
         # Run the matching analysis          
         try: 
             response = None    
+            context = context if context is not None else AnalysisContext()
             try: 
-                self.resume_id = resume_id     
-                self.job_id = job_id  
+                context.resume_id = resume_id     
+                context.job_id = job_id  
+                context.resume_hash = text_hash(resume_data)
+                context.job_hash = text_hash(job_description)
                 print(f"\n\nAnalyzerChain-resume_id({resume_id})\n\njobid({job_id})")
             except Exception as e:
                 print(f"\n\nAnalyzerChain-Error resume_id({resume_id})/jobid({job_id}) : {e}")  
                 logging.error(f"Error resume_id({resume_id})/jobid({job_id}) : {e}")  
 
-            response = await self.chain.ainvoke(input= {"resume_data": resume_data, "job_description": job_description})
+            response = await llm_cache.ainvoke(self.chain, self.prompt, self.llm,
+                                               {"resume_data": resume_data, "job_description": job_description},
+                                               self.parser.parse)
             #AIMessage
+            from langchain.schema import AIMessage
             if isinstance(response, AIMessage):
                 print("This is an AIMessage!")
                 #####print("Content:", response.content)
@@ -306,14 +371,14 @@ class AnalyzerChain:
                 response.strip("\n")
             if isinstance(response, str):
                 response = response.strip() 
-            return self.next_steps(response)
+            return await asyncio.to_thread(self.next_steps, response, context)
         except Exception as e: 
             logging.error(f"Error: {e}")
             raise 
 
-    def next_steps(self, response):
+    def next_steps(self, response, context):
         try: 
-            self.match_json = response
+            context.match_json = response
             ret_data = None
             ret_results = {"response": response,
                             "data" : ret_data}            
@@ -330,7 +395,7 @@ class AnalyzerChain:
                 logging.error(f"Error parsing output: {e}")
             try:
                 response_dict['match_response']=response
-                ret_data = self.save_evaluation_results(response_dict)
+                ret_data = self.save_evaluation_results(response_dict, context)
                 ret_results = {"response":  response,
                         "data" : ret_data}
                 return ret_results
@@ -339,7 +404,7 @@ class AnalyzerChain:
                 logging.error(f"Error saving output: {e}")
 
                 try:
-                    ret_data = self.save_evaluation_results(match_model_data.model_dump())
+                    ret_data = self.save_evaluation_results(match_model_data.model_dump(), context)
                     ret_results = {"response":  response,
                         "data" : ret_data}
                     return ret_results
@@ -351,20 +416,23 @@ class AnalyzerChain:
             raise 
         
         
-    def save_evaluation_results(self, result_data):
+    def save_evaluation_results(self, result_data, context):
         try: 
             collection_name =  "jobmatch_result"             
-            if  self.resume_id :
-                result_data["resume_id"] = self.resume_id 
-            if  self.job_id   : 
-                result_data["job_id"] = self.job_id 
-            if self.job_id and self.resume_id:   
+            if  context.resume_id :
+                result_data["resume_id"] = context.resume_id 
+            if  context.job_id   : 
+                result_data["job_id"] = context.job_id 
+            # Content hashes of the pair: a repeated analysis is served from the database
+            result_data["resume_hash"] = context.resume_hash
+            result_data["job_hash"] = context.job_hash
+            if context.job_id and context.resume_id:   
                 upsert_identifiers = {
-                    "resume_id" : self.resume_id,
-                    "job_id" : self.job_id
+                    "resume_id" : context.resume_id,
+                    "job_id" : context.job_id
                 }
             else:
-                upsert_identifiers = {}
+                upsert_identifiers = {"resume_hash": context.resume_hash, "job_hash": context.job_hash}
 
             # Save the result data to the database  
             #####print(f"save_evaluation_results: {result_data}")
@@ -378,8 +446,91 @@ class AnalyzerChain:
               obj_dbservice = MongoDBOperationHandler(db)
               dbresults  = obj_dbservice.save_data_to_db(data_collection if type(data_collection) == list else [data_collection])
             if dbresults is not None and len(dbresults)> 0:
-                self.match_id = dbresults[0].get("Id") 
-            result_data['match_id'] = self.match_id
+                context.match_id = dbresults[0].get("Id") 
+            result_data['match_id'] = context.match_id
             return result_data
         except Exception as e:
             print(f"Error during save_evaluation_results : {e}")   
+
+
+class CombinedAnalyzerChain:
+    """ Chain that parses the resume and the job description and analyzes them in one llm call
+    (LLM_PIPELINE_MODE=combined): the raw texts are sent once instead of twice. The three parts of the
+    response are saved by the next_steps of the per-document chains, as in the three-call pipeline"""
+    # response key -> part
+    PARTS = ("resume", "job_description", "analysis")
+
+    def __init__(self, llm, resume_parser, jobdesc_parser, analyzer):
+        self.llm = llm
+        from langchain.output_parsers import PydanticOutputParser
+        from langchain.prompts import PromptTemplate
+        self.parser = PydanticOutputParser(pydantic_object=CombinedResponseModel)
+        prompt =  PromptTemplate(
+            template= COMBINED_ANALYZER_PROMPT,
+            input_variables=["resume_data", "job_description"],
+            partial_variables={"format_instructions": self.parser.get_format_instructions()}
+        )
+        self.prompt = prompt
+        self.chain =  (prompt | llm )
+        self.resume_parser = resume_parser
+        self.jobdesc_parser = jobdesc_parser
+        self.analyzer = analyzer
+
+    def split_response(self, response):
+        """ (resume json, job description json, analysis json) of a combined response,
+        ValueError when it is not JSON or a part is missing"""
+        try:
+            response_dict = json.loads(response)
+        except Exception:
+            # Fenced or wrapped JSON
+            response_dict = self.parser.parse(response).model_dump()
+        parts = []
+        for key in self.PARTS:
+            if not isinstance(response_dict.get(key), dict):
+                raise ValueError(f"combined response without '{key}'")
+            parts.append(json.dumps(response_dict[key]))
+        return parts
+
+    def start(self, resume_data, job_description, context):
+        context = context if context is not None else AnalysisContext()
+        context.raw_resume = resume_data
+        context.raw_jobdesc = job_description
+        context.resume_hash = text_hash(resume_data)
+        context.job_hash = text_hash(job_description)
+        return context, {"resume_data": resume_data, "job_description": job_description}
+
+    def run(self, resume_data, job_description, context=None):
+        """ Returns {"response": combined llm response, "resume", "job", "analysis": the return values of
+        ResumeParserChain, JobDescParserChain and AnalyzerChain run}"""
+        context, inputs = self.start(resume_data, job_description, context)
+        response = llm_cache.invoke(self.chain, self.prompt, self.llm, inputs, self.split_response).strip()
+        resume_json, jobdesc_json, match_json = self.split_response(response)
+        return {"response": response,
+                "resume": self.resume_parser.next_steps(resume_json, context),
+                "job": self.jobdesc_parser.next_steps(jobdesc_json, context),
+                # Saved last: the match result references the resume and job ids
+                "analysis": self.analyzer.next_steps(match_json, context)}
+
+    async def arun(self, resume_data, job_description, context=None):
+        """ Async run(), the resume and the job description are saved concurrently"""
+        context, inputs = self.start(resume_data, job_description, context)
+        response = (await llm_cache.ainvoke(self.chain, self.prompt, self.llm, inputs,
+                                               self.split_response)).strip()
+        resume_json, jobdesc_json, match_json = self.split_response(response)
+        resume_response, jobdesc_response = await asyncio.gather(
+            asyncio.to_thread(self.resume_parser.next_steps, resume_json, context),
+            asyncio.to_thread(self.jobdesc_parser.next_steps, jobdesc_json, context))
+        return {"response": response,
+                "resume": resume_response,
+                "job": jobdesc_response,
+                "analysis": await asyncio.to_thread(self.analyzer.next_steps, match_json, context)}
+
+
+class AnalyzerChains:
+    """ The chains of an llm, built once (ModelRegistry "analyzer_chains") and shared by the requests"""
+    def __init__(self, llm):
+        self.llm = llm
+        self.resume_parser = ResumeParserChain(llm)
+        self.jobdesc_parser = JobDescParserChain(llm)
+        self.analyzer = AnalyzerChain(llm)
+        self.combined = CombinedAnalyzerChain(llm, self.resume_parser, self.jobdesc_parser, self.analyzer)
@@ -32,9 +32,10 @@ class ExtractResumeTool(StructuredTool):
     args_schema: Type[BaseModel]  = ParseResumeInput 
     llm : Any = None
     resume_parser_chain: Any = None 
-    def __init__(self, llm):
+    def __init__(self, llm, chain=None):
         super().__init__() 
-        self.resume_parser_chain = ResumeParserChain(llm)
+        # chain: a shared ResumeParserChain (AnalyzerChains), built here when not given
+        self.resume_parser_chain = chain if chain is not None else ResumeParserChain(llm)
     
     # def _run(self, inputs: dict, config: dict = None, **kwargs) -> dict: 
     #     return self.resume_parser_chain.run(inputs.get("resume_data"))
@@ -82,10 +83,10 @@ class ExtractJobDescTool(StructuredTool):
     args_schema: Type[BaseModel] = ParseJDInput
     llm : Any = None
     jobdesc_parser_chain: Any = None
-    def __init__(self, llm):
+    def __init__(self, llm, chain=None):
         super().__init__()       
         self.llm = llm 
-        self.jobdesc_parser_chain = JobDescParserChain(self.llm)
+        self.jobdesc_parser_chain = chain if chain is not None else JobDescParserChain(self.llm)
     
     # def _run(self, inputs: dict, config: dict = None, **kwargs) -> dict: 
     #     return self.jobdesc_parser_chain.run(inputs.get("job_description"))
@@ -137,10 +138,10 @@ class AnalyzeResumeJobTool(StructuredTool):
     analyzer_chain: Any = None
     resume_id: Any = None
     job_id: Any = None
-    def __init__(self, llm): 
+    def __init__(self, llm, chain=None): 
         super().__init__()   
         self.llm = llm
-        self.analyzer_chain = AnalyzerChain(self.llm)
+        self.analyzer_chain = chain if chain is not None else AnalyzerChain(self.llm)
     
     # def _run(self, inputs: dict, config: dict = None, **kwargs) -> dict: 
     #     self.resume_id =inputs.get("resume_id") 
@@ -1,27 +1,96 @@
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import asyncio
+import json
 import os
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.document_loaders import TextLoader
-from langchain.document_loaders import UnstructuredFileLoader
+from collections import Counter
+
+import numpy as np
+from bson import json_util
+from bson.objectid import ObjectId
+
+from services.embedding_matrix import resume_matrix
+from services.hybrid_search import hybrid_search, prefilter_ids, resume_keyword_index
+from services.skill_scoring import score_candidates, to_bitset_matrix
+from services.vector_index import get_vector_index
+
+# Number of candidates returned by /search-candidates-job/
+CANDIDATE_TOP_K = int(os.environ.get("CANDIDATE_TOP_K", 10))
+# Weight of the skill coverage in the candidate score, the rest is the embedding similarity
+CANDIDATE_SKILL_WEIGHT = float(os.environ.get("CANDIDATE_SKILL_WEIGHT", 0.3))
+# Candidate documents are returned without the raw text and the llm json
+CANDIDATE_PROJECTION = {"raw_resume": 0, "resume_json": 0}
 
 
 class CandidateFinderAgent:
-    def __init__(self, llm, db):
+    def __init__(self, llm, db, embedding_model=None, skill_matcher=None, top_k=CANDIDATE_TOP_K,
+                 skill_weight=CANDIDATE_SKILL_WEIGHT):
         self.llm = llm
         self.err =[]
         self.db = db
+        self.embedding_model = embedding_model
+        self.skill_matcher = skill_matcher
+        self.top_k = top_k
+        self.skill_weight = skill_weight
+
+    async def find_candidates(self, job_description, top_k=None, filters=None):
+        """ The agent will find the best candidates for the given job description.
+        Hybrid retrieval (services.hybrid_search): nearest resumes in the resume vector index (services.vector_index)
+        and the keyword index, fused by reciprocal rank, over the resumes matching the filters.
+        The nearest resumes are re-scored with the skill coverage of the job (rank_candidates) before the fusion.
+        returns {"candidates": [resume documents with match_score], "errors": []}"""
+        matched_candidates = []
+        try:
+            allowed_ids, query, vector_index, job_skill_counts = await asyncio.gather(
+                asyncio.to_thread(prefilter_ids, self.db, "resume", filters),
+                self.embedding_model.aget_embeddings([job_description]),
+                asyncio.to_thread(get_vector_index, self.embedding_model),
+                asyncio.to_thread(self.get_skill_counts, job_description))
+            hits = await hybrid_search(
+                lambda k, allowed: self.rank_candidates(vector_index.search(query[0], k, allowed), job_skill_counts),
+                resume_keyword_index, job_description, top_k or self.top_k, allowed_ids)
+            matched_candidates = await asyncio.to_thread(self.fetch_candidates, hits)
+        except Exception as e:
+            self.err.append(f"CandidateFinderAgent.find_candidates: {e}")
+        return {"candidates": matched_candidates,
+                "errors": self.err}
+
+    def get_skill_counts(self, text):
+        """ {skill id: number of mentions} of the taxonomy skills in the job description"""
+        if self.skill_matcher is None:
+            return {}
+        return dict(Counter(self.skill_matcher.find_mentions(text)))
+
+    def rank_candidates(self, hits, job_skill_counts):
+        """ (resume id, score) hits re-scored, best first:
+        score = (1 - skill_weight) * cosine similarity + skill_weight * weighted share of the job skills in the resume,
+        for all the hits in one vectorized call (services.skill_scoring.score_candidates). The resume skill ids
+        come from the resume matrix sidecars; resumes saved since its last build have no skills yet"""
+        if not hits or not self.skill_weight or not job_skill_counts:
+            return hits
+        snapshot = resume_matrix.get(self.embedding_model.model_name)
+        if snapshot is None or "skill_counts.npy" not in snapshot["sidecars"]:
+            return hits
+        skill_id_lists = resume_matrix.skill_id_lists(snapshot, [resume_id for resume_id, _ in hits])
+        vocabulary_size = self.skill_matcher.vocabulary_size
+        coverage = score_candidates(to_bitset_matrix(skill_id_lists, vocabulary_size),
+                                    list(job_skill_counts), weights=job_skill_counts)["coverage"]
+        scores = (1 - self.skill_weight) * np.asarray([score for _, score in hits], dtype=np.float32)
+        scores += self.skill_weight * coverage
+        order = np.argsort(-scores, kind="stable")
+        return [(hits[row][0], float(scores[row])) for row in order]
+
+    def fetch_candidates(self, hits):
+        """ Resume documents of the (resume id, score) hits in score order, one query by _id"""
+        if not hits:
+            return []
+        object_ids = [ObjectId(resume_id) if ObjectId.is_valid(resume_id) else resume_id for resume_id, _ in hits]
+        docs = {str(doc["_id"]): doc
+                for doc in self.db.get_collection("resume").find({"_id": {"$in": object_ids}}, CANDIDATE_PROJECTION)}
         candidates = []
-        # text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,
-        #                                        chunk_overlap=200)
-        # splits = text_splitter.split_documents(candidates)
-        # vectorstore = FAISS.from_documents(documents=splits,
-        #                                     embedding=OpenAIEmbeddings())  # first use of Open AI here to create vectors, aka embeddings for splits
-        # retriever = vectorstore.as_retriever()
-
-
-    def find_candidates(self, job_description): 
-        """ The agent will find the best candidates for the given job description. """
-        matched_candidates = [] 
-        return matched_candidates 
\ No newline at end of file
+        for resume_id, score in hits:
+            doc = docs.get(resume_id)
+            if doc is None:
+                continue
+            doc["match_score"] = round(score * 100, 2)
+            candidates.append(doc)
+        return json.loads(json_util.dumps(candidates))
@@ -1,10 +1,22 @@
+import asyncio
 import re
-from sklearn.metrics.pairwise import cosine_similarity
-from models.similarity_model import cosine_similarity as ms_cosine_similarity
+from models.similarity_model import similarity_matrix
+from models.tfidf_model import tfidf_cosine_scores
+from services.skill_scoring import score_skill_sets
 from services.extractor import (extract_sections_from_resume_text, 
                            extract_entities,
+                           extract_entities_batch,
                            combine_lists,
                            get_list_keywords) 
+
+def _pipe_kwargs(batch_size, n_process):
+    kwargs = {}
+    if batch_size is not None:
+        kwargs["batch_size"] = batch_size
+    if n_process is not None:
+        kwargs["n_process"] = n_process
+    return kwargs
+
 class ResumeParserService:
     """ USing Regex and other tooks extract sections of the resume
     Resume Extraction: Contact(name, phone, email), summary, skills, experience, education 
@@ -14,8 +26,9 @@ class ResumeParserService:
         self.__nlp_tool = nlp_tool
         self.err = []
         pass
-    def parse_resume(self, raw_resume):
-        """ returns the dict({resume sections})"""
+    def parse_resume(self, raw_resume, entities=None):
+        """ returns the dict({resume sections})
+        entities: (tokens, entities, error) already extracted in a batch, extracted here when None"""
         self.raw_resume = raw_resume
         # return all Sections
         self._resume_sections =  extract_sections_from_resume_text(self.raw_resume)
@@ -23,7 +36,11 @@ class ResumeParserService:
         self.li_resume_skills = get_list_keywords(self._resume_sections.get("skills"))
 
         #step 1b : extract all resume tokens, ner_entities
-        tokens_skill, ner_entities_skill, self.err = extract_entities(self.raw_resume, self.__nlp_tool)
+        if entities is None:
+            entities = extract_entities(self.raw_resume, self.__nlp_tool)
+        tokens_skill, ner_entities_skill, self.err = entities
+        # Canonical taxonomy skill ids (empty when no skill matcher is configured)
+        self.skill_ids = ner_entities_skill.get("skill_ids", [])
 
         # Combine all the Spacy -NER tokens 
         self.combo_skills = combine_lists([self.li_resume_skills, 
@@ -38,11 +55,21 @@ class ResumeParserService:
                              },
                 "skills": self._resume_sections.get("skills"),
                 "additional_kwds": self.combo_skills}
+
+    def parse_resumes(self, raw_resumes, batch_size=None, n_process=None):
+        """ Bulk parse_resume: entities of all resumes are extracted in one nlp.pipe stream"""
+        raw_resumes = list(raw_resumes)
+        batch_entities = extract_entities_batch(raw_resumes, self.__nlp_tool, **_pipe_kwargs(batch_size, n_process))
+        return [self.parse_resume(raw_resume, entities) for raw_resume, entities in zip(raw_resumes, batch_entities)]
     
     def get_list_skills(self):
         """returns a a set of all skills extracted from skill section""" 
         return list(set(self.li_resume_skills))
     
+    def get_skill_ids(self):
+        """returns sorted taxonomy skill ids found in the resume"""
+        return self.skill_ids
+
     def get_combined_skills(self):
         """returns a a set of all skills extracted from skill section using regex and NER tools
         May not be accurate """
@@ -58,10 +85,16 @@ class JDParserService:
         self.err = []
         pass
 
-    def parse_jobdesc(self, raw_jobdesc):
-        """ return list of keywords that are matched using nlp : skills, education, organizations"""
+    def parse_jobdesc(self, raw_jobdesc, entities=None):
+        """ return list of keywords that are matched using nlp : skills, education, organizations
+        entities: (tokens, entities, error) already extracted in a batch, extracted here when None"""
         self.raw_jobdesc = raw_jobdesc
-        tokens_jobreq, ner_entities_jobreq, self.err = extract_entities(self.raw_jobdesc, self.__nlp_tool)
+        if entities is None:
+            entities = extract_entities(self.raw_jobdesc, self.__nlp_tool)
+        tokens_jobreq, ner_entities_jobreq, self.err = entities
+        self.skill_ids = ner_entities_jobreq.get("skill_ids", [])
+        # Mentions per skill, used as the importance weight of each required skill
+        self.skill_counts = ner_entities_jobreq.get("skill_counts", {})
         
         # Combine all the Spacy -NER tokens 
         self.jdkeywords = combine_lists([ner_entities_jobreq.get("skills",[]),
@@ -69,13 +102,27 @@ class JDParserService:
                                       ner_entities_jobreq.get("organizations",[])])
         return {"job_description" : raw_jobdesc,
                 "keywords" : self.jdkeywords}
+
+    def parse_jobdescs(self, raw_jobdescs, batch_size=None, n_process=None):
+        """ Bulk parse_jobdesc: entities of all job descriptions are extracted in one nlp.pipe stream"""
+        raw_jobdescs = list(raw_jobdescs)
+        batch_entities = extract_entities_batch(raw_jobdescs, self.__nlp_tool, **_pipe_kwargs(batch_size, n_process))
+        return [self.parse_jobdesc(raw_jobdesc, entities) for raw_jobdesc, entities in zip(raw_jobdescs, batch_entities)]
     
     def get_keywords(self):
         return self.jdkeywords
+
+    def get_skill_ids(self):
+        """returns sorted taxonomy skill ids required by the job description"""
+        return self.skill_ids
+
+    def get_skill_counts(self):
+        """returns {skill_id: number of mentions} in the job description"""
+        return self.skill_counts
     
 
 class MatchKeywordsService:    
-    """ Get Keword Matching Score : use vectorizer to get Cosine Similarity between Keywords from Job Description against Skills from Resume
+    """ Get Keword Matching Score : overlap of the taxonomy skill ids of the Job Description against the Resume (services.skill_scoring)
         Get Semantic Matching score:  use Embeddings to see the semantic matcing score.
     """
     def __init__(self, nlp_tool, vectorizer, embedding_model):
@@ -86,18 +133,29 @@ class MatchKeywordsService:
         pass
     
     def match_skills(self, raw_resume, raw_jobdesc): 
+        self.__parse_documents(raw_resume, raw_jobdesc)
+        return self.__calculate_scores()
+
+    async def amatch_skills(self, raw_resume, raw_jobdesc):
+        """ match_skills for the API: the nlp parse runs in a thread while the embeddings are computed
+        by the embedding model's micro-batcher, shared with other concurrent requests"""
+        _, embeddings = await asyncio.gather(asyncio.to_thread(self.__parse_documents, raw_resume, raw_jobdesc),
+                                             self.__embedding_model.aget_embeddings([raw_resume, raw_jobdesc]))
+        return self.__calculate_scores(embeddings)
+
+    def __parse_documents(self, raw_resume, raw_jobdesc):
         self.raw_resume = raw_resume
         self.raw_jobdesc = raw_jobdesc
+        # Resume and job description go through the nlp pipeline together
+        resume_entities, jobdesc_entities = extract_entities_batch([self.raw_resume, self.raw_jobdesc], self.__nlp_tool)
         self.__resume_parser = ResumeParserService(self.__nlp_tool)
-        self.sections= self.__resume_parser.parse_resume(self.raw_resume )
+        self.sections= self.__resume_parser.parse_resume(self.raw_resume, resume_entities)
         self.resume_skills =self.__resume_parser.get_list_skills()
         self.__jobdesc_parser = JDParserService(self.__nlp_tool)
-        self.jdkeywords= self.__jobdesc_parser.parse_jobdesc(self.raw_jobdesc)
-
-        return self.__calculate_scores()
+        self.jdkeywords= self.__jobdesc_parser.parse_jobdesc(self.raw_jobdesc, jobdesc_entities)
     
     def get_resume_sections(self):
-        self.__resume_parser._resume_sections
+        return self.__resume_parser._resume_sections
     def get_resume_skills_kwds(self):
         """ returns resume skills and keywords extracted from resume."""
         return self.__resume_parser.get_combined_skills()
@@ -106,30 +164,41 @@ class MatchKeywordsService:
         return self.__resume_parser.get_list_skills()
     def get_jobdesckwds(self): 
         return self.__jobdesc_parser.get_keywords()
+    def get_resume_skill_ids(self):
+        return self.__resume_parser.get_skill_ids()
+    def get_jobdesc_skill_ids(self):
+        return self.__jobdesc_parser.get_skill_ids()
 
 
-    def __calculate_scores(self):
+    def __calculate_scores(self, embeddings=None):
+        self.__match_percentage = 0.0
+        self.__skill_scores = {"overlap": 0, "jaccard": 0.0, "coverage": 0.0, "matched_ids": []}
         try:
-            # #####print("Combo Skills:")
-            # #####print(self.__resume_parser.get_combined_skills()) 
-            docs = []
-            docs.append(", ".join(self.__resume_parser.get_combined_skills()))
-
-            # #####print("self.jdkeywords:")
-            # #####print(self.jdkeywords)
-            docs.append(", ".join(self.jdkeywords))
-            # #####print(docs)
-            vectors = self.__vectorizer.get_embedding(docs)
-            cos_sim = cosine_similarity(vectors)[0][1]
-            self.__match_percentage = round(cos_sim * 100, 2) 
+            # Exact match: share of the job's taxonomy skills found in the resume,
+            # each skill weighted by how often the job description mentions it
+            self.__skill_scores = score_skill_sets(self.__resume_parser.get_skill_ids(),
+                                                   self.__jobdesc_parser.get_skill_ids(),
+                                                   weights=self.__jobdesc_parser.get_skill_counts())
+            self.__match_percentage = round(self.__skill_scores["coverage"] * 100, 2) 
         except Exception as e:
             print(f"Error calculating match percentage: {e}")
 
-        resume_embedding = self.__embedding_model.get_embedding(self.raw_resume)
-        job_embedding = self.__embedding_model.get_embedding(self.raw_jobdesc)  
-        
-        self.__ms_cs_score= round(ms_cosine_similarity(resume_embedding, job_embedding)*100,2)
-        self.__similarity_score = round((cosine_similarity([resume_embedding.cpu().numpy()], [job_embedding.cpu().numpy()])[0][0])*100,2)
+        self.__tfidf_score = 0.0
+        try:
+            # Keyword similarity with the corpus-fitted TF-IDF model (transform only, rows are L2-normalized)
+            vectors = self.__vectorizer.get_embedding([self.raw_resume, self.raw_jobdesc])
+            self.__tfidf_score = round(float(tfidf_cosine_scores(vectors[0], vectors[1])[0][0]) * 100, 2)
+        except Exception as e:
+            self.err.append(f"MatchKeywordsService.tfidf_score: {e}")
+
+        # One batched encode for resume and job description, normalized float32 rows
+        if embeddings is None:
+            embeddings = self.__embedding_model.get_embeddings([self.raw_resume, self.raw_jobdesc])
+        # Single dot-product kernel: rows are normalized so this is the cosine similarity
+        similarity = float(similarity_matrix(embeddings[:1], embeddings[1:])[0][0])
+        self.__similarity_score = round(similarity*100,2)
+        # ms_cs_score was the same cosine computed a second way, kept for API compatibility
+        self.__ms_cs_score= self.__similarity_score
         
         #####print(f"exact_match {self.__match_percentage:.2f}"),
         #####print(f"similarity_score {self.__similarity_score:.2f}") 
@@ -139,6 +208,9 @@ class MatchKeywordsService:
     
     def get_scores(self):
         return {"exact_match": f"{self.__match_percentage:.2f}",
+                "skill_overlap": self.__skill_scores["overlap"],
+                "skill_jaccard": f"{self.__skill_scores['jaccard'] * 100:.2f}",
+                "tfidf_score": f"{self.__tfidf_score:.2f}",
                 "similarity_score" : f"{self.__similarity_score:.2f}", 
                 "ms_cs_score": f"{self.__ms_cs_score:.2f}"} 
 
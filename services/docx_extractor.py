@@ -0,0 +1,66 @@
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+# WordprocessingML namespace used by word/document.xml
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY = f"{W_NS}body"
+W_P = f"{W_NS}p"
+W_R = f"{W_NS}r"
+W_T = f"{W_NS}t"
+W_TAB = f"{W_NS}tab"
+W_PTAB = f"{W_NS}ptab"
+W_BR = f"{W_NS}br"
+W_CR = f"{W_NS}cr"
+W_NO_BREAK_HYPHEN = f"{W_NS}noBreakHyphen"
+W_TYPE = f"{W_NS}type"
+
+
+def iter_docx_paragraphs(source):
+    """ Stream the paragraphs of a .docx (path or binary file object) in document order.
+    Reads word/document.xml with iterparse, without building a python-docx Document.
+    Unlike Document.paragraphs this also yields the paragraphs inside tables (and text boxes).
+    """
+    with zipfile.ZipFile(source) as archive:
+        with archive.open("word/document.xml") as xml_file:
+            # Text parts of the open paragraphs, nested when a text box sits inside a paragraph
+            paragraphs = []
+            run_depth = 0
+            depth = 0
+            body = None
+            for event, elem in iterparse(xml_file, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    depth += 1
+                    if tag == W_P:
+                        paragraphs.append([])
+                    elif tag == W_R:
+                        run_depth += 1
+                    elif tag == W_BODY:
+                        body = elem
+                    continue
+
+                depth -= 1
+                if tag == W_P:
+                    yield "".join(paragraphs.pop())
+                elif tag == W_R:
+                    run_depth -= 1
+                elif paragraphs and run_depth:
+                    # Same run content as python-docx Run.text
+                    if tag == W_T:
+                        paragraphs[-1].append(elem.text or "")
+                    elif tag in (W_TAB, W_PTAB):
+                        paragraphs[-1].append("\t")
+                    elif tag == W_BR:
+                        if elem.get(W_TYPE, "textWrapping") == "textWrapping":
+                            paragraphs[-1].append("\n")
+                    elif tag == W_CR:
+                        paragraphs[-1].append("\n")
+                    elif tag == W_NO_BREAK_HYPHEN:
+                        paragraphs[-1].append("-")
+                # Drop every finished top level block (paragraph, table) so memory stays flat
+                if body is not None and depth == 2:
+                    body.clear()
+
+def extract_docx_text(source):
+    """ Text of a .docx with one line per paragraph, same contract as joining python-docx paragraph.text + "\\n" """
+    return "".join([paragraph + "\n" for paragraph in iter_docx_paragraphs(source)])
@@ -0,0 +1,262 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# In-process LRU entries and the optional persistent tier: none, npy or mongo
+EMBEDDING_CACHE_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_ENTRIES", 4096))
+EMBEDDING_CACHE_BACKEND = os.environ.get("EMBEDDING_CACHE_BACKEND", "none").lower()
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", os.path.join("data", "embedding_cache"))
+# Vectors buffered in memory before the npy tier writes them out as one shard
+EMBEDDING_CACHE_SHARD_SIZE = int(os.environ.get("EMBEDDING_CACHE_SHARD_SIZE", 256))
+EMBEDDING_CACHE_COLLECTION = "embedding_cache"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """ NFC, trimmed, whitespace runs collapsed: the same document re-uploaded or re-extracted
+    gets the same key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+def text_hash(text):
+    """ Hex SHA-256 of the normalized text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class NpyEmbeddingStore:
+    """ Append-only shards under directory/<model name>/: shard-*.npy holds float32 rows
+    (memory-mapped on read) and a shard-*.json sidecar lists the text hash of each row.
+    New vectors are buffered and written as a shard every shard_size vectors (and on flush).
+    Shards written by other worker processes are picked up when the directory changes.
+    """
+    def __init__(self, directory=EMBEDDING_CACHE_DIR, shard_size=EMBEDDING_CACHE_SHARD_SIZE):
+        self.directory = directory
+        self.shard_size = shard_size
+        self._lock = threading.Lock()
+        # model name -> {text hash: (memmap, row)}
+        self._rows = {}
+        self._seen_shards = {}
+        self._dir_mtime = {}
+        # model name -> {text hash: vector} not yet written
+        self._pending = {}
+
+    def _model_dir(self, model_name):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        return os.path.join(self.directory, safe_name)
+
+    def _scan(self, model_name):
+        """ mmap shards of model_name not seen yet"""
+        directory = self._model_dir(model_name)
+        if not os.path.isdir(directory):
+            return
+        mtime = os.path.getmtime(directory)
+        if self._dir_mtime.get(model_name) == mtime:
+            return
+        self._dir_mtime[model_name] = mtime
+        rows = self._rows.setdefault(model_name, {})
+        seen = self._seen_shards.setdefault(model_name, set())
+        for keys_path in sorted(glob.glob(os.path.join(directory, "shard-*.json"))):
+            if keys_path in seen:
+                continue
+            try:
+                with open(keys_path, "r", encoding="utf-8") as file:
+                    keys = json.load(file)
+                vectors = np.load(keys_path[:-len(".json")] + ".npy", mmap_mode="r")
+            except (OSError, ValueError) as e:
+                # Sidecar is written last, a shard being written by another process is skipped
+                logging.error(f"NpyEmbeddingStore: skipping {keys_path}: {e}")
+                continue
+            seen.add(keys_path)
+            for row, key in enumerate(keys):
+                rows[key] = (vectors, row)
+
+    def get_many(self, model_name, keys):
+        """ {key: vector} of the keys found"""
+        found = {}
+        with self._lock:
+            pending = self._pending.get(model_name, {})
+            rows = self._rows.get(model_name, {})
+            if any(key not in pending and key not in rows for key in keys):
+                self._scan(model_name)
+                rows = self._rows.get(model_name, {})
+            for key in keys:
+                if key in pending:
+                    found[key] = pending[key]
+                elif key in rows:
+                    vectors, row = rows[key]
+                    found[key] = np.array(vectors[row], dtype=np.float32)
+        return found
+
+    def set_many(self, model_name, vectors):
+        with self._lock:
+            pending = self._pending.setdefault(model_name, {})
+            pending.update(vectors)
+            if len(pending) >= self.shard_size:
+                self._write_shard(model_name)
+
+    def flush(self):
+        with self._lock:
+            for model_name in list(self._pending):
+                self._write_shard(model_name)
+
+    def _write_shard(self, model_name):
+        pending = self._pending.pop(model_name, {})
+        if not pending:
+            return
+        directory = self._model_dir(model_name)
+        os.makedirs(directory, exist_ok=True)
+        keys = list(pending)
+        matrix = np.stack([pending[key] for key in keys]).astype(np.float32, copy=False)
+        name = f"shard-{time.time_ns()}-{os.getpid()}"
+        # Write both files under temp names then rename, the .json sidecar last
+        for suffix, write in ((".npy", lambda file: np.save(file, matrix)),
+                              (".json", lambda file: file.write(json.dumps(keys).encode("utf-8")))):
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                write(file)
+            os.replace(temp_path, os.path.join(directory, name + suffix))
+        rows = self._rows.setdefault(model_name, {})
+        vectors = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+        for row, key in enumerate(keys):
+            rows[key] = (vectors, row)
+        self._seen_shards.setdefault(model_name, set()).add(os.path.join(directory, name + ".json"))
+
+
+class MongoEmbeddingStore:
+    """ Documents {_id: "<model name>:<text hash>", model, dim, vector: BSON Binary of float32}
+    in the embedding_cache collection"""
+    def __init__(self, db, collection_name=EMBEDDING_CACHE_COLLECTION):
+        self.collection = db.get_collection(collection_name)
+
+    def get_many(self, model_name, keys):
+        found = {}
+        ids = [f"{model_name}:{key}" for key in keys]
+        for doc in self.collection.find({"_id": {"$in": ids}}, {"vector": 1}):
+            found[doc["_id"].split(":", 1)[1]] = np.frombuffer(doc["vector"], dtype=np.float32).copy()
+        return found
+
+    def set_many(self, model_name, vectors):
+        from bson.binary import Binary
+        from pymongo import UpdateOne
+        operations = [UpdateOne({"_id": f"{model_name}:{key}"},
+                                {"$set": {"model": model_name, "dim": int(vector.shape[0]),
+                                          "vector": Binary(np.asarray(vector, dtype=np.float32).tobytes())}},
+                                upsert=True)
+                      for key, vector in vectors.items()]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def flush(self):
+        pass
+
+
+class EmbeddingCache:
+    """ Cache of normalized float32 embeddings keyed by (model name, normalized text hash).
+    First tier is an in-process LRU, second tier (optional) is a NpyEmbeddingStore or MongoEmbeddingStore.
+    """
+    def __init__(self, max_entries=EMBEDDING_CACHE_ENTRIES, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model_name, texts):
+        """ {text hash: vector} of the texts already embedded by model_name"""
+        keys = list(dict.fromkeys(text_hash(text) for text in texts))
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get((model_name, key))
+                if vector is not None:
+                    self._entries.move_to_end((model_name, key))
+                    found[key] = vector
+        missing = [key for key in keys if key not in found]
+        if missing and self.store is not None:
+            try:
+                stored = self.store.get_many(model_name, missing)
+            except Exception as e:
+                logging.error(f"EmbeddingCache.get_many: {e}")
+                stored = {}
+            self._remember(model_name, stored)
+            found.update(stored)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, model_name, vectors):
+        """ vectors: {text hash: vector}"""
+        if not vectors:
+            return
+        self._remember(model_name, vectors)
+        if self.store is not None:
+            try:
+                self.store.set_many(model_name, vectors)
+            except Exception as e:
+                logging.error(f"EmbeddingCache.set_many: {e}")
+
+    def get_embeddings(self, model_name, texts, embed_func):
+        """ Embeddings of texts (len(texts) x dim), only texts not cached are passed to embed_func
+        in one batch. embed_func: list of texts -> normalized float32 rows"""
+        texts = list(texts)
+        keys = [text_hash(text) for text in texts]
+        found = self.get_many(model_name, texts)
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            first_text = {}
+            for key, text in zip(keys, texts):
+                first_text.setdefault(key, text)
+            computed = embed_func([first_text[key] for key in missing])
+            new_vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, computed)}
+            self.set_many(model_name, new_vectors)
+            found.update(new_vectors)
+        return np.stack([found[key] for key in keys])
+
+    def _remember(self, model_name, vectors):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._entries[(model_name, key)] = vector
+                self._entries.move_to_end((model_name, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def flush(self):
+        """ Write buffered vectors of the persistent tier, called at app shutdown"""
+        if self.store is not None:
+            try:
+                self.store.flush()
+            except Exception as e:
+                logging.error(f"EmbeddingCache.flush: {e}")
+
+    def configure_store(self, backend=EMBEDDING_CACHE_BACKEND):
+        """ Attach the persistent tier configured by EMBEDDING_CACHE_BACKEND (none, npy or mongo).
+        Called at app startup so no database connection is opened at import time"""
+        try:
+            if backend == "npy":
+                self.store = NpyEmbeddingStore()
+            elif backend == "mongo":
+                from db.db_connector import get_database
+                self.store = MongoEmbeddingStore(get_database())
+            else:
+                self.store = None
+        except Exception as e:
+            logging.error(f"EmbeddingCache.configure_store: {backend} tier disabled: {e}")
+            self.store = None
+
+# Create a global instance
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,381 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from services.embedding_cache import text_hash
+from services.hybrid_search import JOBSLIST
+from utils.file_lock import lock_file
+
+# Corpus embedding matrices, one directory per matrix:
+#   <name>/CURRENT                      version in use, replaced atomically on rebuild
+#   <name>/<version>/matrix.npy         (rows x dim) float32 or float16, memory-mapped read-only
+#   <name>/<version>/ids.json           Mongo _id (str) of each row
+#   <name>/<version>/hashes.json        hash of the embedded text of each row (rows reused by the next build)
+#   <name>/<version>/manifest.json      embedding model, dtype, rows, dim, build time
+EMBEDDING_MATRIX_DIR = os.environ.get("EMBEDDING_MATRIX_DIR", os.path.join("data", "embedding_matrix"))
+EMBEDDING_MATRIX_DTYPE = os.environ.get("EMBEDDING_MATRIX_DTYPE", "float32")
+# Ingest requests within this many seconds are coalesced into one rebuild
+EMBEDDING_MATRIX_REBUILD_DELAY = float(os.environ.get("EMBEDDING_MATRIX_REBUILD_DELAY", 10))
+EMBEDDING_MATRIX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MATRIX_BATCH_SIZE", 256))
+# How often readers check CURRENT for a version built by another process
+EMBEDDING_MATRIX_RELOAD_SECONDS = float(os.environ.get("EMBEDDING_MATRIX_RELOAD_SECONDS", 5))
+JOBSLIST_TEXT_FIELD = os.environ.get("JOBSLIST_TEXT_FIELD", "raw_jobdesc")
+# Versions kept on disk: the current one and the previous one (still mapped by slow readers)
+EMBEDDING_MATRIX_KEEP_VERSIONS = 2
+
+
+class EmbeddingMatrix:
+    """ Embeddings of every document of a collection as one memory-mapped matrix. All worker processes
+    map the same file read-only, so the pages are held once by the OS page cache.
+    Rows are L2-normalized: scores of a query are one matrix-vector product.
+    """
+    def __init__(self, name, collection_name, text_field, directory=EMBEDDING_MATRIX_DIR,
+                 dtype=EMBEDDING_MATRIX_DTYPE):
+        self.name = name
+        self.collection_name = collection_name
+        self.text_field = text_field
+        self.directory = os.path.join(directory, name)
+        self.dtype = np.dtype(dtype)
+        # {matrix, ids, manifest, sidecars} of the mapped version, replaced as one reference
+        self._snapshot = None
+        self._version = None
+        self._last_check = 0.0
+        self._rebuild_timer = None
+        # Set by request_rebuild, cleared when a build starts: a request during a build is not lost
+        self._rebuild_pending = False
+        self._rebuild_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.directory, "CURRENT"), "r") as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """ Map the current version, returns False when none has been built yet"""
+        version = self._current_version()
+        self._last_check = time.monotonic()
+        if version is None:
+            return False
+        if version == self._version:
+            return True
+        version_dir = os.path.join(self.directory, version)
+        with open(os.path.join(version_dir, "manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        with open(os.path.join(version_dir, "ids.json"), "r", encoding="utf-8") as file:
+            ids = json.load(file)
+        matrix = np.load(os.path.join(version_dir, "matrix.npy"), mmap_mode="r")[:manifest["rows"]]
+        sidecars = {file_name: np.load(os.path.join(version_dir, file_name), mmap_mode="r")
+                    for file_name in manifest.get("sidecars", [])}
+        self._snapshot = {"matrix": matrix, "ids": ids, "manifest": manifest, "sidecars": sidecars}
+        self._version = version
+        return True
+
+    def _reload_if_changed(self):
+        if time.monotonic() - self._last_check < EMBEDDING_MATRIX_RELOAD_SECONDS:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            logging.error(f"EmbeddingMatrix({self.name}).load: {e}")
+
+    def get(self, model_name=None):
+        """ {matrix, ids, manifest, sidecars} of the current version, a consistent snapshot.
+        None when not built yet, or built with another embedding model than model_name"""
+        self._reload_if_changed()
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        if model_name is not None and snapshot["manifest"].get("model_name") != model_name:
+            return None
+        return snapshot
+
+    @staticmethod
+    def row_mask(snapshot, ids):
+        """ Boolean mask of the rows of ids in a snapshot (ids not in it are skipped)"""
+        if "row_of" not in snapshot:
+            # Built on first use, kept with the snapshot
+            snapshot["row_of"] = {row_id: row for row, row_id in enumerate(snapshot["ids"])}
+        row_of = snapshot["row_of"]
+        mask = np.zeros(len(snapshot["ids"]), dtype=bool)
+        mask[[row_of[row_id] for row_id in ids if row_id in row_of]] = True
+        return mask
+
+    def version_dir(self, version=None):
+        return os.path.join(self.directory, version or self._version)
+
+    def _reusable_rows(self, embedding_model):
+        """ {matrix, row_of, hashes} of the current version when it was built with embedding_model,
+        None otherwise: its rows of unchanged documents are copied instead of embedded again"""
+        try:
+            self.load()
+        except Exception as e:
+            logging.error(f"EmbeddingMatrix({self.name}).load: {e}")
+        snapshot = self._snapshot
+        if snapshot is None or snapshot["manifest"].get("model_name") != embedding_model.model_name:
+            return None
+        try:
+            with open(os.path.join(self.version_dir(), "hashes.json"), "r", encoding="utf-8") as file:
+                hashes = json.load(file)
+        except FileNotFoundError:
+            # Version built before the text hashes were saved
+            return None
+        return {"matrix": snapshot["matrix"], "hashes": hashes,
+                "row_of": {row_id: row for row, row_id in enumerate(snapshot["ids"])}}
+
+    def build(self, db, embedding_model, sidecars=None, fields=None):
+        """ Build a new version of the collection and swap it in. Returns the number of rows.
+        Only new or changed documents are embedded, the rows of the others are copied from the current version.
+        sidecars: {file name: function(list of docs) -> array} extra arrays saved as .npy next to the
+        matrix, the arrays of all batches are concatenated. fields: document fields they read"""
+        sidecars = sidecars or {}
+        previous = self._reusable_rows(embedding_model)
+        collection = db.get_collection(self.collection_name)
+        query = {self.text_field: {"$type": "string"}}
+        projection = {self.text_field: 1, **{field: 1 for field in fields or []}}
+        capacity = collection.count_documents(query)
+        version = f"{int(time.time() * 1000)}-{os.getpid()}"
+        version_dir = os.path.join(self.directory, version)
+        os.makedirs(version_dir, exist_ok=True)
+        matrix = None
+        ids = []
+        hashes = []
+        counts = {"embedded": 0, "reused": 0}
+        sidecar_parts = {file_name: [] for file_name in sidecars}
+        batch = []
+
+        def flush(batch, matrix):
+            batch_ids = [str(doc["_id"]) for doc in batch]
+            batch_hashes = [text_hash(doc[self.text_field]) for doc in batch]
+            # Row of the current version holding the same text, None: embed it
+            reused_rows = [None] * len(batch)
+            if previous is not None:
+                for position, (doc_id, doc_hash) in enumerate(zip(batch_ids, batch_hashes)):
+                    row = previous["row_of"].get(doc_id)
+                    if row is not None and previous["hashes"][row] == doc_hash:
+                        reused_rows[position] = row
+            embed_positions = [position for position, row in enumerate(reused_rows) if row is None]
+            embeddings = None
+            if embed_positions:
+                embeddings = embedding_model.get_embeddings([batch[position][self.text_field]
+                                                             for position in embed_positions])
+            if matrix is None:
+                dim = embeddings.shape[1] if embeddings is not None else previous["matrix"].shape[1]
+                matrix = np.lib.format.open_memmap(os.path.join(version_dir, "matrix.npy"), mode="w+",
+                                                   dtype=self.dtype, shape=(max(capacity, 1), dim))
+            start = len(ids)
+            if embeddings is not None:
+                matrix[start + np.asarray(embed_positions)] = embeddings.astype(self.dtype, copy=False)
+            reuse_positions = [position for position, row in enumerate(reused_rows) if row is not None]
+            if reuse_positions:
+                previous_rows = np.asarray([reused_rows[position] for position in reuse_positions])
+                matrix[start + np.asarray(reuse_positions)] = np.asarray(previous["matrix"][previous_rows],
+                                                                         dtype=self.dtype)
+            counts["embedded"] += len(embed_positions)
+            counts["reused"] += len(reuse_positions)
+            ids.extend(batch_ids)
+            hashes.extend(batch_hashes)
+            for file_name, func in sidecars.items():
+                sidecar_parts[file_name].append(func(batch))
+            return matrix
+
+        try:
+            # Documents inserted while building are beyond capacity: they go in the next rebuild
+            for doc in collection.find(query, projection).limit(capacity) if capacity else []:
+                batch.append(doc)
+                if len(batch) >= EMBEDDING_MATRIX_BATCH_SIZE:
+                    matrix = flush(batch, matrix)
+                    batch = []
+            if batch:
+                matrix = flush(batch, matrix)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(os.path.join(version_dir, "matrix.npy"), mode="w+",
+                                                   dtype=self.dtype, shape=(1, 1))
+            matrix.flush()
+            del matrix
+            for file_name, parts in sidecar_parts.items():
+                np.save(os.path.join(version_dir, file_name), np.concatenate(parts) if parts else np.zeros(0))
+            with open(os.path.join(version_dir, "ids.json"), "w", encoding="utf-8") as file:
+                json.dump(ids, file)
+            with open(os.path.join(version_dir, "hashes.json"), "w", encoding="utf-8") as file:
+                json.dump(hashes, file)
+            manifest = {"name": self.name, "collection": self.collection_name, "text_field": self.text_field,
+                        "model_name": embedding_model.model_name, "dtype": self.dtype.name,
+                        "rows": len(ids), "built_at": time.time(), "version": version,
+                        "sidecars": list(sidecars), "embedded_rows": counts["embedded"],
+                        "reused_rows": counts["reused"]}
+            with open(os.path.join(version_dir, "manifest.json"), "w", encoding="utf-8") as file:
+                json.dump(manifest, file)
+        except Exception:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+        self._swap(version)
+        return len(ids)
+
+    def _swap(self, version):
+        """ Point CURRENT to version (atomic rename), map it and remove old versions"""
+        temp_path = os.path.join(self.directory, f"CURRENT.{os.getpid()}.tmp")
+        with open(temp_path, "w") as file:
+            file.write(version)
+        os.replace(temp_path, os.path.join(self.directory, "CURRENT"))
+        self.load()
+        versions = sorted(entry.name for entry in os.scandir(self.directory) if entry.is_dir())
+        for old_version in versions[:-EMBEDDING_MATRIX_KEEP_VERSIONS]:
+            if old_version != version:
+                shutil.rmtree(os.path.join(self.directory, old_version), ignore_errors=True)
+
+    def rebuild(self, db=None, embedding_model=None):
+        """ build() under a file lock: one process rebuilds, the others map the result.
+        Returns the number of rows, None when another process is already rebuilding"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as file:
+            if not lock_file(file, blocking=False):
+                return None
+            if db is None:
+                from db.db_connector import get_database
+                db = get_database()
+            if embedding_model is None:
+                from models.model_loader import model_registry
+                embedding_model = model_registry.get_model("st_embeddings")
+            return self.build(db, embedding_model, **self.build_options())
+
+    def build_options(self):
+        """ Extra build() arguments, e.g. sidecars"""
+        return {}
+
+
+    def request_rebuild(self, delay=EMBEDDING_MATRIX_REBUILD_DELAY):
+        """ Rebuild in a background thread after delay seconds, requests meanwhile are coalesced"""
+        with self._rebuild_lock:
+            self._rebuild_pending = True
+            if self._rebuild_timer is not None and self._rebuild_timer.is_alive():
+                return
+            self._rebuild_timer = threading.Timer(delay, self._background_rebuild, args=(delay,))
+            self._rebuild_timer.daemon = True
+            self._rebuild_timer.start()
+
+    def _background_rebuild(self, delay=EMBEDDING_MATRIX_REBUILD_DELAY):
+        """ Rebuilds until no request came in during the last build. When another process holds the
+        rebuild lock its build may have read the collection before our documents were saved: retried"""
+        while True:
+            with self._rebuild_lock:
+                self._rebuild_pending = False
+            lock_busy = False
+            try:
+                rows = self.rebuild()
+                lock_busy = rows is None
+                if not lock_busy:
+                    logging.info(f"EmbeddingMatrix({self.name}): rebuilt with {rows} rows")
+            except Exception as e:
+                logging.error(f"EmbeddingMatrix({self.name}).rebuild: {e}")
+            with self._rebuild_lock:
+                if not self._rebuild_pending and not lock_busy:
+                    self._rebuild_timer = None
+                    return
+            time.sleep(delay)
+
+
+class SkillEmbeddingMatrix(EmbeddingMatrix):
+    """ Matrix with the taxonomy skill ids of every document as sidecars, for the skill-overlap term of
+    job and candidate ranking: skill_counts.npy (int32 per row) and skill_ids.npy (all ids, row after row)"""
+    def build_options(self):
+        skill_matcher = self._skill_matcher()
+        # Both sidecars of a batch share one skill matching pass
+        last = {"docs": None, "skill_ids": None}
+
+        def skill_id_lists(docs):
+            if last["docs"] is not docs:
+                # Stored skill_ids when the document was parsed with them, otherwise matched in the text
+                last["skill_ids"] = [doc.get("skill_ids") or skill_matcher.find_skill_ids(doc[self.text_field])
+                                     for doc in docs]
+                last["docs"] = docs
+            return last["skill_ids"]
+
+        def skill_counts(docs):
+            return np.asarray([len(skill_ids) for skill_ids in skill_id_lists(docs)], dtype=np.int32)
+
+        def flat_skill_ids(docs):
+            return np.asarray([skill_id for skill_ids in skill_id_lists(docs) for skill_id in skill_ids], dtype=np.int32)
+
+        return {"sidecars": {"skill_counts.npy": skill_counts, "skill_ids.npy": flat_skill_ids},
+                "fields": ["skill_ids"]}
+
+    def _skill_matcher(self):
+        from models.model_loader import model_registry
+        if model_registry.loaded:
+            return model_registry.get_model("nlp_tool")["skill_matcher"]
+        # Command line rebuild: tokenizer-only matching needs the spaCy vocab, not the app
+        from models.spacy_model import load_spacy_model
+        from services.skill_matcher import SkillMatcher
+        return SkillMatcher(load_spacy_model())
+
+    @staticmethod
+    def skill_offsets(snapshot):
+        """ (indptr, skill_ids) CSR of the document skills: skills of row i are skill_ids[indptr[i]:indptr[i + 1]]"""
+        if "indptr" not in snapshot:
+            # Built on first use, kept with the snapshot
+            counts = np.asarray(snapshot["sidecars"]["skill_counts.npy"], dtype=np.int64)
+            indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            snapshot["indptr"] = indptr
+        return snapshot["indptr"], snapshot["sidecars"]["skill_ids.npy"]
+
+    @classmethod
+    def skill_id_lists(cls, snapshot, ids):
+        """ Skill id array of each document id, empty for ids not in the snapshot (saved since the build)"""
+        indptr, skill_ids = cls.skill_offsets(snapshot)
+        if "row_of" not in snapshot:
+            snapshot["row_of"] = {row_id: row for row, row_id in enumerate(snapshot["ids"])}
+        row_of = snapshot["row_of"]
+        empty = np.zeros(0, dtype=np.int32)
+        return [skill_ids[indptr[row_of[doc_id]]:indptr[row_of[doc_id] + 1]] if doc_id in row_of else empty
+                for doc_id in ids]
+
+
+# Create a global instance
+resume_matrix = SkillEmbeddingMatrix("resumes", "resume", "raw_resume")
+job_matrix = SkillEmbeddingMatrix("jobs", JOBSLIST, JOBSLIST_TEXT_FIELD)
+embedding_matrices = [resume_matrix, job_matrix]
+
+def load_embedding_matrices():
+    for matrix in embedding_matrices:
+        try:
+            if not matrix.load():
+                logging.warning(f"EmbeddingMatrix({matrix.name}): not built yet, run: python -m services.embedding_matrix --rebuild")
+        except Exception as e:
+            logging.error(f"EmbeddingMatrix({matrix.name}).load: {e}")
+
+def request_rebuild(collection_name):
+    """ Called after documents of collection_name are ingested"""
+    for matrix in embedding_matrices:
+        if matrix.collection_name == collection_name:
+            matrix.request_rebuild()
+
+
+if __name__ == "__main__":
+    # python -m services.embedding_matrix --rebuild [resumes|jobs]
+    from dotenv import load_dotenv
+    load_dotenv()
+    if "--rebuild" in sys.argv:
+        from models.similarity_model import EmbeddingModel
+        from services.embedding_cache import embedding_cache
+        embedding_model = EmbeddingModel(model_type=os.environ.get("EMBEDDING_MODEL", "sentence-transformers"),
+                                         cache=embedding_cache)
+        names = sys.argv[sys.argv.index("--rebuild") + 1:] or [matrix.name for matrix in embedding_matrices]
+        for matrix in embedding_matrices:
+            if matrix.name in names:
+                rows = matrix.rebuild(embedding_model=embedding_model)
+                print(f"{matrix.name}: {rows} rows -> {matrix.directory}")
+    else:
+        print("usage: python -m services.embedding_matrix --rebuild [resumes|jobs]")
@@ -1,63 +1,64 @@
+import os
 import re
+from collections import Counter
 
 
+# Contact patterns are case sensitive, section headers are not
+CONTACT_PATTERNS = { "name": r"^[A-Z][a-zA-Z\s]+$",
+    "email": r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+",
+    "phone": r"\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}",}
+SECTION_PATTERNS = {
+    "summary": r"^((professional\s*)?Summary|Profile|Objective)[\b\s\:]*?",
+    "education": r"^(Education|Degree|University|College)[\s\:]*?",
+    "experience": r"^(\bWork\s*(experience|history)\b|Experience\b|Employment History\b)[\s\:]*?$",
+    "skills": r"^(Skills|Technical Skills|Core Competencies)[\s\:]*?$",
+}
+CONTACT_FIELDS = tuple(CONTACT_PATTERNS)
+DEGREE_PATTERNS = ["Bachelor", "Master", "PhD", "BS", "MS", "MBA"]
+# nlp.pipe settings for batched entity extraction
+SPACY_BATCH_SIZE = int(os.environ.get("SPACY_BATCH_SIZE", 64))
+SPACY_N_PROCESS = int(os.environ.get("SPACY_N_PROCESS", 1))
+
+# Compiled once. The section headers start with different words, so at most one can match a line
+# and a single named-group alternation classifies every line in one scan.
+_CONTACT_REGEXES = tuple((field, re.compile(pattern)) for field, pattern in CONTACT_PATTERNS.items())
+_SECTION_REGEX = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in SECTION_PATTERNS.items()),
+                            re.IGNORECASE)
+_DEGREE_REGEXES = tuple((pattern, re.compile(r'\b' + re.escape(pattern) + r'\b')) for pattern in DEGREE_PATTERNS)
+
 def extract_sections_from_resume_text(text):
     """Extract sections from the resume text.
     returns dict with following keys :"name", "email", "phone"
     "summary", "skills", "experience", "education"                        
     """
     sections={}
-    # Define regex patterns for different sections
-    contact_patterns ={ "name": r"^[A-Z][a-zA-Z\s]+$",
-        "email": r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+",
-        "phone": r"\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}",}
-    patterns = {
-        "summary": r"^((professional\s*)?Summary|Profile|Objective)[\b\s\:]*?",
-        "education": r"^(Education|Degree|University|College)[\s\:]*?",
-        "experience": r"^(\bWork\s*(experience|history)\b|Experience\b|Employment History\b)[\s\:]*?$",
-        "skills": r"^(Skills|Technical Skills|Core Competencies)[\s\:]*?$",
-    }
-
-    # Split text into lines
-    lines = text.split("\n")
-    curr_section= None
-
-    for line in lines:
+    curr_lines = None
+    # Contact details are only looked up before the first section, until all of them are found
+    contact_missing = len(CONTACT_FIELDS)
+
+    for line in text.split("\n"):
         if line.strip() == "":
             continue # Skip empty lines
 
-        # Check if the line matches any of the section patterns
- 
-        for section_name , pattern in patterns.items():
-            if re.search(pattern, line, re.IGNORECASE):
-                curr_section= section_name
-                # #####print(f"Section found: {curr_section}\n\n\n\n")
-                if section_name not in sections:
-                    sections[curr_section] = []
-
-        if curr_section is None:
-            match_name = re.search(contact_patterns["name"], line)
-            match_email = re.search(contact_patterns["email"], line)
-            match_phone = re.search(contact_patterns["phone"], line)
-            if  "name" not in sections and match_name:
-                sections["name"] = match_name.group(0)
-
-            if "email" not in sections and match_email:
-                sections["email"] = match_email.group(0)
-
-            if "phone" not in sections and match_phone:
-                sections["phone"] = match_phone.group(0)
-            continue
-        else:
-            sections[curr_section].append(line.strip())
-    # #####print(f"Done\n\n\n")
-    # #####print(sections.keys())
+        match = _SECTION_REGEX.match(line)
+        if match is not None:
+            curr_lines = sections.setdefault(match.lastgroup, [])
+
+        if curr_lines is not None:
+            curr_lines.append(line.strip())
+        elif contact_missing:
+            for field, regex in _CONTACT_REGEXES:
+                if field not in sections:
+                    match_contact = regex.search(line)
+                    if match_contact:
+                        sections[field] = match_contact.group(0)
+                        contact_missing -= 1
+
     for section in sections:
-        if section in ["name", "email", "phone"]:
+        if section in CONTACT_FIELDS:
             continue
         sections[section] = "\n".join(sections[section])
 
-    #remove empty sections
     return sections
 
 def get_list_keywords(text):
@@ -85,13 +86,13 @@ def extract_entities(text, tool={'name': None,
     # Load the NER model (e.g., spaCy, Hugging Face Transformers, etc.) 
     try:
         if tool.get('name') == "spacy":            
-            return extract_entities_using_spacy(text, tool.get('tool'))
+            return extract_entities_using_spacy(text, tool.get('tool'), tool.get('skill_matcher'))
         elif tool == "ner_tool":
             return extract_entities_using_ner_tool(text, tool.get('tool'))
         else:
             raise ValueError("Invalid tool specified. Use 'spacy' or 'ner_tool'.")
     except Exception as e:
-        return None, f"Error while extracting entities:{e}"
+        return [], {}, f"Error while extracting entities:{e}"
   
 def extract_entities_using_ner_tool(text, ner_pipeline):
     """Extract sections from the resume text using NER tool""" 
@@ -102,33 +103,68 @@ def extract_entities_using_ner_tool(text, ner_pipeline):
     for entity in entities:
         print(f"{entity['word']} ({entity['entity']})")
 
-def extract_entities_using_spacy(text, nlp_tool):
+def extract_entities_using_spacy(text, nlp_tool, skill_matcher=None):
     try: 
         doc = nlp_tool(text.lower())
-        tokens = [token.lemma_ for token in doc if not token.is_stop and not token.is_punct]
-        entities = {"experience": [],
-                    "education": [], 
-                    "skills": [],
-                    'organizations': [],
-                    'dates': [],
-                    'degrees': [],
-                    'job_titles': []}
-        
-        degree_patterns = ["Bachelor", "Master", "PhD", "BS", "MS", "MBA"]   
-        for pattern in degree_patterns:
-            if re.search(r'\b' + re.escape(pattern) + r'\b', text):
-                entities['degrees'].append(pattern)
-        for ent in doc.ents:
-            if ent.label_ == "ORG":  # Organizations (Universities/Companies)
-                entities["organizations"].append(ent.text)
-            elif ent.label_ in ["DATE", "CARDINAL"]:  # Dates/Numbers (Years worked)
-                entities["dates"].append(ent.text) 
-            elif ent.label_ == "":
-                entities["skills"].append(ent.text) 
-
-        return tokens, entities, None
+        return entities_from_spacy_doc(doc, text, skill_matcher)
+    except Exception as e:
+        return [], {}, f"Error while extracting entites using spaCy: {e}"
+
+def entities_from_spacy_doc(doc, text, skill_matcher=None):
+    """ tokens and entity buckets of a spaCy doc of text.lower(); returns (tokens, entities, error)
+    skill_matcher: services.skill_matcher.SkillMatcher filling "skills" and "skill_ids" from the taxonomy"""
+    tokens = [token.lemma_ for token in doc if not token.is_stop and not token.is_punct]
+    entities = {"experience": [],
+                "education": [], 
+                "skills": [],
+                'organizations': [],
+                'dates': [],
+                'degrees': [],
+                'job_titles': [],
+                'skill_ids': [],
+                'skill_counts': {}}
+    
+    if skill_matcher is not None:
+        # Canonical skill names in order of first mention and their sorted integer ids
+        mentions = skill_matcher.find_mentions(doc)
+        entities["skills"] = skill_matcher.get_names(dict.fromkeys(mentions))
+        entities["skill_ids"] = sorted(set(mentions))
+        entities["skill_counts"] = dict(Counter(mentions))
+    for pattern, regex in _DEGREE_REGEXES:
+        if regex.search(text):
+            entities['degrees'].append(pattern)
+    for ent in doc.ents:
+        if ent.label_ == "ORG":  # Organizations (Universities/Companies)
+            entities["organizations"].append(ent.text)
+        elif ent.label_ in ["DATE", "CARDINAL"]:  # Dates/Numbers (Years worked)
+            entities["dates"].append(ent.text) 
+        elif ent.label_ == "":
+            entities["skills"].append(ent.text) 
+
+    return tokens, entities, None
+
+def iter_entities_using_spacy(texts, nlp_tool, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS,
+                              skill_matcher=None):
+    """ Stream (tokens, entities, error) for an iterable of texts through nlp.pipe, in input order"""
+    docs = nlp_tool.pipe(((text.lower(), text) for text in texts), as_tuples=True,
+                         batch_size=batch_size, n_process=n_process)
+    for doc, text in docs:
+        yield entities_from_spacy_doc(doc, text, skill_matcher)
+
+def extract_entities_batch(texts, tool={'name': None,
+                                        'tool': None},
+                           batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS):
+    """Extract entities of many texts in one batched pass (nlp.pipe for spaCy).
+    returns a list of (tokens, entities, error), one per text in input order"""
+    texts = list(texts)
+    try:
+        if tool.get('name') == "spacy":
+            return list(iter_entities_using_spacy(texts, tool.get('tool'), batch_size, n_process,
+                                                  tool.get('skill_matcher')))
+        return [extract_entities(text, tool) for text in texts]
     except Exception as e:
-        return None, f"Error while extracting entites using spaCy: {e}"
+        # Same shape as a successful extraction: callers unpack (tokens, entities, error)
+        return [([], {}, f"Error while extracting entities:{e}") for _ in texts]
  
 def combine_lists(lists:list):
     combined_list = []   
@@ -1,9 +1,66 @@
+import asyncio
 import tempfile
+import io
 import os 
-import docx
 import re
-from docx import Document
 import fitz # using pymupdf instread of #from PyPDF2 
+from services.docx_extractor import extract_docx_text, iter_docx_paragraphs
+from services.text_cache import content_sha256
+
+# Uploads up to this size are parsed straight from memory, larger ones are spilled to a temp file
+UPLOAD_SPILL_BYTES = int(os.environ.get("UPLOAD_SPILL_BYTES", 10 * 1024 * 1024))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+class UploadBuffer():
+    """ Uploaded file content: held in memory (content) or spilled to disk (file_path) when too large"""
+    def __init__(self, filename, content=None, file_path=None):
+        self.filename = filename or ""
+        self.file_ext = os.path.splitext(self.filename)[1].lower()
+        self.content = content
+        self.file_path = file_path
+        self._sha256 = None
+
+    @property
+    def in_memory(self):
+        return self.content is not None
+
+    @property
+    def sha256(self):
+        """ SHA-256 of the uploaded bytes, the key of the extracted text cache"""
+        if self._sha256 is None:
+            self._sha256 = content_sha256(self.content, self.file_path)
+        return self._sha256
+
+    def cleanup(self):
+        """ Remove the spill file if the upload was written to disk"""
+        if self.file_path is not None and os.path.exists(self.file_path):
+            os.remove(self.file_path)
+        self.file_path = None
+
+async def read_upload(input_file, spill_bytes=UPLOAD_SPILL_BYTES):
+    """ Read an uploaded file into memory. Only uploads larger than spill_bytes are written to a temp file"""
+    temp_path = None
+    try:
+        # One read of at most spill_bytes + 1 tells us if the upload fits in memory
+        content = await input_file.read(spill_bytes + 1)
+        if len(content) <= spill_bytes:
+            return UploadBuffer(input_file.filename, content=content)
+
+        suffix = os.path.splitext(input_file.filename or "")[1].lower()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+            temp_path = temp_file.name
+            temp_file.write(content)
+            del content
+            while True:
+                chunk = await input_file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                temp_file.write(chunk)
+        return UploadBuffer(input_file.filename, file_path=temp_path)
+    except Exception as e:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise RuntimeError(f"Failed to read uploaded file: {str(e)}")
 
 async def create_temp_file(input_file):
     """ Create a temporary file from uploaded file"""
@@ -39,8 +96,7 @@ def get_text_from_file(uploaded_file):
         elif uploaded_file is not None and uploaded_file.name.endswith('.docx'):
             # Read the file
             if uploaded_file is not None:
-                doc = Document(uploaded_file)
-                ret_text = "\n".join([para.text for para in doc.paragraphs])
+                ret_text = "\n".join(iter_docx_paragraphs(uploaded_file))
                 return ret_text, error
 
         elif uploaded_file is not None and uploaded_file.name.endswith('.pdf'):
@@ -71,18 +127,93 @@ def get_cleantext(text:str):
 class FileParser():
     """ Provide a file of pdf, dox, txt and a raw text will be returned
     """ 
-    def __init__(self): 
+    def __init__(self, executor=None, cache=None): 
         self.raw_text = ""
+        # Optional services.parser_executor.ParserExecutor used by aget_raw_text
+        self.executor = executor
+        # Optional services.text_cache.DocumentTextCache: same bytes are only extracted once
+        self.cache = cache
 
     def get_raw_text(self, input_file): 
         try:
-            if type(input_file) == bytes: 
+            if isinstance(input_file, UploadBuffer):
+                cached_text = self.get_cached_text(input_file)
+                if cached_text is not None:
+                    return cached_text
+                text = self.parse_upload(input_file)
+                self.set_cached_text(input_file, text)
+                return text
+            elif type(input_file) == bytes: 
                 self.raw_text = get_text(input_file)
             elif type(input_file) == str: 
                 return self.parse_file(input_file) 
         except Exception as e:
             raise ValueError( f"FileParser.get_raw_text: Exception: {e}")
         return  self.raw_text 
+
+    async def aget_raw_text(self, input_file, timeout=None):
+        """Awaitable get_raw_text: PDF/DOCX extraction runs in the parser worker processes
+        (or a thread when no executor is set) so the event loop is never blocked.
+        The upload hash and the text cache (mongo / disk tiers) run in a thread too"""
+        try:
+            if isinstance(input_file, UploadBuffer):
+                cached_text = await asyncio.to_thread(self.get_cached_text, input_file)
+                if cached_text is not None:
+                    return cached_text
+                content, file_path, file_ext = input_file.content, input_file.file_path, input_file.file_ext
+            elif type(input_file) == str:
+                content, file_path, file_ext = None, input_file, os.path.splitext(input_file)[1].lower()
+            else:
+                return self.get_raw_text(input_file)
+
+            if file_ext == '.txt' and content is not None:
+                text = self.parse_bytes(content, file_ext)
+            elif self.executor is None:
+                text = await asyncio.wait_for(asyncio.to_thread(self.get_raw_text, input_file), timeout=timeout)
+            else:
+                text = await self.executor.extract_text(content=content, file_path=file_path,
+                                                        file_ext=file_ext, timeout=timeout)
+            await asyncio.to_thread(self.set_cached_text, input_file, text)
+            return text
+        except Exception as e:
+            raise ValueError( f"FileParser.aget_raw_text: Exception: {e!r}")
+
+    def get_cached_text(self, upload):
+        """Return the text already extracted from the same uploaded bytes, None on a miss"""
+        if self.cache is None or not isinstance(upload, UploadBuffer):
+            return None
+        return self.cache.get(upload.sha256)
+
+    def set_cached_text(self, upload, text):
+        if self.cache is not None and isinstance(upload, UploadBuffer):
+            self.cache.set(upload.sha256, text)
+
+    def parse_upload(self, upload:UploadBuffer):
+        """Extract text from an uploaded file, from memory when possible"""
+        if upload.in_memory:
+            return self.parse_bytes(upload.content, upload.file_ext)
+        return self.parse_file(upload.file_path)
+
+    def parse_bytes(self, content, file_ext):
+        """Extract text from in-memory file content (PDF, DOCX or TXT) without touching the disk"""
+        text = ""
+        try:
+            file_ext = file_ext.lower()
+            if file_ext == '.pdf':
+                with fitz.open(stream=content, filetype="pdf") as doc:
+                    text = "\n".join([page.get_text() for page in doc])
+            elif file_ext in ['.docx', '.doc']:
+                text = extract_docx_text(io.BytesIO(content))
+            elif file_ext in ['.txt']:
+                # Same newline handling as reading the file in text mode
+                return content.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+            else:
+                raise ValueError(f"FileParser.parse_bytes: Unsupported file format: {file_ext}")
+        except Exception as e:
+            raise ValueError( f"FileParser.parse_bytes: Exception: {e}")
+
+        text = get_cleantext(text)
+        return text
         
     def parse_file(self, file_path):
         """Extract text from resume file (PDF or DOCX)"""
@@ -99,9 +230,8 @@ class FileParser():
                 #     for page_num in range(len(reader.pages)):
                 #         text += reader.pages[page_num].extract_text() + "\n"
             elif file_ext in ['.docx', '.doc']:
-                doc = docx.Document(file_path)
-                for para in doc.paragraphs:
-                    text += para.text + "\n"
+                # Streams word/document.xml, also keeps the text of tables
+                text = extract_docx_text(file_path)
             elif file_ext in ['.txt']:
                 with open(file_path, "r", encoding="utf-8") as file:
                     return file.read() 
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+# Hybrid retrieval: a BM25 keyword index over the parsed skills, titles and requirements and the dense
+# index run in parallel, their rankings are fused by reciprocal rank (RRF). Structured filters are
+# resolved first by an indexed MongoDB query, both retrievers only score the matching documents.
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))
+# Results taken from each retriever before fusion
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 100))
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+# The keyword index is rebuilt in the background when older than this (documents saved by other workers)
+BM25_MAX_AGE_SECONDS = float(os.environ.get("BM25_MAX_AGE_SECONDS", 300))
+# Collection the job description parser writes, with the search fields of job_search_fields.
+# JOBSLIST: the job collection searched by /search-jobs-resume/, its documents need the same fields
+JOB_COLLECTION = "job"
+JOBSLIST = os.environ.get("JOBSLIST", JOB_COLLECTION)
+
+# collection -> parsed fields (dotted paths, through lists) indexed for keyword search
+KEYWORD_FIELDS = {"resume": ["skills", "certifications", "work_history.job_title", "professional_experience.positions"],
+                  JOBSLIST: ["job_title", "required_skills", "must_haves", "qualifications"]}
+# collection -> filter name -> (document field, operator). The fields are written by resume_search_fields /
+# job_search_fields when a document is saved and indexed by create_search_indexes.
+# "$max": the field is at most the value, documents without the field match
+SEARCH_FILTERS = {"resume": {"min_years": ("years_experience", "$gte"),
+                             "max_years": ("years_experience", "$lte"),
+                             "skills": ("skill_names", "$all"),
+                             "certifications": ("certification_names", "$all")},
+                  JOBSLIST: {"years": ("min_years_experience", "$max"),
+                             "skills": ("skill_names", "$all"),
+                             "company_name": ("company_name", "$eq"),
+                             "job_title": ("job_title", "$eq")}}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9+#]+)*")
+YEARS_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*\+?\s*(?:-|to)?\s*(?:\d+\s*)?(?:years?|yrs?)\b", re.IGNORECASE)
+
+
+def tokenize(text):
+    """ Lowercase terms, keeping skill spellings such as c++, c#, node.js"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def flatten_text(value):
+    """ Strings of a parsed value: nested dicts (values only) and lists"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return [str(value)]
+    return [text for item in value for text in flatten_text(item)]
+
+def field_values(doc, path):
+    """ Values of a dotted path, lists along the path are traversed"""
+    values = [doc]
+    for key in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                next_values.extend(item.get(key) for item in value if isinstance(item, dict))
+            elif isinstance(value, dict):
+                next_values.append(value.get(key))
+        values = [value for value in next_values if value is not None]
+    return values
+
+def _names(value):
+    return sorted({text.strip().lower() for text in flatten_text(value) if text.strip()})
+
+def _years(value):
+    """ Number of years of a parsed value ("7", 7, "7+ years"), None when there is none"""
+    for text in flatten_text(value):
+        match = re.search(r"\d+(?:\.\d+)?", text)
+        if match:
+            return float(match.group())
+    return None
+
+def resume_search_fields(data):
+    """ Normalized filter fields of a parsed resume, saved with it"""
+    return {"years_experience": _years((data.get("professional_experience") or {}).get("total_years")),
+            "skill_names": _names(data.get("skills")),
+            "certification_names": _names(data.get("certifications"))}
+
+def job_search_fields(data):
+    """ Normalized filter fields of a parsed job description, saved with it.
+    min_years_experience: largest "<n> years" of the requirements (all of them have to be met)"""
+    requirements = flatten_text([data.get("required_experience"), data.get("must_haves"), data.get("qualifications")])
+    years = [float(match.group(1)) for text in requirements for match in YEARS_PATTERN.finditer(text)]
+    return {"min_years_experience": max(years) if years else None,
+            "skill_names": _names(data.get("required_skills"))}
+
+def build_filter_query(collection_name, filters):
+    """ MongoDB query of the search filters, ValueError on an unknown filter"""
+    allowed = SEARCH_FILTERS.get(collection_name, {})
+    conditions = []
+    for name, value in (filters or {}).items():
+        if name not in allowed:
+            raise ValueError(f"unknown filter '{name}', expected one of: {', '.join(allowed)}")
+        if value is None or value == "" or value == []:
+            continue
+        field, operator = allowed[name]
+        if operator == "$all":
+            conditions.append({field: {"$all": _names(value)}})
+        elif operator == "$max":
+            conditions.append({field: {"$not": {"$gt": float(value)}}})
+        elif operator in ("$gte", "$lte"):
+            conditions.append({field: {operator: float(value)}})
+        else:
+            conditions.append({field: {operator: value}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def prefilter_ids(db, collection_name, filters):
+    """ Ids (str) of the documents matching the filters, None when there are no filters"""
+    query = build_filter_query(collection_name, filters)
+    if query is None:
+        return None
+    return {str(doc["_id"]) for doc in db.get_collection(collection_name).find(query, {"_id": 1})}
+
+def create_search_indexes(db=None):
+    """ Index every filter field, the document identifiers and the content hashes used to find stored
+    documents (idempotent)"""
+    try:
+        if db is None:
+            from db.db_connector import get_database
+            db = get_database()
+        from db.dboperations import MongoDBOperationHandler
+        db_operations = MongoDBOperationHandler(db)
+        db_operations.create_identifier_indexes()
+        db_operations.create_content_hash_indexes()
+        for collection_name, filters in SEARCH_FILTERS.items():
+            collection = db.get_collection(collection_name)
+            for field in sorted({field for field, _ in filters.values()}):
+                collection.create_index([(field, 1)], name=f"search_{field}")
+    except Exception as e:
+        logging.error(f"create_search_indexes: {e}")
+
+def ensure_search_indexes():
+    """ create_search_indexes in a background thread: startup does not wait for MongoDB"""
+    threading.Thread(target=create_search_indexes, name="search-indexes", daemon=True).start()
+
+def reciprocal_rank_fusion(rankings, top_k, k=HYBRID_RRF_K):
+    """ [(id, score)] of the top_k ids of several [(id, score)] rankings, best first.
+    RRF: sum of 1 / (k + rank) over the rankings, scaled to 0..1 (1: first in every ranking)"""
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1)
+    ranked = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+    return [(doc_id, score / best) for doc_id, score in ranked]
+
+
+class BM25Index:
+    """ In-process inverted index of the parsed fields of a collection. Postings hold the BM25 weight
+    of the term in each document, a query is a sum of posting arrays"""
+    def __init__(self, collection_name, fields, k1=BM25_K1, b=BM25_B):
+        self.collection_name = collection_name
+        self.fields = fields
+        self.k1 = k1
+        self.b = b
+        # {ids, rows, postings} replaced as one reference
+        self._snapshot = None
+        self._built_at = 0.0
+        self._build_lock = threading.Lock()
+        self._rebuild_thread = None
+
+    def build(self, db=None):
+        """ Index every document of the collection, returns the number of documents"""
+        if db is None:
+            from db.db_connector import get_database
+            db = get_database()
+        projection = {field.split(".")[0]: 1 for field in self.fields}
+        ids = []
+        term_counts = []
+        for doc in db.get_collection(self.collection_name).find({}, projection):
+            terms = Counter(term for field in self.fields
+                            for text in flatten_text(field_values(doc, field)) for term in tokenize(text))
+            if terms:
+                ids.append(str(doc["_id"]))
+                term_counts.append(terms)
+        doc_lengths = np.asarray([sum(terms.values()) for terms in term_counts], dtype=np.float32)
+        average_length = float(doc_lengths.mean()) if len(ids) else 1.0
+        postings_rows, postings_tf = {}, {}
+        for row, terms in enumerate(term_counts):
+            for term, count in terms.items():
+                postings_rows.setdefault(term, []).append(row)
+                postings_tf.setdefault(term, []).append(count)
+        postings = {}
+        for term, rows in postings_rows.items():
+            rows = np.asarray(rows, dtype=np.int32)
+            tf = np.asarray(postings_tf[term], dtype=np.float32)
+            idf = math.log(1 + (len(ids) - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[rows] / average_length)
+            postings[term] = (rows, (idf * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32))
+        self._snapshot = {"ids": ids, "rows": {doc_id: row for row, doc_id in enumerate(ids)}, "postings": postings}
+        self._built_at = time.monotonic()
+        return len(ids)
+
+    def _get(self):
+        if self._snapshot is None:
+            with self._build_lock:
+                if self._snapshot is None:
+                    self.build()
+        elif time.monotonic() - self._built_at > BM25_MAX_AGE_SECONDS:
+            self.request_rebuild()
+        return self._snapshot
+
+    def search(self, text, k=10, allowed_ids=None):
+        """ [(id, BM25 score)] of the k best documents for the terms of text, only those in allowed_ids when given"""
+        snapshot = self._get()
+        ids = snapshot["ids"]
+        if not ids or k <= 0:
+            return []
+        scores = np.zeros(len(ids), dtype=np.float32)
+        for term in set(tokenize(text)):
+            posting = snapshot["postings"].get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        if allowed_ids is not None:
+            mask = np.zeros(len(ids), dtype=bool)
+            mask[[snapshot["rows"][doc_id] for doc_id in allowed_ids if doc_id in snapshot["rows"]]] = True
+            scores[~mask] = 0
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(ids[row], float(scores[row])) for row in matched]
+
+    def request_rebuild(self):
+        """ Rebuild in a background thread, searches use the current index meanwhile"""
+        with self._build_lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return
+            # Not retried before the next max age when the build fails
+            self._built_at = time.monotonic()
+            self._rebuild_thread = threading.Thread(target=self._background_rebuild, daemon=True)
+            self._rebuild_thread.start()
+
+    def _background_rebuild(self):
+        try:
+            self.build()
+        except Exception as e:
+            logging.error(f"BM25Index({self.collection_name}).build: {e}")
+
+
+async def hybrid_search(dense_search, keyword_index, query_text, top_k, allowed_ids=None):
+    """ Dense and keyword retrieval in parallel, fused by reciprocal rank.
+    dense_search(k, allowed_ids) -> [(id, score)]; returns [(id, fused score 0..1)]"""
+    if allowed_ids is not None and not allowed_ids:
+        return []
+    dense, keyword = await asyncio.gather(asyncio.to_thread(dense_search, HYBRID_CANDIDATES, allowed_ids),
+                                          asyncio.to_thread(keyword_index.search, query_text, HYBRID_CANDIDATES,
+                                                            allowed_ids))
+    return reciprocal_rank_fusion([dense, keyword], top_k)
+
+
+# Create a global instance
+resume_keyword_index = BM25Index("resume", KEYWORD_FIELDS["resume"])
+job_keyword_index = BM25Index(JOBSLIST, KEYWORD_FIELDS[JOBSLIST])
+keyword_indexes = [resume_keyword_index, job_keyword_index]
+
+def request_keyword_rebuild(collection_name):
+    """ Called after documents of collection_name are saved"""
+    for keyword_index in keyword_indexes:
+        if keyword_index.collection_name == collection_name:
+            keyword_index.request_rebuild()
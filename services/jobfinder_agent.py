@@ -1,57 +1,125 @@
 
+import asyncio
+import json
 import os
 
+import numpy as np
+from bson import json_util
+from bson.objectid import ObjectId
+
+from services.embedding_matrix import job_matrix
+from services.hybrid_search import JOBSLIST, hybrid_search, job_keyword_index, prefilter_ids
+
+# Number of jobs returned by /search-jobs-resume/
+JOB_TOP_K = int(os.environ.get("JOB_TOP_K", 10))
+# Weight of the skill overlap in the job score, the rest is the embedding similarity
+JOB_SKILL_WEIGHT = float(os.environ.get("JOB_SKILL_WEIGHT", 0.3))
+# Rows scored per matrix-vector product: float16 rows are cast to float32 one chunk at a time
+JOB_SCORE_CHUNK_ROWS = int(os.environ.get("JOB_SCORE_CHUNK_ROWS", 65536))
+# Job documents are returned without the raw text and the llm json
+JOB_PROJECTION = {"raw_jobdesc": 0, "jobdesc_json": 0}
+
 
 class JobFinderAgent:
-    def __init__(self, llm, db):
+    def __init__(self, llm, db, embedding_model=None, skill_matcher=None, top_k=JOB_TOP_K,
+                 skill_weight=JOB_SKILL_WEIGHT):
         self.llm = llm
         self.err =[]
-        db = db
-
-    def find_jobs(self, resume_data):
-        """ The agent will find the best jobs for the given resume data. """
-        # Use the LLM to find the best jobs for the given resume data
-        matched_jobs = [] 
-        return matched_jobs 
-    
-    def fetch_jobs(self):
-        """Fetch jobs from MongoDB"""
-        # Connect to MongoDB and fetch jobs
-        # This is a placeholder for the actual MongoDB connection and fetching logic
+        self.db = db
+        self.embedding_model = embedding_model
+        self.skill_matcher = skill_matcher
+        self.top_k = top_k
+        self.skill_weight = skill_weight
+
+    async def find_jobs(self, resume_text, top_k=None, filters=None):
+        """ The agent will find the best jobs for the given resume.
+        Hybrid retrieval (services.hybrid_search): the job embedding matrix ranking (services.embedding_matrix.job_matrix)
+        and the keyword index, fused by reciprocal rank, over the jobs matching the filters.
+        Only the top_k winners are read from MongoDB.
+        returns {"jobs": [job documents with match_score], "errors": []}"""
+        matched_jobs = []
+        try:
+            allowed_ids, query, resume_skill_ids = await asyncio.gather(
+                asyncio.to_thread(prefilter_ids, self.db, JOBSLIST, filters),
+                self.embedding_model.aget_embeddings([resume_text]),
+                asyncio.to_thread(self.get_skill_ids, resume_text))
+            ranked = await hybrid_search(lambda k, allowed: self.rank_jobs(query[0], resume_skill_ids, k, allowed),
+                                         job_keyword_index, resume_text, top_k or self.top_k, allowed_ids)
+            matched_jobs = await asyncio.to_thread(self.fetch_jobs, ranked)
+        except Exception as e:
+            self.err.append(f"JobFinderAgent.find_jobs: {e}")
+        return {"jobs": matched_jobs,
+                "errors": self.err}
+
+    def get_skill_ids(self, text):
+        if self.skill_matcher is None:
+            return []
+        return self.skill_matcher.find_skill_ids(text)
+
+    def rank_jobs(self, query, resume_skill_ids, top_k, allowed_ids=None):
+        """ (job id, score) of the top_k jobs (of allowed_ids when given), best first.
+        score = (1 - skill_weight) * cosine similarity + skill_weight * share of the job skills in the resume,
+        computed for every job at once; only the top_k are sorted (argpartition)"""
+        snapshot = job_matrix.get(self.embedding_model.model_name)
+        if snapshot is None:
+            raise ValueError(f"job embedding matrix not built for {self.embedding_model.model_name}, "
+                             "run: python -m services.embedding_matrix --rebuild jobs")
+        matrix, ids = snapshot["matrix"], snapshot["ids"]
+        rows = len(ids)
+        if rows == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, JOB_SCORE_CHUNK_ROWS):
+            chunk = matrix[start:start + JOB_SCORE_CHUNK_ROWS]
+            np.dot(np.asarray(chunk, dtype=np.float32), query, out=scores[start:start + len(chunk)])
+        if self.skill_weight and "skill_counts.npy" in snapshot["sidecars"]:
+            scores *= 1 - self.skill_weight
+            scores += self.skill_weight * self.skill_coverage(snapshot, resume_skill_ids)
+        if allowed_ids is not None:
+            mask = job_matrix.row_mask(snapshot, allowed_ids)
+            scores[~mask] = -np.inf
+            top_k = min(top_k, int(mask.sum()))
+            if top_k == 0:
+                return []
+
+        top_k = min(top_k, rows)
+        top = np.argpartition(-scores, top_k - 1)[:top_k] if top_k < rows else np.arange(rows)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(ids[row], float(scores[row])) for row in top]
+
+    @staticmethod
+    def skill_coverage(snapshot, resume_skill_ids):
+        """ Share of the skills of every job found in the resume, 0 for jobs without skills"""
+        indptr, job_skill_ids = job_matrix.skill_offsets(snapshot)
+        counts = np.diff(indptr)
+        coverage = np.zeros(len(counts), dtype=np.float32)
+        if len(job_skill_ids) == 0 or not resume_skill_ids:
+            return coverage
+        hits = np.isin(job_skill_ids, np.asarray(resume_skill_ids, dtype=job_skill_ids.dtype)).astype(np.float32)
+        # reduceat sums hits[indptr[i]:indptr[i + 1]], rows without skills are left at 0
+        with_skills = counts > 0
+        coverage[with_skills] = np.add.reduceat(hits, indptr[:-1][with_skills]) / counts[with_skills]
+        return coverage
+
+    def fetch_jobs(self, ranked):
+        """ Job documents of the (job id, score) pairs in score order, one query by _id"""
+        if not ranked:
+            return []
+        object_ids = [ObjectId(job_id) if ObjectId.is_valid(job_id) else job_id for job_id, _ in ranked]
+        docs = {str(doc["_id"]): doc
+                for doc in self.db.get_collection(JOBSLIST).find({"_id": {"$in": object_ids}}, JOB_PROJECTION)}
         jobs = []
-        jobs_db_Name = os.environ.get("JOBSLIST", "jobs_list")
-        collection = self.db[jobs_db_Name]
-        jobs  = list(self.collection.find())
-        return jobs
-    
-    def rank_jobs(self, resume_info, jobs):
-        """Rank jobs based on the resume information"""
-        # This is a placeholder for the actual ranking logic
-        ranked_jobs = []
-        for job in jobs:
-            score = self.calculate_job_score(resume_info, job)
-            ranked_jobs.append((job, score))
-        
-        # Sort jobs by score
-        ranked_jobs.sort(key=lambda x: x[1], reverse=True)
-        return ranked_jobs
-    
-    def get_top_matching_jobs(self, resume_file, top_n=5):
-        """Get the top matching jobs for a given resume"""
-        # Extract text from resume
-        resume_text = self.extract_text_from_resume(resume_file)
-        
-        # Preprocess text
-        processed_text = self.preprocess_text(resume_text)
-        
-        # Extract resume information
-        resume_info = self.extract_resume_info(processed_text)
-        
-        # Fetch jobs from MongoDB
-        jobs = self.fetch_jobs()
-        
-        # Rank jobs
-        ranked_jobs = self.rank_jobs(resume_info, jobs)
-        
-        # Get top N jobs
-        top_jobs = ranked_jobs[:top_n]
\ No newline at end of file
+        for job_id, score in ranked:
+            doc = docs.get(job_id)
+            if doc is None:
+                continue
+            doc["match_score"] = round(score * 100, 2)
+            jobs.append(doc)
+        return json.loads(json_util.dumps(jobs))
+
+    def get_top_matching_jobs(self, resume_text, top_n=5):
+        """Get the top matching jobs for a given resume text"""
+        query = self.embedding_model.get_embeddings([resume_text])[0]
+        ranked = self.rank_jobs(query, self.get_skill_ids(resume_text), top_n)
+        return self.fetch_jobs(ranked)
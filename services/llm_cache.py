@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from services.embedding_cache import normalize_text
+
+# In-process LRU entries (0: cache disabled) and the optional persistent tier: none, sqlite or mongo
+LLM_CACHE_ENTRIES = int(os.environ.get("LLM_CACHE_ENTRIES", 256))
+LLM_CACHE_BACKEND = os.environ.get("LLM_CACHE_BACKEND", "none").lower()
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_SQLITE_PATH = os.environ.get("LLM_CACHE_SQLITE_PATH", os.path.join("data", "llm_cache.sqlite3"))
+LLM_CACHE_COLLECTION = "llm_cache"
+
+
+def prompt_fingerprint(prompt):
+    """ Hex SHA-256 of the prompt template and its partial variables (the response model format
+    instructions): editing the prompt or the response model is a new template version"""
+    partials = {name: value if isinstance(value, str) else repr(value)
+                for name, value in (getattr(prompt, "partial_variables", None) or {}).items()}
+    payload = json.dumps({"template": getattr(prompt, "template", str(prompt)), "partials": partials}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def llm_identity(llm):
+    """ (model id, temperature) of a langchain chat model (OpenAI, Bedrock)"""
+    model_kwargs = getattr(llm, "model_kwargs", None) or {}
+    model = getattr(llm, "model_name", None) or getattr(llm, "model_id", None) or getattr(llm, "model", None)
+    temperature = getattr(llm, "temperature", None)
+    if temperature is None:
+        temperature = model_kwargs.get("temperature")
+    return str(model or type(llm).__name__), temperature
+
+def cache_key(prompt, llm, inputs):
+    """ Hex SHA-256 of template version, model id, temperature and the normalized inputs"""
+    model, temperature = llm_identity(llm)
+    inputs = {name: normalize_text(value) if isinstance(value, str) else value for name, value in inputs.items()}
+    payload = json.dumps({"prompt": prompt_fingerprint(prompt), "model": model, "temperature": temperature,
+                          "inputs": inputs}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def response_text(response):
+    """ Text of an llm response (AIMessage or str)"""
+    return response.content if hasattr(response, "content") else str(response)
+
+
+class SqliteLLMStore:
+    """ Table llm_cache(key, response, expires_at) in a local SQLite file, expired rows are
+    skipped on read and purged every few writes"""
+    def __init__(self, path=LLM_CACHE_SQLITE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS llm_cache "
+                                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self.connection.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self.connection.execute("SELECT response FROM llm_cache WHERE key = ? AND expires_at > ?",
+                                          (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, response, ttl):
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO llm_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                                    (key, response, time.time() + ttl))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self.connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            self.connection.commit()
+
+
+class MongoLLMStore:
+    """ Documents {_id: key, response, expires_at} in the llm_cache collection, removed by a TTL index"""
+    def __init__(self, db, collection_name=LLM_CACHE_COLLECTION):
+        self.collection = db.get_collection(collection_name)
+        self.collection.create_index([("expires_at", 1)], name="expires_at_ttl", expireAfterSeconds=0)
+
+    def get(self, key):
+        # The TTL monitor runs every minute: expired documents can still be there
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                                       {"response": 1})
+        return doc.get("response") if doc else None
+
+    def set(self, key, response, ttl):
+        self.collection.update_one({"_id": key},
+                                   {"$set": {"response": response,
+                                             "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+                                   upsert=True)
+
+
+class LLMResponseCache:
+    """ Exact-match cache of llm responses in front of chain.invoke / ainvoke.
+    First tier is an in-process LRU, second tier (optional) is a SqliteLLMStore or MongoLLMStore.
+    Only the response text is cached, the chains parse and save it as for a fresh response.
+    A fresh response is stored once the caller's parser (validate) accepts it, a broken one is retried.
+    """
+    def __init__(self, max_entries=LLM_CACHE_ENTRIES, ttl=LLM_CACHE_TTL_SECONDS, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()   # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._llm_seconds = {}   # prompt fingerprint -> last llm call duration
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._entries[key]
+        if self.store is not None:
+            try:
+                response = self.store.get(key)
+            except Exception as e:
+                logging.error(f"LLMResponseCache.get: {e}")
+                response = None
+            if response is not None:
+                self._remember(key, response)
+                self.store_hits += 1
+                return response
+        self.misses += 1
+        return None
+
+    def set(self, key, response):
+        self._remember(key, response)
+        if self.store is not None:
+            try:
+                self.store.set(key, response, self.ttl)
+            except Exception as e:
+                logging.error(f"LLMResponseCache.set: {e}")
+
+    def _remember(self, key, response):
+        with self._lock:
+            self._entries[key] = (response, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _inputs(self, prompt, inputs):
+        # Single-variable chains are invoked with the bare value
+        return inputs if isinstance(inputs, dict) else {prompt.input_variables[0]: inputs}
+
+    def _store(self, key, response, validate):
+        if validate is not None:
+            try:
+                validate(response)
+            except Exception as e:
+                logging.warning(f"LLMResponseCache: response not cached, rejected by the parser: {e}")
+                return
+        self.set(key, response)
+
+    def invoke(self, chain, prompt, llm, inputs, validate=None):
+        """ Response text of chain.invoke(inputs), from the cache when the same prompt version, model,
+        temperature and inputs were seen within the TTL.
+        validate: parser of the response text, a response it raises on is not cached"""
+        if not self.enabled:
+            return response_text(chain.invoke(inputs))
+        key = cache_key(prompt, llm, self._inputs(prompt, inputs))
+        response = self.get(key)
+        if response is not None:
+            self._count_saved(prompt)
+            return response
+        start = time.perf_counter()
+        response = response_text(chain.invoke(inputs))
+        self._llm_seconds[prompt_fingerprint(prompt)] = time.perf_counter() - start
+        self._store(key, response, validate)
+        return response
+
+    async def ainvoke(self, chain, prompt, llm, inputs, validate=None):
+        """ Async invoke(), the persistent tier is read and written in a thread"""
+        if not self.enabled:
+            return response_text(await chain.ainvoke(inputs))
+        key = cache_key(prompt, llm, self._inputs(prompt, inputs))
+        response = await asyncio.to_thread(self.get, key)
+        if response is not None:
+            self._count_saved(prompt)
+            return response
+        start = time.perf_counter()
+        response = response_text(await chain.ainvoke(inputs))
+        self._llm_seconds[prompt_fingerprint(prompt)] = time.perf_counter() - start
+        await asyncio.to_thread(self._store, key, response, validate)
+        return response
+
+    def _count_saved(self, prompt):
+        # Estimate: the last duration of an llm call with this prompt in this process
+        self.saved_seconds += self._llm_seconds.get(prompt_fingerprint(prompt), 0.0)
+
+    def get_stats(self):
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {"entries": len(self._entries), "memory_hits": self.memory_hits, "store_hits": self.store_hits,
+                "misses": self.misses, "hit_rate": round((self.memory_hits + self.store_hits) / lookups, 4) if lookups else 0.0,
+                "saved_llm_seconds": round(self.saved_seconds, 2),
+                "backend": type(self.store).__name__ if self.store is not None else "memory"}
+
+    def configure_store(self, backend=LLM_CACHE_BACKEND):
+        """ Attach the persistent tier configured by LLM_CACHE_BACKEND (none, sqlite or mongo).
+        Called at app startup so no database connection is opened at import time"""
+        try:
+            if backend == "sqlite":
+                self.store = SqliteLLMStore()
+            elif backend == "mongo":
+                from db.db_connector import get_database
+                self.store = MongoLLMStore(get_database())
+            else:
+                self.store = None
+        except Exception as e:
+            logging.error(f"LLMResponseCache.configure_store: {backend} tier disabled: {e}")
+            self.store = None
+
+# Create a global instance
+llm_cache = LLMResponseCache()
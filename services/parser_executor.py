@@ -0,0 +1,202 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import fitz # using pymupdf instread of #from PyPDF2
+from services.file_parser import FileParser, get_cleantext
+
+# Number of warm worker processes used for PDF/DOCX text extraction
+PARSER_WORKERS = int(os.environ.get("PARSER_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+# Seconds allowed for extracting a single file before the request gives up
+PARSER_TIMEOUT = float(os.environ.get("PARSER_TIMEOUT", 30))
+# Pages beyond this are ignored, a resume or job description is never this long
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 50))
+# PDFs with more pages than this are split in page ranges across the workers
+PDF_FANOUT_PAGES = int(os.environ.get("PDF_FANOUT_PAGES", 8))
+
+
+def _open_pdf(content, file_path):
+    if content is not None:
+        return fitz.open(stream=content, filetype="pdf")
+    return fitz.open(file_path, filetype="pdf")
+
+# Worker side: queue on which each task reports the pid of the worker running it
+_task_pids = None
+
+def _warm_worker(task_pids=None):
+    """ Worker initializer: the parsing libraries are imported with this module, open one empty PDF
+    so the MuPDF context is ready before the first upload"""
+    global _task_pids
+    _task_pids = task_pids
+    fitz.open().close()
+
+def _run_task(task_id, func, *args):
+    """ Runs func in a worker after reporting which worker process started the task"""
+    if _task_pids is not None:
+        _task_pids.put((task_id, os.getpid()))
+    return func(*args)
+
+def _ping():
+    return os.getpid()
+
+def _pdf_page_count(content, file_path):
+    with _open_pdf(content, file_path) as doc:
+        return doc.page_count
+
+def _extract_pdf_pages(content, file_path, start, stop):
+    """ Extract and clean the text of pages [start, stop) of a PDF"""
+    with _open_pdf(content, file_path) as doc:
+        text = "\n".join([doc[page_num].get_text() for page_num in range(start, stop)])
+    return get_cleantext(text)
+
+def _extract_document(content, file_path, file_ext):
+    """ Extract text from a DOCX/TXT (or small PDF) in a worker process"""
+    parser = FileParser()
+    if content is not None:
+        return parser.parse_bytes(content, file_ext)
+    return parser.parse_file(file_path)
+
+
+class _WorkerPool:
+    """ ProcessPoolExecutor that knows its in-flight futures and the worker pid of every started task,
+    so a stuck task can be killed without touching the other workers"""
+    def __init__(self, max_workers):
+        # forkserver avoids forking a process that already runs threads (uvicorn, torch)
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        self.task_pids = context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                            initializer=_warm_worker, initargs=(self.task_pids,))
+        self.futures = {}
+        self.pids = {}
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """ Returns (task_id, concurrent future)"""
+        # Drained on every submit so the pid pipe never fills up
+        self._started_pids()
+        task_id = next(self._task_ids)
+        future = self.executor.submit(_run_task, task_id, func, *args)
+        self.futures[task_id] = future
+        future.add_done_callback(lambda _: self.futures.pop(task_id, None))
+        return task_id, future
+
+    def _started_pids(self):
+        """ {task_id: worker pid} of the started tasks still in flight"""
+        with self._lock:
+            while not self.task_pids.empty():
+                task_id, pid = self.task_pids.get()
+                self.pids[task_id] = pid
+            self.pids = {task_id: pid for task_id, pid in self.pids.items() if task_id in self.futures}
+            return dict(self.pids)
+
+    def retire(self, stuck_task_ids, grace):
+        """ Called once the pool no longer takes new work: the other tasks get up to grace seconds
+        to finish, then the workers still running a stuck task are killed and the pool shut down"""
+        stuck_futures = {task_id: self.futures.get(task_id) for task_id in stuck_task_ids}
+        for future in stuck_futures.values():
+            # Still queued: never reaches a worker
+            if future is not None:
+                future.cancel()
+        others = [future for task_id, future in list(self.futures.items()) if task_id not in stuck_futures]
+        wait(others, timeout=grace)
+        pids = self._started_pids()
+        for task_id, future in stuck_futures.items():
+            if future is None or future.done() or task_id not in pids:
+                continue
+            try:
+                os.kill(pids[task_id], signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ParserExecutor:
+    """ Bounded pool of warm worker processes that extract text from uploaded documents,
+    keeping PyMuPDF/DOCX parsing work off the event loop.
+    """
+    def __init__(self, max_workers=PARSER_WORKERS, timeout=PARSER_TIMEOUT,
+                 max_pages=PDF_MAX_PAGES, fanout_pages=PDF_FANOUT_PAGES):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.fanout_pages = fanout_pages
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = _WorkerPool(self.max_workers)
+        return self._pool
+
+    def start(self):
+        """ Start all workers up front so the first uploads do not pay the process start-up"""
+        pool = self._get_pool()
+        futures = [pool.submit(_ping)[1] for _ in range(self.max_workers)]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _retire_tasks(self, tasks):
+        """ After a timeout: new work goes to a fresh pool, while the pools of the stuck tasks let their
+        other extractions finish before the stuck workers are killed (a stuck extraction would
+        otherwise hold a worker forever)"""
+        stuck = {}
+        for pool, task_id, future in tasks:
+            if not future.done():
+                stuck.setdefault(pool, []).append(task_id)
+        for pool, task_ids in stuck.items():
+            if self._pool is pool:
+                self._pool = None
+            threading.Thread(target=pool.retire, args=(task_ids, self.timeout), daemon=True).start()
+
+    async def _run(self, tasks, func, *args):
+        """ Runs func in a worker, recording (pool, task_id, future) in tasks"""
+        pool = self._get_pool()
+        task_id, future = pool.submit(func, *args)
+        tasks.append((pool, task_id, future))
+        return await asyncio.wrap_future(future)
+
+    async def _extract_pdf(self, tasks, content, file_path):
+        page_count = min(await self._run(tasks, _pdf_page_count, content, file_path), self.max_pages)
+        if page_count <= self.fanout_pages:
+            return await self._run(tasks, _extract_pdf_pages, content, file_path, 0, page_count)
+        # Per-page fan-out: one page range per worker
+        step = -(-page_count // self.max_workers)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        chunks = await asyncio.gather(*[self._run(tasks, _extract_pdf_pages, content, file_path, start, stop)
+                                        for start, stop in ranges])
+        return "\n".join(chunks)
+
+    async def extract_text(self, content=None, file_path=None, file_ext=None, timeout=None):
+        """ Extract the clean text of a document, either from in-memory content or from file_path.
+        Raises TimeoutError when the extraction takes longer than timeout seconds"""
+        if file_ext is None and file_path is not None:
+            file_ext = os.path.splitext(file_path)[1]
+        file_ext = (file_ext or "").lower()
+        timeout = self.timeout if timeout is None else timeout
+        tasks = []
+        if file_ext == ".pdf":
+            work = self._extract_pdf(tasks, content, file_path)
+        else:
+            work = self._run(tasks, _extract_document, content, file_path, file_ext)
+        try:
+            return await asyncio.wait_for(work, timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"ParserExecutor.extract_text: {file_ext} extraction timed out after {timeout}s")
+            self._retire_tasks(tasks)
+            raise TimeoutError(f"Text extraction timed out after {timeout} seconds")
+
+# Create a global instance
+parser_executor = ParserExecutor()
@@ -0,0 +1,51 @@
+from spacy.matcher import PhraseMatcher
+from spacy.util import filter_spans
+
+from utils.skills_taxonomy import SKILLS_TAXONOMY
+
+
+class SkillMatcher:
+    """ Finds skills of the curated taxonomy (utils/skills_taxonomy.py) in a document.
+    All canonical names and aliases are compiled once into a spaCy PhraseMatcher, so a document
+    is scanned in a single linear pass and every mention maps to a canonical integer skill id.
+    """
+    def __init__(self, nlp, taxonomy=SKILLS_TAXONOMY):
+        self.nlp = nlp
+        self.skill_names = {skill_id: canonical for skill_id, (canonical, aliases) in taxonomy.items()}
+        # LOWER: matching is case-insensitive, patterns only need the tokenizer
+        self.matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        for skill_id, (canonical, aliases) in taxonomy.items():
+            phrases = dict.fromkeys([canonical, *aliases])
+            self.matcher.add(str(skill_id), [nlp.make_doc(phrase) for phrase in phrases])
+
+    def _as_doc(self, doc_or_text):
+        if isinstance(doc_or_text, str):
+            # Tokenizer only, the matcher does not need the rest of the pipeline
+            return self.nlp.make_doc(doc_or_text)
+        return doc_or_text
+
+    def find_mentions(self, doc_or_text):
+        """ Skill ids of every mention in document order. Overlapping matches keep the longest,
+        e.g. "react native" wins over "react" """
+        spans = filter_spans(self.matcher(self._as_doc(doc_or_text), as_spans=True))
+        return [int(span.label_) for span in spans]
+
+    def find_skill_ids(self, doc_or_text):
+        """ Sorted unique skill ids found in the document"""
+        return sorted(set(self.find_mentions(doc_or_text)))
+
+    def get_names(self, skill_ids):
+        """ Canonical skill names of skill ids"""
+        return [self.skill_names[skill_id] for skill_id in skill_ids if skill_id in self.skill_names]
+
+    def get_ids(self, names):
+        """ Skill ids of skill names/aliases (e.g. a parsed skills list), unknown names are skipped"""
+        skill_ids = set()
+        for name in names:
+            skill_ids.update(self.find_mentions(str(name)))
+        return sorted(skill_ids)
+
+    @property
+    def vocabulary_size(self):
+        """ Largest skill id + 1, the width of a skill id bitset"""
+        return max(self.skill_names) + 1
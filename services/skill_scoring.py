@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def to_id_array(skill_ids):
+    """ Sorted unique int32 array of skill ids"""
+    return np.unique(np.asarray(list(skill_ids), dtype=np.int32))
+
+def to_bitset(skill_ids, vocabulary_size):
+    """ Boolean row of width vocabulary_size with the skill ids set"""
+    bitset = np.zeros(vocabulary_size, dtype=bool)
+    ids = to_id_array(skill_ids)
+    bitset[ids[ids < vocabulary_size]] = True
+    return bitset
+
+def to_bitset_matrix(skill_id_lists, vocabulary_size):
+    """ One bitset row per document, e.g. the skills of many candidates"""
+    matrix = np.zeros((len(skill_id_lists), vocabulary_size), dtype=bool)
+    for row, skill_ids in enumerate(skill_id_lists):
+        ids = to_id_array(skill_ids)
+        matrix[row, ids[ids < vocabulary_size]] = True
+    return matrix
+
+def _weight_vector(required_ids, vocabulary_size, weights=None):
+    """ Weight of each required skill (1 when weights is None), zero elsewhere"""
+    vector = np.zeros(vocabulary_size, dtype=np.float32)
+    ids = to_id_array(required_ids)
+    ids = ids[ids < vocabulary_size]
+    if weights is None:
+        vector[ids] = 1.0
+    else:
+        vector[ids] = [float(weights.get(int(skill_id), 1.0)) for skill_id in ids]
+    return vector
+
+
+def score_skill_sets(candidate_ids, required_ids, weights=None):
+    """ Skill overlap of one candidate against one job.
+    returns dict with overlap (count), jaccard (0-1) and coverage: weighted share of the
+    required skills the candidate has (0-1), weights: {skill_id: importance}"""
+    candidate = to_id_array(candidate_ids)
+    required = to_id_array(required_ids)
+    matched = np.intersect1d(candidate, required, assume_unique=True)
+    union = len(candidate) + len(required) - len(matched)
+    if weights is None:
+        total_weight = float(len(required))
+        matched_weight = float(len(matched))
+    else:
+        total_weight = float(sum(weights.get(int(skill_id), 1.0) for skill_id in required))
+        matched_weight = float(sum(weights.get(int(skill_id), 1.0) for skill_id in matched))
+    return {"overlap": int(len(matched)),
+            "jaccard": len(matched) / union if union else 0.0,
+            "coverage": matched_weight / total_weight if total_weight else 0.0,
+            "matched_ids": matched.tolist()}
+
+def score_candidates(candidate_matrix, required_ids, weights=None):
+    """ Score one job against many candidates in one vectorized call.
+    candidate_matrix: bitset matrix (n_candidates x vocabulary_size) from to_bitset_matrix
+    returns dict of arrays (one value per candidate): overlap, jaccard, coverage"""
+    candidate_matrix = np.asarray(candidate_matrix, dtype=bool)
+    vocabulary_size = candidate_matrix.shape[1]
+    weight_vector = _weight_vector(required_ids, vocabulary_size, weights)
+    required = to_bitset(required_ids, vocabulary_size)
+    candidate_values = candidate_matrix.astype(np.float32)
+
+    overlap = candidate_values @ required.astype(np.float32)
+    union = candidate_values.sum(axis=1) + required.sum() - overlap
+    total_weight = weight_vector.sum()
+    coverage = candidate_values @ weight_vector / total_weight if total_weight else np.zeros(len(overlap), dtype=np.float32)
+    jaccard = np.divide(overlap, union, out=np.zeros_like(overlap), where=union > 0)
+    return {"overlap": overlap.astype(np.int32),
+            "jaccard": jaccard,
+            "coverage": coverage}
@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# In-process LRU entries and the optional persistent tier: none, disk or mongo
+TEXT_CACHE_ENTRIES = int(os.environ.get("TEXT_CACHE_ENTRIES", 512))
+TEXT_CACHE_BACKEND = os.environ.get("TEXT_CACHE_BACKEND", "none").lower()
+TEXT_CACHE_DIR = os.environ.get("TEXT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "jobmatch_text_cache"))
+TEXT_CACHE_MAX_BYTES = int(os.environ.get("TEXT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+TEXT_CACHE_COLLECTION = "document_text"
+
+
+def content_sha256(content=None, file_path=None):
+    """ Hex SHA-256 of the uploaded bytes, or of a file streamed from disk"""
+    digest = hashlib.sha256()
+    if content is not None:
+        digest.update(content)
+    else:
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskTextStore:
+    """ One utf-8 file per document under directory. Least recently read files are evicted
+    once the directory grows above max_bytes"""
+    def __init__(self, directory=TEXT_CACHE_DIR, max_bytes=TEXT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as file:
+                text = file.read()
+            os.utime(path) # mtime is the last access used for eviction
+            return text
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, text):
+        path = self._path(key)
+        data = text.encode("utf-8")
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        existing = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(temp_path, path)
+        with self._lock:
+            self._size += len(data) - existing
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted((entry for entry in os.scandir(self.directory)
+                          if entry.is_file() and entry.name.endswith(".txt")),
+                         key=lambda entry: entry.stat().st_mtime)
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self._size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+
+class MongoTextStore:
+    """ Documents {_id: sha256, text, size, last_access} in the document_text collection.
+    Least recently read documents are removed once the collection grows above max_bytes"""
+    def __init__(self, db, collection_name=TEXT_CACHE_COLLECTION, max_bytes=TEXT_CACHE_MAX_BYTES):
+        self.collection = db.get_collection(collection_name)
+        self.max_bytes = max_bytes
+        self.collection.create_index([("last_access", 1)], name="last_access_index")
+        self._writes = 0
+
+    def get(self, key):
+        doc = self.collection.find_one_and_update({"_id": key}, {"$set": {"last_access": time.time()}},
+                                                  projection={"text": 1})
+        return doc.get("text") if doc else None
+
+    def set(self, key, text):
+        self.collection.update_one({"_id": key},
+                                   {"$set": {"text": text, "size": len(text.encode("utf-8")),
+                                             "last_access": time.time()}},
+                                   upsert=True)
+        # Checking the collection size costs an aggregation, do it every few writes
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._evict()
+
+    def _evict(self):
+        totals = list(self.collection.aggregate([{"$group": {"_id": None, "size": {"$sum": "$size"}}}]))
+        total = totals[0]["size"] if totals else 0
+        target = int(self.max_bytes * 0.9)
+        if total <= self.max_bytes:
+            return
+        for doc in self.collection.find({}, {"size": 1}).sort("last_access", 1):
+            if total <= target:
+                break
+            self.collection.delete_one({"_id": doc["_id"]})
+            total -= doc.get("size", 0)
+
+
+class DocumentTextCache:
+    """ Content-addressed cache of extracted document text: sha256(uploaded bytes) -> clean text.
+    First tier is an in-process LRU, second tier (optional) is a DiskTextStore or MongoTextStore.
+    """
+    def __init__(self, max_entries=TEXT_CACHE_ENTRIES, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+        if self.store is not None:
+            try:
+                text = self.store.get(key)
+            except Exception as e:
+                logging.error(f"DocumentTextCache.get: {e}")
+                text = None
+            if text is not None:
+                self._remember(key, text)
+                self.hits += 1
+                return text
+        self.misses += 1
+        return None
+
+    def set(self, key, text):
+        if text is None:
+            return
+        self._remember(key, text)
+        if self.store is not None:
+            try:
+                self.store.set(key, text)
+            except Exception as e:
+                logging.error(f"DocumentTextCache.set: {e}")
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def configure_store(self, backend=TEXT_CACHE_BACKEND):
+        """ Attach the persistent tier configured by TEXT_CACHE_BACKEND (none, disk or mongo).
+        Called at app startup so no database connection is opened at import time"""
+        try:
+            if backend == "disk":
+                self.store = DiskTextStore()
+            elif backend == "mongo":
+                from db.db_connector import get_database
+                self.store = MongoTextStore(get_database())
+            else:
+                self.store = None
+        except Exception as e:
+            logging.error(f"DocumentTextCache.configure_store: {backend} tier disabled: {e}")
+            self.store = None
+
+# Create a global instance
+document_text_cache = DocumentTextCache()
@@ -0,0 +1,453 @@
+import base64
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils.file_lock import lock_file
+
+# faiss is imported on first use: `import main` does not load it
+# Resume vector index, one directory per embedding model (vectors of another model are never mixed in):
+#   <model>/meta.json                       snapshot: generation, log offset, labels, tombstones
+#   <model>/index-<generation>-<n>.faiss    HNSW graph of the snapshot
+#   <model>/upserts-<generation>.jsonl      upserts after the snapshot, replayed by every worker
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", os.path.join("data", "vector_index"))
+VECTOR_INDEX_HNSW_M = int(os.environ.get("VECTOR_INDEX_HNSW_M", 32))
+VECTOR_INDEX_EF_CONSTRUCTION = int(os.environ.get("VECTOR_INDEX_EF_CONSTRUCTION", 200))
+VECTOR_INDEX_EF_SEARCH = int(os.environ.get("VECTOR_INDEX_EF_SEARCH", 64))
+# A new snapshot is written after this many upserts
+VECTOR_INDEX_SNAPSHOT_EVERY = int(os.environ.get("VECTOR_INDEX_SNAPSHOT_EVERY", 1000))
+# Replaced vectors stay in the graph as tombstones, rebuild when they are this share of the index
+VECTOR_INDEX_COMPACT_RATIO = float(os.environ.get("VECTOR_INDEX_COMPACT_RATIO", 0.2))
+VECTOR_INDEX_BATCH_SIZE = int(os.environ.get("VECTOR_INDEX_BATCH_SIZE", 256))
+# How often a worker checks for a snapshot written by another process
+VECTOR_INDEX_RELOAD_SECONDS = float(os.environ.get("VECTOR_INDEX_RELOAD_SECONDS", 5))
+
+
+class ReadWriteLock:
+    """ Shared lock of the searches (FAISS searches release the GIL and run in parallel), exclusive lock of
+    the index updates. The exclusive lock is reentrant; a thread holding it may also take the shared one"""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer is not None and self._writer != threading.get_ident():
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        thread_id = threading.get_ident()
+        with self._condition:
+            if self._writer != thread_id:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+                self._writer = thread_id
+            self._depth += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._writer = None
+                    self._condition.notify_all()
+
+
+class ResumeVectorIndex:
+    """ FAISS HNSW (inner product over normalized embeddings = cosine) over the resume collection.
+    Upserts are appended to a log shared by the worker processes and applied in memory by each one:
+    a re-saved resume gets a new label and its previous vector becomes a tombstone filtered from results.
+    Snapshots are written in a background thread every VECTOR_INDEX_SNAPSHOT_EVERY upserts, the index is
+    rebuilt from Mongo when the embedding model changes or tombstones pile up.
+    Lock order: the file lock (shared by the workers) before the in-process lock.
+    """
+    def __init__(self, directory=VECTOR_INDEX_DIR, collection_name="resume", text_field="raw_resume"):
+        self.directory = directory
+        self.collection_name = collection_name
+        self.text_field = text_field
+        self.model_name = None
+        self._lock = ReadWriteLock()
+        self._reset(None, None)
+        self._last_check = 0.0
+        self._rebuild_thread = None
+        self._snapshot_thread = None
+
+    def _reset(self, dim, generation):
+        self.dim = dim
+        self.index = None
+        self.generation = generation
+        self.labels = {}        # label -> resume id (str)
+        self.id_to_label = {}   # resume id -> current label
+        self.tombstones = set()
+        self.next_label = 0
+        self.log_offset = 0
+        # Upserts applied since the snapshot was written
+        self.pending_upserts = 0
+
+    def _model_dir(self, model_name=None):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name or self.model_name)
+        return os.path.join(self.directory, safe_name)
+
+    def _log_path(self):
+        return os.path.join(self._model_dir(), f"upserts-{self.generation}.jsonl")
+
+    def _file_lock(self):
+        os.makedirs(self._model_dir(), exist_ok=True)
+        return open(os.path.join(self._model_dir(), ".lock"), "w")
+
+    def _new_index(self, dim):
+        import faiss
+        hnsw = faiss.IndexHNSWFlat(dim, VECTOR_INDEX_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = VECTOR_INDEX_EF_CONSTRUCTION
+        hnsw.hnsw.efSearch = VECTOR_INDEX_EF_SEARCH
+        return faiss.IndexIDMap(hnsw)
+
+    def _disk_generation(self):
+        """ Generation of the snapshot on disk (meta.json), None when there is none"""
+        try:
+            with open(os.path.join(self._model_dir(), "meta.json"), "r", encoding="utf-8") as file:
+                return json.load(file)["generation"]
+        except FileNotFoundError:
+            return None
+
+    def _log_grown(self):
+        if self.generation is None:
+            return False
+        try:
+            return os.path.getsize(self._log_path()) > self.log_offset
+        except OSError:
+            return False
+
+    @property
+    def size(self):
+        """ Live resumes in the index"""
+        return len(self.id_to_label)
+
+    def open(self, model_name):
+        """ Load the snapshot of model_name and replay the upsert log, returns False when
+        no index was built for this embedding model yet"""
+        with self._lock.write():
+            self.model_name = model_name
+            self._last_check = time.monotonic()
+            meta_path = os.path.join(self._model_dir(), "meta.json")
+            if not os.path.exists(meta_path):
+                self._reset(None, None)
+                return False
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            # Same generation: replaying the log from our offset is enough
+            if meta["generation"] != self.generation:
+                import faiss
+                self._reset(meta["dim"], meta["generation"])
+                if meta["index_file"] is not None:
+                    self.index = faiss.read_index(os.path.join(self._model_dir(), meta["index_file"]))
+                self.labels = {int(label): resume_id for label, resume_id in meta["labels"].items()}
+                self.tombstones = set(meta["tombstones"])
+                self.id_to_label = {resume_id: label for label, resume_id in self.labels.items()
+                                    if label not in self.tombstones}
+                self.next_label = meta["next_label"]
+                self.log_offset = meta["log_offset"]
+            self._replay()
+            return True
+
+    def _refresh(self):
+        """ Apply upserts of other workers, reload after a rebuild by another process.
+        The exclusive lock is only taken when there is something to apply"""
+        reload_due = time.monotonic() - self._last_check >= VECTOR_INDEX_RELOAD_SECONDS
+        if not reload_due and not self._log_grown():
+            return
+        with self._lock.write():
+            self._replay()
+            if reload_due:
+                try:
+                    self.open(self.model_name)
+                except Exception as e:
+                    logging.error(f"ResumeVectorIndex.open: {e}")
+
+    def _apply(self, resume_id, vector):
+        if self.index is None:
+            self.dim = len(vector)
+            self.index = self._new_index(self.dim)
+        old_label = self.id_to_label.get(resume_id)
+        if old_label is not None:
+            self.tombstones.add(old_label)
+        label = self.next_label
+        self.next_label += 1
+        self.index.add_with_ids(np.asarray([vector], dtype=np.float32), np.asarray([label], dtype=np.int64))
+        self.labels[label] = resume_id
+        self.id_to_label[resume_id] = label
+
+    def _replay(self):
+        if self.generation is None:
+            return
+        end = self._read_log(self._log_path(), self.log_offset, self._apply)
+        self.log_offset = end
+
+    def _read_log(self, log_path, offset, apply):
+        """ apply(resume id, vector) to the log entries from offset, returns the offset after them"""
+        try:
+            with open(log_path, "rb") as file:
+                file.seek(offset)
+                data = file.read()
+        except FileNotFoundError:
+            return offset
+        # Only complete lines: a concurrent append may be half written
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            apply(entry["id"], np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32))
+            self.pending_upserts += 1
+        return offset + end
+
+    def upsert(self, resume_id, vector):
+        """ Insert or replace the vector of a resume, visible to every worker"""
+        entry = json.dumps({"id": str(resume_id),
+                            "vector": base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")})
+        with self._file_lock() as file:
+            lock_file(file)
+            with self._lock.write():
+                # A rebuild by another worker or thread removed the log of our generation: reopen first
+                if self.generation is None or self._disk_generation() != self.generation:
+                    if not self.open(self.model_name):
+                        # First resume for this embedding model: start an empty generation
+                        self.generation = f"{int(time.time() * 1000)}-{os.getpid()}"
+                        self._save_snapshot()
+                with open(self._log_path(), "ab") as file:
+                    file.write(entry.encode("utf-8") + b"\n")
+                self._replay()
+                snapshot_due = self.pending_upserts >= VECTOR_INDEX_SNAPSHOT_EVERY
+        if snapshot_due:
+            self.request_snapshot()
+        if len(self.tombstones) > VECTOR_INDEX_COMPACT_RATIO * max(len(self.labels), 1):
+            self.request_rebuild()
+
+    def search(self, vector, k=10, allowed_ids=None):
+        """ [(resume id, cosine score)] of the k nearest resumes, only those in allowed_ids when given"""
+        import faiss
+        self._refresh()
+        with self._lock.read():
+            if self.index is None or self.index.ntotal == 0:
+                return []
+            if allowed_ids is not None:
+                return self._search_allowed(vector, k, allowed_ids)
+            # Over-fetch so tombstoned neighbours can be dropped, efSearch is set per search
+            fetch = min(self.index.ntotal, k + min(len(self.tombstones), 10 * k))
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = max(VECTOR_INDEX_EF_SEARCH, fetch)
+            scores, labels = self.index.search(np.asarray([vector], dtype=np.float32), fetch, params=params)
+            results = []
+            for score, label in zip(scores[0], labels[0]):
+                label = int(label)
+                if label < 0 or label in self.tombstones:
+                    continue
+                results.append((self.labels[label], float(score)))
+                if len(results) == k:
+                    break
+        return results
+
+    def _search_allowed(self, vector, k, allowed_ids):
+        """ search() restricted by an id selector on the current labels (tombstones are never selected)"""
+        import faiss
+        labels = [self.id_to_label[resume_id] for resume_id in allowed_ids if resume_id in self.id_to_label]
+        if not labels:
+            return []
+        k = min(k, len(labels))
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = max(VECTOR_INDEX_EF_SEARCH, k)
+        selector = faiss.IDSelectorBatch(np.asarray(labels, dtype=np.int64))
+        params.sel = selector
+        scores, found = self.index.search(np.asarray([vector], dtype=np.float32), k, params=params)
+        return [(self.labels[int(label)], float(score)) for score, label in zip(scores[0], found[0]) if label >= 0]
+
+    def request_snapshot(self):
+        """ Write a snapshot in a background thread, the upsert that asked for it does not wait"""
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        self._snapshot_thread = threading.Thread(target=self._background_snapshot, name="vector-index-snapshot",
+                                                 daemon=True)
+        self._snapshot_thread.start()
+
+    def _background_snapshot(self):
+        try:
+            with self._file_lock() as file:
+                lock_file(file)
+                with self._lock.write():
+                    if self._disk_generation() != self.generation:
+                        # Rebuilt meanwhile: the new generation has its own snapshot
+                        self.open(self.model_name)
+                        return
+                    self._replay()
+                # Serialized under the shared lock: searches go on, upserts wait for the file lock
+                with self._lock.read():
+                    state = self._snapshot_state()
+                self._write_snapshot(state)
+        except Exception as e:
+            logging.error(f"ResumeVectorIndex.snapshot: {e}")
+
+    def _save_snapshot(self):
+        """ Write index + meta atomically (meta.json is renamed last, it names the index file)"""
+        self._write_snapshot(self._snapshot_state())
+
+    def _snapshot_state(self):
+        """ (serialized index or None, meta) of the current state"""
+        import faiss
+        index_bytes = faiss.serialize_index(self.index) if self.index is not None else None
+        meta = {"model_name": self.model_name, "dim": self.dim, "generation": self.generation,
+                "index_file": f"index-{self.generation}-{self.log_offset}.faiss" if index_bytes is not None else None,
+                "log_offset": self.log_offset, "next_label": self.next_label,
+                "labels": {str(label): resume_id for label, resume_id in self.labels.items()},
+                "tombstones": sorted(self.tombstones)}
+        return index_bytes, meta
+
+    def _write_snapshot(self, state):
+        index_bytes, meta = state
+        model_dir = self._model_dir()
+        os.makedirs(model_dir, exist_ok=True)
+        index_file = meta["index_file"]
+        if index_file is not None:
+            with open(os.path.join(model_dir, index_file + ".tmp"), "wb") as file:
+                file.write(index_bytes.tobytes())
+            os.replace(os.path.join(model_dir, index_file + ".tmp"), os.path.join(model_dir, index_file))
+        temp_path = os.path.join(model_dir, f"meta.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(temp_path, os.path.join(model_dir, "meta.json"))
+        self.pending_upserts = 0
+        self._remove_old_files(index_file)
+
+    def _remove_old_files(self, keep_index_file):
+        model_dir = self._model_dir()
+        for entry in os.scandir(model_dir):
+            if entry.name.startswith("index-") and entry.name.endswith(".faiss") and entry.name != keep_index_file:
+                os.remove(entry.path)
+            elif entry.name.startswith("upserts-") and entry.name != f"upserts-{self.generation}.jsonl":
+                os.remove(entry.path)
+
+    def rebuild(self, db=None, embedding_model=None):
+        """ Build a new generation from the resume collection (embeddings come from the embedding
+        cache when known) and swap it in. Returns the number of resumes"""
+        if db is None:
+            from db.db_connector import get_database
+            db = get_database()
+        if embedding_model is None:
+            from models.model_loader import model_registry
+            embedding_model = model_registry.get_model("st_embeddings")
+        builder = ResumeVectorIndex(self.directory, self.collection_name, self.text_field)
+        builder.model_name = embedding_model.model_name
+        builder.generation = f"{int(time.time() * 1000)}-{os.getpid()}"
+        # Upserts logged while building are carried over to the new generation
+        previous_log, previous_offset = self._current_log(builder)
+        batch = []
+        for doc in db.get_collection(self.collection_name).find({self.text_field: {"$type": "string"}},
+                                                                 {self.text_field: 1}):
+            batch.append(doc)
+            if len(batch) >= VECTOR_INDEX_BATCH_SIZE:
+                builder._embed_batch(batch, embedding_model)
+                batch = []
+        if batch:
+            builder._embed_batch(batch, embedding_model)
+        with builder._file_lock() as file:
+            lock_file(file)
+            if previous_log is not None:
+                builder._read_log(previous_log, previous_offset, builder._apply)
+            builder._save_snapshot()
+        self.open(embedding_model.model_name)
+        return builder.size
+
+    def _current_log(self, builder):
+        """ (path, size) of the upsert log of the snapshot on disk, (None, 0) when there is none"""
+        meta_path = os.path.join(builder._model_dir(), "meta.json")
+        if not os.path.exists(meta_path):
+            return None, 0
+        with open(meta_path, "r", encoding="utf-8") as file:
+            generation = json.load(file)["generation"]
+        log_path = os.path.join(builder._model_dir(), f"upserts-{generation}.jsonl")
+        return log_path, os.path.getsize(log_path) if os.path.exists(log_path) else 0
+
+    def _embed_batch(self, docs, embedding_model):
+        embeddings = embedding_model.get_embeddings([doc[self.text_field] for doc in docs])
+        self._add_batch([str(doc["_id"]) for doc in docs], embeddings)
+
+    def _add_batch(self, resume_ids, vectors):
+        if self.index is None:
+            self.dim = vectors.shape[1]
+            self.index = self._new_index(self.dim)
+        labels = np.arange(self.next_label, self.next_label + len(resume_ids), dtype=np.int64)
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), labels)
+        for label, resume_id in zip(labels.tolist(), resume_ids):
+            old_label = self.id_to_label.get(resume_id)
+            if old_label is not None:
+                self.tombstones.add(old_label)
+            self.labels[label] = resume_id
+            self.id_to_label[resume_id] = label
+        self.next_label += len(resume_ids)
+
+    def request_rebuild(self):
+        """ Rebuild in a background thread (compaction, or an index for a new embedding model)"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        self._rebuild_thread = threading.Thread(target=self._background_rebuild, name="vector-index-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+    def _background_rebuild(self):
+        try:
+            count = self.rebuild()
+            logging.info(f"ResumeVectorIndex: rebuilt with {count} resumes")
+        except Exception as e:
+            logging.error(f"ResumeVectorIndex.rebuild: {e}")
+
+# Create a global instance
+resume_vector_index = ResumeVectorIndex()
+
+def get_vector_index(embedding_model):
+    """ The resume index of embedding_model, opened on first use. When no index was built for this
+    model yet it is rebuilt from MongoDB in the background (searches return nothing meanwhile)"""
+    if resume_vector_index.model_name != embedding_model.model_name:
+        if not resume_vector_index.open(embedding_model.model_name):
+            logging.warning(f"ResumeVectorIndex: no index for {embedding_model.model_name}, rebuilding from MongoDB")
+            resume_vector_index.request_rebuild()
+    return resume_vector_index
+
+def upsert_resume(resume_id, resume_text):
+    """ Called when a resume is saved: embeds it (cached when it was just scored) and upserts it"""
+    try:
+        from models.model_loader import model_registry
+        embedding_model = model_registry.get_model("st_embeddings")
+        vector = embedding_model.get_embeddings([resume_text])[0]
+        get_vector_index(embedding_model).upsert(str(resume_id), vector)
+    except Exception as e:
+        logging.error(f"ResumeVectorIndex.upsert_resume: {e}")
+
+
+if __name__ == "__main__":
+    # python -m services.vector_index --rebuild
+    from dotenv import load_dotenv
+    load_dotenv()
+    if "--rebuild" in sys.argv:
+        from models.similarity_model import EmbeddingModel
+        from services.embedding_cache import embedding_cache
+        embedding_model = EmbeddingModel(model_type=os.environ.get("EMBEDDING_MODEL", "sentence-transformers"),
+                                         cache=embedding_cache)
+        count = resume_vector_index.rebuild(embedding_model=embedding_model)
+        print(f"Resume vector index ({embedding_model.model_name}): {count} resumes")
+    else:
+        print("usage: python -m services.vector_index --rebuild")
@@ -106,4 +106,36 @@ return result in Json format with following keys:
 "weaknesses": <List any weakness of the candidate resume which matching against the job description>
 "strengths" : <List the skill strengths of the candidate resume against the job requiremnts in the job description>
 your final response must be in JSON format
-"""
\ No newline at end of file
+"""
+
+COMBINED_ANALYZER_PROMPT = """You are a professional resume parser, job description parser and resume analyzer.
+Resume:{resume_data}
+Job Description:{job_description}
+Complete the following three tasks and return one JSON object with the keys "resume", "job_description" and "analysis":
+"resume": extract relavant information from the resume with following keys:
+    "name", "email", "phone", "summary",
+    "skills": <skills mentioned in the resume under two sub category "technical_skills" and "soft_skills">,
+    "work_history": <List of work expereince, each with "company_name", "job_title", "start_date", "end_date", "location">,
+    "education": <List of Degrees, educational qualifications>,
+    "certifications": <List of certifications with name, date of certification and issuing authority>,
+    "professional_experience": <"total_years": approximate_years, "domains": [...], "positions": [...], "achievements": [...]>
+    Make sure to extract all the relevant experinece and do not summarize or remove any information from original resume content.
+"job_description": extract relavant information from the job description with following keys:
+    "external_job_id", "job_title", "company_name",
+    "required_experience": <List required years of experience and any specific experience requirements mentioned explicitly>,
+    "key_responsibilities", "qualifications",
+    "required_skills": <"technical_skills": [...], "soft_skills": [...]>,
+    "must_haves", "nice_to_haves"
+    Do not fabricate any information outside of the job description context provided.
+"analysis": analyze and evaluate how well the resume matches the job description with following keys:
+    "email" and "name" of the candidate, "external_job_id",
+    "overall_score": <An overall match score from 0-100>,
+    "feedback": <detailed feedback on why the candidate is a good match or not a great match if the score is below 50%>,
+    "suggestions": <detailed suggestions on how the candidate can improve their resume specific to the job description>,
+    "recomendation": <detailed recomentdation to improve resume based on the job decription requirements and missings skills>,
+    "gaps": <List of any requirements or skills from the job description that are missing from the resume>,
+    "weaknesses": <List any weakness of the candidate resume which matching against the job description>,
+    "strengths": <List the skill strengths of the candidate resume against the job requiremnts>
+{format_instructions}
+your final response must be in JSON format
+"""
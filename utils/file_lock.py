@@ -0,0 +1,31 @@
+# Exclusive inter-process lock on an open file: fcntl.flock on POSIX, msvcrt.locking on Windows.
+# The platform modules are imported on use, so importing a module that locks files works everywhere.
+# The lock is released when the file is closed.
+import time
+
+
+def lock_file(file, blocking=True):
+    """ Exclusive lock on file (opened for writing). Returns False, without waiting, when blocking is False
+    and another process holds the lock"""
+    try:
+        import fcntl
+    except ImportError:
+        return _lock_file_msvcrt(file, blocking)
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+def _lock_file_msvcrt(file, blocking):
+    import msvcrt
+    file.seek(0)
+    while True:
+        try:
+            # Lock the first byte, LK_LOCK would give up after 10 seconds
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
@@ -0,0 +1,269 @@
+# Curated skills taxonomy used by services.skill_matcher.SkillMatcher
+# skill_id: (canonical name, [aliases])
+# Skill ids are stored with parsed documents: never renumber or reuse an id, only append new ones.
+# Aliases are matched case-insensitively on whole tokens. Avoid names and aliases that are common English
+# words (use the qualified form, e.g. "spring boot" not "spring"), and never alias two distinct skills: an
+# alias counts as the skill itself in the overlap scores.
+
+SKILLS_TAXONOMY = {
+    # Programming languages
+    1: ("python", ["python3", "python 3", "cpython"]),
+    2: ("java", ["java 8", "java 11", "java 17", "core java"]),
+    3: ("javascript", ["js", "ecmascript", "es6"]),
+    4: ("typescript", []),
+    5: ("c++", ["cpp", "c plus plus"]),
+    6: ("c#", ["c sharp", "csharp"]),
+    7: ("golang", ["go lang", "go language"]),
+    8: ("rust", ["rustlang"]),
+    9: ("ruby", []),
+    10: ("php", []),
+    11: ("scala", []),
+    12: ("kotlin", []),
+    13: ("swift programming", ["swift language", "swiftui"]),
+    14: ("objective-c", ["objective c", "objc"]),
+    15: ("r programming", ["r language"]),
+    16: ("matlab", []),
+    17: ("perl", []),
+    18: ("bash", ["shell scripting", "shell script", "bash scripting"]),
+    19: ("powershell", []),
+    20: ("sql", ["ansi sql"]),
+    21: ("html", ["html5"]),
+    22: ("css", ["css3"]),
+    23: ("dart", []),
+    24: ("haskell", []),
+    25: ("elixir", []),
+    26: ("clojure", []),
+    27: ("fortran", []),
+    28: ("cobol", []),
+    29: ("vba", ["visual basic"]),
+    30: ("solidity", []),
+    31: ("sass", ["scss"]),
+    32: ("less css", []),
+    33: ("rstudio", []),
+    34: ("tidyverse", []),
+    35: ("zsh", []),
+    36: ("t-sql", ["tsql"]),
+    37: ("pl/sql", ["plsql"]),
+    38: ("vb.net", []),
+    # Web frameworks and libraries
+    40: ("react", ["react.js", "reactjs"]),
+    41: ("react native", []),
+    42: ("angular", ["angularjs", "angular.js"]),
+    43: ("vue", ["vue.js", "vuejs"]),
+    44: ("svelte", []),
+    45: ("next.js", ["nextjs"]),
+    46: ("node.js", ["nodejs", "node js"]),
+    47: ("express.js", ["expressjs"]),
+    48: ("django", []),
+    49: ("flask", []),
+    50: ("fastapi", ["fast api"]),
+    51: ("spring boot", ["springboot", "spring framework", "spring mvc"]),
+    52: ("ruby on rails", ["ror"]),
+    53: (".net", ["dotnet", ".net core"]),
+    54: ("laravel", []),
+    55: ("jquery", []),
+    56: ("redux", []),
+    57: ("graphql", []),
+    58: ("rest api", ["restful", "rest apis", "restful api", "restful apis", "rest services"]),
+    59: ("grpc", []),
+    60: ("websockets", ["websocket"]),
+    61: ("streamlit", []),
+    62: ("tailwind", ["tailwind css", "tailwindcss"]),
+    63: ("bootstrap", []),
+    64: ("hibernate", []),
+    65: ("django rest framework", ["drf"]),
+    66: ("asp.net", ["asp.net core"]),
+    # Data stores
+    80: ("postgresql", ["postgres", "psql"]),
+    81: ("mysql", []),
+    82: ("sql server", ["mssql", "microsoft sql server"]),
+    83: ("oracle database", ["oracle db", "oracle 12c", "oracle 19c"]),
+    84: ("sqlite", []),
+    85: ("mongodb", ["mongo", "mongo db"]),
+    86: ("redis", []),
+    87: ("cassandra", []),
+    88: ("dynamodb", ["dynamo db"]),
+    89: ("elasticsearch", ["elastic search"]),
+    90: ("neo4j", []),
+    91: ("snowflake", []),
+    92: ("bigquery", ["big query"]),
+    93: ("redshift", []),
+    94: ("couchbase", []),
+    95: ("firebase", []),
+    96: ("vector databases", ["vector database"]),
+    97: ("pinecone", []),
+    98: ("weaviate", []),
+    99: ("milvus", []),
+    100: ("chromadb", []),
+    101: ("pgvector", []),
+    102: ("mariadb", []),
+    103: ("opensearch", []),
+    104: ("elk stack", []),
+    105: ("firestore", []),
+    # Cloud and infrastructure
+    110: ("aws", ["amazon web services"]),
+    111: ("azure", ["microsoft azure"]),
+    112: ("gcp", ["google cloud", "google cloud platform"]),
+    113: ("docker", []),
+    114: ("kubernetes", ["k8s"]),
+    115: ("terraform", []),
+    116: ("ansible", []),
+    117: ("cloudformation", ["aws cloudformation"]),
+    118: ("helm charts", ["helm chart", "kubernetes helm"]),
+    119: ("jenkins", []),
+    120: ("github actions", []),
+    121: ("gitlab ci", ["gitlab ci/cd"]),
+    122: ("ci/cd", ["cicd", "continuous integration", "continuous delivery", "continuous deployment"]),
+    123: ("git", []),
+    124: ("linux", []),
+    125: ("nginx", []),
+    126: ("serverless", []),
+    127: ("aws ec2", ["ec2"]),
+    128: ("aws s3", ["s3", "amazon s3"]),
+    129: ("aws sagemaker", ["sagemaker"]),
+    130: ("aws bedrock", ["amazon bedrock"]),
+    131: ("prometheus", []),
+    132: ("grafana", []),
+    133: ("datadog", []),
+    134: ("splunk", []),
+    135: ("microservices", ["microservice", "micro services"]),
+    136: ("devops", ["dev ops"]),
+    137: ("site reliability engineering", ["sre"]),
+    138: ("networking", ["tcp/ip", "dns", "load balancing"]),
+    139: ("cybersecurity", ["information security", "infosec", "security engineering"]),
+    140: ("oauth", ["oauth2", "oauth 2.0", "openid connect", "oidc"]),
+    141: ("github", []),
+    142: ("gitlab", []),
+    143: ("bitbucket", []),
+    144: ("eks", ["amazon eks"]),
+    145: ("aks", ["azure kubernetes service"]),
+    146: ("gke", ["google kubernetes engine"]),
+    147: ("openshift", []),
+    148: ("unix", []),
+    149: ("ubuntu", []),
+    150: ("red hat enterprise linux", ["rhel", "red hat linux"]),
+    151: ("centos", []),
+    152: ("containerization", []),
+    153: ("aws lambda", ["lambda functions"]),
+    154: ("azure functions", []),
+    155: ("google cloud functions", ["cloud functions"]),
+    156: ("service oriented architecture", ["soa"]),
+    157: ("saml", []),
+    158: ("single sign-on", ["sso"]),
+    # Data engineering
+    160: ("apache spark", ["spark", "pyspark", "spark sql"]),
+    161: ("hadoop", ["hdfs", "mapreduce"]),
+    162: ("kafka", ["apache kafka", "kafka streams"]),
+    163: ("airflow", ["apache airflow"]),
+    164: ("dbt", []),
+    165: ("etl", ["elt", "data pipelines", "data pipeline"]),
+    166: ("databricks", []),
+    167: ("rabbitmq", []),
+    168: ("data warehousing", ["data warehouse"]),
+    169: ("flink", ["apache flink"]),
+    170: ("pandas", []),
+    171: ("numpy", []),
+    172: ("scipy", []),
+    173: ("tableau", []),
+    174: ("power bi", ["powerbi"]),
+    175: ("looker", []),
+    176: ("microsoft excel", ["ms excel", "spreadsheets"]),
+    177: ("apache hive", ["hiveql"]),
+    178: ("data modeling", ["dimensional modeling"]),
+    # Machine learning and AI
+    200: ("machine learning", ["ml"]),
+    201: ("deep learning", []),
+    202: ("natural language processing", ["nlp"]),
+    203: ("computer vision", ["image processing"]),
+    204: ("tensorflow", []),
+    205: ("pytorch", ["torch"]),
+    206: ("scikit-learn", ["sklearn", "scikit learn"]),
+    207: ("xgboost", []),
+    208: ("hugging face", ["huggingface", "transformers library"]),
+    209: ("large language models", ["llm", "llms", "gpt", "generative ai", "genai"]),
+    210: ("langchain", []),
+    211: ("prompt engineering", []),
+    212: ("retrieval augmented generation", ["rag"]),
+    213: ("spacy", []),
+    214: ("nltk", []),
+    215: ("opencv", []),
+    216: ("mlops", []),
+    217: ("statistics", ["statistical analysis", "statistical modeling", "hypothesis testing"]),
+    218: ("data analysis", ["data analytics"]),
+    219: ("data science", []),
+    220: ("reinforcement learning", []),
+    221: ("recommender systems", ["recommendation systems", "recommendation engine"]),
+    222: ("time series", ["time series analysis"]),
+    223: ("faiss", []),
+    224: ("embeddings", []),
+    225: ("lightgbm", []),
+    226: ("catboost", []),
+    227: ("keras", []),
+    228: ("langgraph", []),
+    229: ("llamaindex", ["llama index"]),
+    230: ("mlflow", []),
+    231: ("kubeflow", []),
+    232: ("sentence transformers", ["sentence-transformers"]),
+    233: ("word2vec", []),
+    234: ("forecasting", []),
+    # Mobile and testing
+    240: ("android", ["android sdk"]),
+    241: ("ios", ["ios development"]),
+    242: ("flutter", []),
+    243: ("unit testing", ["unit tests"]),
+    244: ("test automation", ["automated testing"]),
+    245: ("performance testing", ["load testing"]),
+    246: ("pytest", []),
+    247: ("junit", []),
+    248: ("jest", []),
+    249: ("mocha", []),
+    250: ("test driven development", ["tdd"]),
+    251: ("selenium", []),
+    252: ("cypress", []),
+    253: ("playwright", []),
+    254: ("jmeter", []),
+    255: ("locust", []),
+    256: ("unittest", ["python unittest"]),
+    # Practices and methodologies
+    260: ("agile", ["agile methodology"]),
+    261: ("object oriented programming", ["oop", "object-oriented programming", "object oriented design"]),
+    262: ("system design", ["software architecture"]),
+    263: ("data structures", ["data structures and algorithms"]),
+    264: ("api design", ["api development"]),
+    265: ("jira", []),
+    266: ("product management", ["product roadmap", "roadmapping"]),
+    267: ("project management", []),
+    268: ("business analysis", ["requirements gathering", "business requirements"]),
+    269: ("ux design", ["ui/ux", "user experience", "wireframing"]),
+    270: ("six sigma", ["lean six sigma"]),
+    271: ("itil", []),
+    272: ("gdpr", []),
+    273: ("distributed systems", []),
+    274: ("scalability", []),
+    275: ("algorithms", []),
+    276: ("confluence", []),
+    277: ("figma", []),
+    278: ("hipaa", []),
+    279: ("sox compliance", ["sarbanes-oxley"]),
+    280: ("pci dss", ["pci compliance"]),
+    281: ("scrum", []),
+    282: ("kanban", []),
+    283: ("pmp", []),
+    284: ("program management", []),
+    # Soft skills
+    300: ("communication", ["communication skills", "verbal communication", "written communication"]),
+    301: ("leadership", ["team leadership", "people management", "team lead"]),
+    302: ("teamwork", ["team player", "cross-functional collaboration"]),
+    303: ("problem solving", ["problem-solving"]),
+    304: ("critical thinking", ["analytical thinking", "analytical skills"]),
+    305: ("mentoring", []),
+    306: ("time management", []),
+    307: ("stakeholder management", ["stakeholder communication", "client facing"]),
+    308: ("presentation skills", ["public speaking"]),
+    309: ("adaptability", []),
+    310: ("attention to detail", ["detail oriented", "detail-oriented"]),
+    311: ("negotiation", []),
+    312: ("customer service", ["customer support"]),
+    313: ("decision making", ["decision-making"]),
+    314: ("creativity", []),
+}